@@ -0,0 +1,116 @@
+from collections import deque
+from mediawikiapi import MediaWikiAPI
+import threading
+
+
+POOL_LOW_WATERMARK = 20  # Refill once fewer titles than this are left
+POOL_HIGH_WATERMARK = 100  # Stop refilling at this many titles
+POOL_BATCH_SIZE = 20  # Candidates fetched per MediaWiki request
+MIN_ARTICLE_LENGTH = 3000  # Bytes of wikitext, shorter pages are treated as stubs
+
+
+class RandomArticlePool:
+    """Reservoir of random article titles refilled in bulk by a background worker
+
+    Candidates are fetched with their page length and disambiguation flag
+    in a single query, so stubs and disambiguation pages are dropped
+    without any per-title requests.
+    """
+    def __init__(self, low_watermark=POOL_LOW_WATERMARK, high_watermark=POOL_HIGH_WATERMARK,
+                 batch_size=POOL_BATCH_SIZE, min_length=MIN_ARTICLE_LENGTH, mediawiki_factory=MediaWikiAPI):
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.min_length = min_length
+        self.mediawiki = mediawiki_factory()
+
+        self.titles = deque()
+        self.refill_event = threading.Event()
+        self.running = False
+        self.thread = None
+
+
+    def start(self):
+        """Start the refill worker, the pool fills up straight away"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._refill_loop, daemon=True)
+        self.thread.start()
+        self.refill_event.set()
+
+
+    def stop(self):
+        self.running = False
+        self.refill_event.set()
+
+
+    def get(self):
+        """Take a random title, only calling MediaWiki directly if the pool ran dry"""
+        try:
+            title = self.titles.popleft()
+        except IndexError:
+            title = None
+
+        if len(self.titles) < self.low_watermark:
+            self.refill_event.set()
+
+        if title is None:
+            print("Random article pool is empty, fetching directly")
+            title = self.mediawiki.random(1)
+        return title
+
+
+    def __len__(self):
+        return len(self.titles)
+
+
+    def fetch_batch(self):
+        """Fetch a batch of random titles that are neither stubs nor disambiguation pages"""
+        try:
+            response = self.mediawiki.session.request({
+                "generator": "random",
+                "grnnamespace": 0,
+                "grnlimit": self.batch_size,
+                "prop": "info|pageprops",
+                "ppprop": "disambiguation"
+            }, self.mediawiki.config)
+            pages = response["query"]["pages"].values()
+        except Exception as e:
+            print(f"Bulk random query failed, using plain random titles: {e}")
+            titles = self.mediawiki.random(min(self.batch_size, 10))
+            if isinstance(titles, str):
+                titles = [titles]
+            return [title for title in titles if not self.looks_unsuitable(title)]
+
+        return [
+            page["title"]
+            for page in pages
+            if "disambiguation" not in page.get("pageprops", {})
+            and page.get("length", 0) >= self.min_length
+            and not self.looks_unsuitable(page["title"])
+        ]
+
+
+    @staticmethod
+    def looks_unsuitable(title):
+        return title.endswith("(disambiguation)") or title.startswith("List of")
+
+
+    def _refill_loop(self):
+        while self.running:
+            self.refill_event.wait()
+            self.refill_event.clear()
+
+            failures = 0
+            while self.running and len(self.titles) < self.high_watermark and failures < 3:
+                try:
+                    batch = self.fetch_batch()
+                except Exception as e:
+                    print(f"Failed to refill random article pool: {e}")
+                    batch = []
+                if batch:
+                    self.titles.extend(batch)
+                    failures = 0
+                else:
+                    failures += 1
@@ -0,0 +1,96 @@
+import os
+import threading
+
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+EFFECTS = {  # Short sounds, decoded once and kept in memory
+    "button": "button.mp3"
+}
+MUSIC = "music.mp3"  # Streamed from disk while it plays
+
+
+class AssetManager:
+    """Owns the client's sounds
+
+    pygame is imported and the mixer started on a background thread, then
+    effects are decoded there once and played from memory afterwards.
+    Music goes through mixer.music, which streams the file instead of
+    decoding all of it up front.
+    """
+    def __init__(self, directory=ASSET_DIR):
+        self.directory = directory
+        self.mixer = None  # pygame.mixer once it is initialised
+        self.sounds = {}  # {name: mixer.Sound}, None for effects that failed to load
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+
+    def start(self):
+        """Load the mixer and decode every effect in the background"""
+        threading.Thread(target=self.preload, daemon=True).start()
+
+
+    def preload(self):
+        if self.load_mixer() is None:
+            return
+        for name in EFFECTS:
+            self.sound(name)
+
+
+    def load_mixer(self):
+        """pygame.mixer, initialised on first use, or None if there is no sound"""
+        with self.lock:
+            if not self.ready.is_set():
+                try:
+                    from pygame import mixer
+                    if not mixer.get_init():
+                        mixer.init()
+                    self.mixer = mixer
+                except Exception as e:
+                    print(f"Sound unavailable: {e}")
+                self.ready.set()
+            return self.mixer
+
+
+    def sound(self, name):
+        """Decoded effect, loaded now if the background pass hasn't reached it"""
+        with self.lock:
+            if name in self.sounds:
+                return self.sounds[name]
+            try:
+                sound = self.mixer.Sound(os.path.join(self.directory, EFFECTS[name]))
+            except Exception as e:
+                print(f"Failed to load sound {name}: {e}")
+                sound = None
+            self.sounds[name] = sound
+            return sound
+
+
+    def play(self, name="button"):
+        # A click before the mixer is up stays silent rather than waiting for it
+        if self.mixer is None:
+            return
+        sound = self.sound(name)
+        if sound is not None:
+            sound.play()
+
+
+    def play_music(self, loops=-1):
+        """Start the background music, raises if it cannot be played"""
+        mixer = self.load_mixer()
+        if mixer is None:
+            raise RuntimeError("Sound is unavailable")
+        mixer.music.load(os.path.join(self.directory, MUSIC))
+        mixer.music.play(loops)
+
+
+    def stop_music(self):
+        if self.mixer is None:
+            return
+        try:
+            self.mixer.music.stop()
+        except:
+            pass
+
+
+assets = AssetManager()
@@ -0,0 +1,453 @@
+"""Drive a server with headless bot clients and report how it holds up
+
+Usage: python bench_load.py [--lobbies 100] [--players 4] [--rounds 3] [--mode asyncio] [--shards N]
+
+Starts a server with MediaWiki stubbed out (or targets a running one with
+--host and --port), connects lobbies * players bots that play through the
+real protocol, then prints message latency percentiles, how late games
+start after their countdown, and the server's CPU and memory use.
+
+Each bot joins (the first of every lobby with "NG"), submits an
+article_request, waits for game_start, sends a few navigate messages and
+a game_result after a random delay, waits for game_results and sends
+play_again, once per round.
+"""
+import argparse
+import asyncio
+from collections import defaultdict, deque
+import os
+import random
+import runpy
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from message_codec import MessageDecoder, encode_message
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STUB_ARTICLES = [
+    "Physics", "Dog", "Banana", "Jazz", "Volcano", "Chess", "Moon", "Bicycle",
+    "Coffee", "Napoleon", "Tokyo", "Oxygen", "Piano", "Shark", "Democracy", "Bread"
+]
+SERVER_START_TIMEOUT = 30.0
+REPORTED_PERCENTILES = (50, 90, 99)
+WAITED_TYPES = {"join_success", "redirect", "lobby_snapshot", "game_start", "game_results"}
+
+
+def countdown_duration(players):
+    """Same formula as WikiRaceServer.countdown_duration"""
+    return int(10 + (10 / (players if players > 0 else 1)))
+
+
+def raise_fd_limit():
+    """Allow as many open sockets as the hard limit does"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except Exception as e:
+        print(f"Could not raise the open file limit: {e}")
+
+
+def stub_mediawiki_module(latency):
+    """A mediawikiapi module that answers from STUB_ARTICLES after latency seconds"""
+    class StubSession:
+        def request(self, params, config):
+            time.sleep(latency)
+            return {"query": {"pages": {
+                str(i): {"title": f"{random.choice(STUB_ARTICLES)} {random.randint(1, 10 ** 6)}", "length": 10000}
+                for i in range(int(params.get("grnlimit", 10)))
+            }}}
+
+
+    class MediaWikiAPI:
+        def __init__(self):
+            self.session = StubSession()
+            self.config = None
+
+
+        def search(self, query, results=10, suggestion=False):
+            time.sleep(latency)
+            return [query.strip().title()] if query.strip() else []
+
+
+        def random(self, pages=1):
+            time.sleep(latency)
+            titles = [random.choice(STUB_ARTICLES) for _ in range(pages)]
+            return titles[0] if pages == 1 else titles
+
+
+        def summary(self, title, **kwargs):
+            time.sleep(latency)
+            return f"{title} is an article used for load testing."
+
+
+    module = types.ModuleType("mediawikiapi")
+    module.MediaWikiAPI = MediaWikiAPI
+    return module
+
+
+def run_stub_server(server_args):
+    """Run server_network.py in this process with MediaWiki stubbed out"""
+    latency = float(os.environ.get("BENCH_LOAD_STUB_LATENCY", "0"))
+    sys.modules["mediawikiapi"] = stub_mediawiki_module(latency)
+    raise_fd_limit()
+    sys.path.insert(0, HERE)
+    sys.argv = [os.path.join(HERE, "server_network.py"), *server_args]
+    runpy.run_path(sys.argv[0], run_name="__main__")
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class ProcessMonitor:
+    """Samples CPU time and RSS of a process and its children from /proc (Linux)"""
+    def __init__(self, pid):
+        self.pid = pid
+        self.tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.samples = []  # [(wall time, cpu seconds, rss bytes)]
+
+
+    def process_tree(self):
+        pids = [self.pid]
+        try:
+            children = {}
+            for entry in os.listdir("/proc"):
+                if entry.isdigit():
+                    try:
+                        with open(f"/proc/{entry}/stat") as f:
+                            parent = int(f.read().rsplit(")", 1)[1].split()[1])
+                        children.setdefault(parent, []).append(int(entry))
+                    except (OSError, IndexError, ValueError):
+                        pass
+            for pid in pids:
+                pids.extend(children.get(pid, []))
+        except OSError:
+            pass
+        return pids
+
+
+    def sample(self):
+        cpu = 0.0
+        rss = 0
+        for pid in self.process_tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / self.tick
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+            except (OSError, IndexError, ValueError):
+                continue
+        self.samples.append((time.monotonic(), cpu, rss))
+
+
+    async def run(self, interval=1.0):
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+
+    def summary(self):
+        """(average CPU %, peak CPU %, peak RSS bytes), None without two samples"""
+        if len(self.samples) < 2:
+            return None
+        first, last = self.samples[0], self.samples[-1]
+        average = 100 * (last[1] - first[1]) / max(last[0] - first[0], 1e-9)
+        peak = max(
+            100 * (b[1] - a[1]) / max(b[0] - a[0], 1e-9)
+            for a, b in zip(self.samples, self.samples[1:])
+        )
+        return average, peak, max(rss for _, _, rss in self.samples)
+
+
+class LobbyGroup:
+    """Bots sharing one lobby"""
+    def __init__(self, players):
+        self.players = players
+        self.code = asyncio.get_running_loop().create_future()
+        self.results_sent = {}  # {round: time the last game_result went out}
+
+
+class Bot:
+    """One headless client playing through the real protocol"""
+    def __init__(self, test, name, group, leader):
+        self.test = test
+        self.name = name
+        self.group = group
+        self.leader = leader
+        self.reader = None
+        self.writer = None
+        self.decoder = MessageDecoder()
+        self.inbox = defaultdict(deque)  # {message type: messages not yet waited for}
+        self.player_id = None
+        self.players = {}  # {player id: ready}
+        self.ready_sent_at = None
+        self.all_ready_at = None
+
+
+    async def run(self):
+        host, port = self.test.host, self.test.port
+        lobby_code = "NG" if self.leader else await self.group.code
+        for _ in range(3):
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+            sent = time.monotonic()
+            self.send({"type": "join", "name": self.name, "lobby_code": lobby_code})
+            message = await self.wait_for("join_success", "redirect")
+            if message["type"] == "join_success":
+                break
+            # The lobby is on another node
+            self.writer.close()
+            host, port = message["host"], message["port"]
+        else:
+            raise RuntimeError("Too many redirects")
+        self.test.record("join", time.monotonic() - sent)
+
+        if self.leader:
+            self.group.code.set_result(message["lobby_code"])
+        snapshot = await self.wait_for("lobby_snapshot")
+        self.player_id = next(p["id"] for p in snapshot["players"] if p["name"] == self.name)
+
+        for round_number in range(self.test.rounds):
+            await self.play_round(round_number)
+            self.test.rounds_played += 1
+        self.writer.close()
+
+
+    async def play_round(self, round_number):
+        # Everyone has to be in before the first round or the countdown keeps restarting
+        while len(self.players) < self.group.players:
+            await self.read_one()
+
+        self.ready_sent_at = time.monotonic()
+        self.all_ready_at = None
+        self.send({"type": "article_request", "article": random.choice(STUB_ARTICLES)})
+
+        # One plain round trip while the countdown runs
+        sent = time.monotonic()
+        self.send({"type": "lobby_snapshot_request"})
+        await self.wait_for("lobby_snapshot")
+        self.test.record("snapshot", time.monotonic() - sent)
+
+        game_start = await self.wait_for("game_start")
+        if self.all_ready_at is not None:
+            waited = time.monotonic() - self.all_ready_at
+            self.test.record("countdown", waited)
+            self.test.record("countdown overshoot", waited - countdown_duration(self.group.players))
+
+        delay = random.uniform(self.test.min_delay, self.test.max_delay)
+        for i in range(self.test.navigates):
+            await asyncio.sleep(delay / (self.test.navigates + 1))
+            self.send({"type": "navigate", "article": random.choice(STUB_ARTICLES)})
+        await asyncio.sleep(delay / (self.test.navigates + 1))
+
+        self.send({
+            "type": "game_result",
+            "status": random.choice(("Win", "Win", "Fold")),
+            "clicks": self.test.navigates,
+            "time": delay
+        })
+        self.group.results_sent[round_number] = time.monotonic()
+        await self.wait_for("game_results")
+        if self.leader:
+            self.test.record("results", time.monotonic() - self.group.results_sent[round_number])
+
+        self.send({"type": "play_again"})
+
+
+    def send(self, message):
+        self.writer.write(encode_message(message))
+
+
+    async def wait_for(self, *message_types):
+        while True:
+            for message_type in message_types:
+                if self.inbox[message_type]:
+                    return self.inbox[message_type].popleft()
+            await self.read_one()
+
+
+    async def read_one(self):
+        data = await asyncio.wait_for(self.reader.read(65536), self.test.message_timeout)
+        if not data:
+            raise ConnectionError("Server closed the connection")
+        for message in self.decoder.feed(data):
+            self.test.messages_received += 1
+            self.track(message)
+            if message.get("type") in WAITED_TYPES:
+                self.inbox[message["type"]].append(message)
+
+
+    def track(self, message):
+        """Follow the lobby's player list to see when the countdown starts"""
+        message_type = message.get("type")
+        if message_type == "lobby_snapshot":
+            self.players = {p["id"]: p["ready"] for p in message["players"]}
+        elif message_type == "lobby_delta":
+            player = message["player"]
+            if message["event"] == "left":
+                self.players.pop(player["id"], None)
+            else:
+                self.players[player["id"]] = player["ready"]
+                if player["id"] == self.player_id and player["ready"] and self.ready_sent_at is not None:
+                    self.test.record("ready", time.monotonic() - self.ready_sent_at)
+                    self.ready_sent_at = None
+        else:
+            return
+        if self.all_ready_at is None and self.players and all(self.players.values()):
+            self.all_ready_at = time.monotonic()
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.host = args.host or "127.0.0.1"
+        self.port = args.port
+        self.lobbies = args.lobbies
+        self.players = args.players
+        self.rounds = args.rounds
+        self.min_delay = args.min_delay
+        self.max_delay = args.max_delay
+        self.navigates = args.navigates
+        self.connect_rate = args.connect_rate
+        self.message_timeout = args.message_timeout
+
+        self.latencies = defaultdict(list)  # {metric: [seconds]}
+        self.errors = defaultdict(int)  # {error: count}
+        self.messages_received = 0
+        self.rounds_played = 0
+
+
+    def record(self, metric, seconds):
+        self.latencies[metric].append(seconds)
+
+
+    async def run_bot(self, bot, start_delay):
+        await asyncio.sleep(start_delay)
+        try:
+            await bot.run()
+        except Exception as e:
+            self.errors[f"{type(e).__name__}: {e}"[:120]] += 1
+            if bot.leader and not bot.group.code.done():
+                bot.group.code.set_exception(RuntimeError("Lobby leader failed"))
+            if bot.writer is not None:
+                bot.writer.close()
+
+
+    async def run(self, server_pid=None):
+        monitor = ProcessMonitor(server_pid) if server_pid and os.path.exists("/proc") else None
+        monitor_task = asyncio.create_task(monitor.run()) if monitor else None
+
+        bots = []
+        for lobby in range(self.lobbies):
+            group = LobbyGroup(self.players)
+            for seat in range(self.players):
+                bots.append(Bot(self, f"bot{lobby}-{seat}", group, leader=seat == 0))
+
+        started = time.monotonic()
+        await asyncio.gather(*(self.run_bot(bot, i / self.connect_rate) for i, bot in enumerate(bots)))
+        elapsed = time.monotonic() - started
+
+        if monitor_task:
+            monitor.sample()
+            monitor_task.cancel()
+        self.report(len(bots), elapsed, monitor.summary() if monitor else None)
+
+
+    def report(self, bot_count, elapsed, server_usage):
+        print()
+        print(f"{bot_count} bots in {self.lobbies} lobbies, {self.rounds} rounds, {elapsed:.1f} s")
+        print(f"Rounds played: {self.rounds_played} of {bot_count * self.rounds}, "
+              f"messages received: {self.messages_received} ({self.messages_received / elapsed:.0f}/s)")
+
+        header = "".join(f"{f"p{p}":>10}" for p in REPORTED_PERCENTILES)
+        print(f"{"Latency (ms)":<22}{"count":>8}{header}{"max":>10}")
+        for metric in ("join", "ready", "snapshot", "results", "countdown", "countdown overshoot"):
+            values = self.latencies.get(metric)
+            if not values:
+                continue
+            columns = "".join(f"{percentile(values, p) * 1000:10.1f}" for p in REPORTED_PERCENTILES)
+            print(f"{metric:<22}{len(values):>8}{columns}{max(values) * 1000:10.1f}")
+
+        if server_usage:
+            average, peak, rss = server_usage
+            print(f"Server CPU: {average:.0f}% average, {peak:.0f}% peak (100% is one core), "
+                  f"peak RSS {rss / 1024 / 1024:.1f} MB")
+        else:
+            print("Server CPU and RSS unavailable (needs a server started here, on Linux)")
+
+        if self.errors:
+            print("Errors:")
+            for error, count in sorted(self.errors.items(), key=lambda item: -item[1]):
+                print(f"  {count:>6}  {error}")
+
+
+def start_server(args, stats_dir):
+    """Start a stubbed server on args.port, returns the process once it accepts connections"""
+    server_args = ["--headless", "--mode", args.mode, "--stats-path", os.path.join(stats_dir, "stats.db")]
+    if args.shards > 1:
+        server_args += ["--shards", str(args.shards)]
+    env = dict(os.environ, PORT=str(args.port), BENCH_LOAD_STUB_LATENCY=str(args.stub_latency / 1000))
+    output = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve-stub", *server_args],
+                               env=env, stdout=output, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", args.port), timeout=1.0).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start listening in time")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve-stub"]:
+        run_stub_server(sys.argv[2:])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Load test a Wikipedia Race server with bot clients")
+    parser.add_argument("--lobbies", type=int, default=100, help="Lobbies to fill with bots")
+    parser.add_argument("--players", type=int, default=4, help="Bots per lobby")
+    parser.add_argument("--rounds", type=int, default=3, help="Games each lobby plays")
+    parser.add_argument("--min-delay", type=float, default=1.0, help="Shortest time a bot takes to finish a game")
+    parser.add_argument("--max-delay", type=float, default=5.0, help="Longest time a bot takes to finish a game")
+    parser.add_argument("--navigates", type=int, default=3, help="navigate messages each bot sends per game")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="New connections per second")
+    parser.add_argument("--message-timeout", type=float, default=60.0,
+                        help="Seconds a bot waits for any message before giving up")
+    parser.add_argument("--host", default=None, help="Test a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5555)))
+    parser.add_argument("--server-pid", type=int, default=None, help="PID of a running server, for CPU and RSS")
+    parser.add_argument("--mode", choices=["threaded", "asyncio"], default="asyncio",
+                        help="Connection handling of the started server")
+    parser.add_argument("--shards", type=int, default=1, help="Worker processes of the started server")
+    parser.add_argument("--stub-latency", type=float, default=50.0,
+                        help="Milliseconds each stubbed MediaWiki call takes")
+    parser.add_argument("--server-log", default=None, help="File for the started server's output")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    test = LoadTest(args)
+    if args.host:
+        asyncio.run(test.run(args.server_pid))
+    else:
+        with tempfile.TemporaryDirectory() as stats_dir:
+            server = start_server(args, stats_dir)
+            try:
+                asyncio.run(test.run(server.pid))
+            finally:
+                server.terminate()
+                server.wait()
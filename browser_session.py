@@ -0,0 +1,158 @@
+import atexit
+import threading
+from urllib.parse import quote
+
+from navigation_watcher import NavigationWatcher
+
+
+WIKIPEDIA_URL = "https://en.wikipedia.org"
+STARTUP_TIMEOUT = 60.0  # Seconds a round waits for a browser that is still starting
+
+
+def article_url(title, base_url=WIKIPEDIA_URL):
+    """Wikipedia URL of an article, without asking the API"""
+    return base_url + "/wiki/" + quote(title.replace(" ", "_"), safe="/:(),'!*")
+
+
+class BrowserSession:
+    """One Firefox kept alive for the whole time the client runs
+
+    The browser is started in the background before it is needed, parked
+    on a blank page between rounds and only quit when the client exits,
+    so a round never waits for Firefox and geckodriver to start.
+    Articles are opened under base_url, which may be a local page cache.
+    """
+    def __init__(self, base_url=WIKIPEDIA_URL):
+        self.base_url = base_url
+        self.driver = None
+        self.watcher = None
+        self.window_rect = None
+
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.starting = False
+        self.closed = False
+
+        atexit.register(self.shutdown)
+
+
+    def warm_up(self):
+        """Start the browser in the background unless it is running or starting"""
+        with self.lock:
+            if self.closed or self.starting or self.driver is not None:
+                return
+            self.starting = True
+            self.ready.clear()
+        threading.Thread(target=self._start, daemon=True).start()
+
+
+    def acquire(self, timeout=STARTUP_TIMEOUT):
+        """Return (driver, watcher) for a round, starting or restarting the browser if needed"""
+        if self.driver is not None and not self.alive():
+            print("Browser was closed, starting a new one")
+            self._discard()
+
+        self.warm_up()
+        if not self.ready.wait(timeout):
+            raise RuntimeError("Browser did not start in time")
+        if self.driver is None:
+            raise RuntimeError("Browser failed to start")
+
+        try:
+            self.driver.set_window_rect(**self.window_rect)
+        except Exception as e:
+            print(f"Could not restore browser window: {e}")
+        self.watcher.clear()
+        return self.driver, self.watcher
+
+
+    def release(self):
+        """Park the browser on a blank page until the next round"""
+        if self.driver is None:
+            return
+        try:
+            handles = self.driver.window_handles
+            for handle in handles[1:]:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(handles[0])
+            self.driver.get("about:blank")
+            self.driver.minimize_window()
+            self.watcher.clear()
+        except Exception as e:
+            print(f"Browser could not be reset, it will be restarted: {e}")
+            self._discard()
+
+
+    def article_url(self, title):
+        return article_url(title, self.base_url)
+
+
+    def alive(self):
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+
+    def shutdown(self):
+        """Quit the browser for good"""
+        with self.lock:
+            self.closed = True
+        self._discard()
+
+
+    def _start(self):
+        driver = None
+        watcher = None
+        window_rect = None
+        try:
+            # Selenium is only imported here, off the UI thread
+            from selenium import webdriver
+            options = webdriver.FirefoxOptions()
+            options.enable_bidi = True
+            driver = webdriver.Firefox(options=options)
+
+            # Hook pages before the first one loads
+            watcher = NavigationWatcher(driver)
+            watcher.start()
+            window_rect = driver.get_window_rect()
+            driver.minimize_window()
+        except Exception as e:
+            print(f"Failed to start browser: {e}")
+            if driver is not None:
+                try:
+                    driver.quit()
+                except:
+                    pass
+            driver = None
+
+        with self.lock:
+            if self.closed and driver is not None:
+                # Shut down while starting
+                try:
+                    driver.quit()
+                except:
+                    pass
+                driver = None
+            self.driver = driver
+            self.watcher = watcher if driver is not None else None
+            self.window_rect = window_rect
+            self.starting = False
+        self.ready.set()
+
+
+    def _discard(self):
+        with self.lock:
+            driver = self.driver
+            watcher = self.watcher
+            self.driver = None
+            self.watcher = None
+        if watcher is not None:
+            watcher.stop()
+        if driver is not None:
+            try:
+                driver.quit()
+            except:
+                pass
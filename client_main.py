@@ -1,10 +1,32 @@
 import customtkinter
-from mediawikiapi import MediaWikiAPI
-from pygame import mixer
-from selenium import webdriver
-from selenium.webdriver.support.ui import WebDriverWait
+import os
+import threading
 import time
 
+from asset_manager import assets
+from title_dictionary import fold_title, open_title_dictionary
+
+
+# Optional dictionary built by title_dictionary.py, lets redirects count as reaching the target
+TITLE_DICTIONARY_PATH = os.environ.get("TITLE_DICTIONARY", "title_dictionary.bin")
+title_dictionary = None
+title_dictionary_opened = False
+
+
+def load_title_dictionary():
+    """Open the title dictionary when the first game starts, None if there is none"""
+    global title_dictionary, title_dictionary_opened
+    if not title_dictionary_opened:
+        title_dictionary = open_title_dictionary(TITLE_DICTIONARY_PATH)
+        title_dictionary_opened = True
+    return title_dictionary
+
+TICK_MS = 50  # Pushed navigation events are picked up this often
+POLL_MS = 1000  # Loop interval when navigation has to be polled, the same as it always was
+SNAPSHOT_EVERY = 60  # Ticks between safety-net page snapshots when navigation events are pushed
+WINDOW_CHECK_EVERY = 20  # Ticks between checks for extra browser windows when navigation events are pushed
+HINT_TIMEOUT = 10.0  # Seconds the hint box waits for a summary still on its way
+
 
 def display_stop_watch(seconds):
     if int(round(seconds) // 60) > 0 and int(round(seconds) % 60) >= 10:
@@ -14,29 +36,10 @@ def display_stop_watch(seconds):
     return str(int(round(seconds)))
 
 
-def disable_search_bar(driver):
-    try:
-        script = """
-        var searchInputs = document.querySelectorAll('input[name="search"]');
-        searchInputs.forEach(function(input) {
-            input.disabled = true;
-            input.style.opacity = '0.5';
-            input.placeholder = 'Search disabled during game';
-        });
-        var searchSuggestions = document.querySelector('.suggestions');
-        if (searchSuggestions) {
-            searchSuggestions.style.display = 'none';
-        }
-        var searchButtons = document.querySelectorAll('button[type="submit"]');
-        searchButtons.forEach(function(button) {
-            if (button.closest('form')?.querySelector('input[name="search"]')) {
-                button.disabled = true;
-            }
-        });
-        """
-        driver.execute_script(script)
-    except Exception as e:
-        print(f"Could not disable search bar: {e}")
+def format_hint(summary):
+    if not summary:
+        return "Hint unavailable."
+    return summary.replace("\n", "\n\n")
 
 
 class GameState:
@@ -49,17 +52,25 @@ class GameState:
 
 class GameFrame(customtkinter.CTkFrame):
     """Game UI is mounted to existing CTkFrame"""
-    def __init__(self, master, start_article, end_article, player_name, on_finish):
+    def __init__(self, master, start_article, end_article, player_name, browser_session, summaries, ui, on_finish,
+                 on_navigate=None):
         super().__init__(master)
         self.start_article = start_article
         self.end_article = end_article
         self.player_name = player_name
+        self.browser_session = browser_session
+        self.summaries = summaries
+        self.ui = ui
         self.on_finish = on_finish
+        self.on_navigate = on_navigate
 
-        self.mediawiki = MediaWikiAPI()
         self.driver = None
+        self.watcher = None
+        self.ticks = 0
         self.game_state = GameState()
         self.initial_time = None
+        self.title_dictionary = load_title_dictionary()
+        self.end_node = self.title_dictionary.node(end_article) if self.title_dictionary else None
 
         self._build_ui()
         self._start_browser_and_game()
@@ -127,33 +138,76 @@ class GameFrame(customtkinter.CTkFrame):
 
 
     def _start_browser_and_game(self):
-        self.driver = webdriver.Firefox()
+        # A browser that is still starting can take a while, so the window isn't made to wait for it
+        threading.Thread(target=self._open_start_article, daemon=True).start()
 
+
+    def _open_start_article(self):
         try:
-            self.driver.get(self.mediawiki.page(self.start_article).url)
+            # The session started the browser while articles were being picked
+            driver, watcher = self.browser_session.acquire()
+            driver.get(self.browser_session.article_url(self.start_article))
+            url, title = watcher.poll()[-1]
         except Exception as e:
             print(e)
-            try:
-                self.driver.quit()
-            except:
-                pass
+            self.ui.post(self._browser_failed)
+            return
+        self.ui.post(self._begin_game, driver, watcher, url, title)
+
+
+    def _browser_failed(self):
+        if self.winfo_exists():
             self._finish_game("Forfeit")
+
+
+    def _begin_game(self, driver, watcher, url, title):
+        if not self.winfo_exists():
+            # The round ended while the browser was opening
+            self.browser_session.release()
             return
 
-        self.game_state.articles_navigated = ["[ << ] " + self.driver.title.replace(" - Wikipedia", "") + " [ >> ]"]
-        self.game_state.last_url = self.driver.current_url
+        self.driver = driver
+        self.watcher = watcher
+        self.game_state.articles_navigated = ["[ << ] " + title.replace(" - Wikipedia", "") + " [ >> ]"]
+        self.game_state.last_url = url
         self.initial_time = time.time()
 
-        self.after(1000, self._game_loop)
+        self.after(TICK_MS, self._game_loop)
+
+
+    def _is_end_article(self, title):
+        """Whether a page title is the target, ignoring case and following redirects"""
+        if self.end_node is not None:
+            return self.title_dictionary.node(title) == self.end_node
+        return fold_title(title) == fold_title(self.end_article)
 
 
     def _show_hint(self):
-        mixer.Sound("./button.mp3").play()
-        try:
-            hint_text = self.mediawiki.summary(self.end_article).replace("\n", "\n\n")
-        except Exception:
-            hint_text = "Hint unavailable."
+        assets.play()
+        self.hint_button.configure(state="disabled")
 
+        # Usually fetched already, otherwise fill the box in when it arrives
+        future = self.summaries.submit(self.end_article)
+        if future.done():
+            self._place_hint(format_hint(future.result()))
+        else:
+            hint = self._place_hint("Loading hint...")
+            self.after(100, self._fill_hint, hint, future, time.time() + HINT_TIMEOUT)
+
+
+    def _fill_hint(self, hint, future, deadline):
+        if not self.winfo_exists():
+            return
+        if not future.done() and time.time() < deadline:
+            self.after(100, self._fill_hint, hint, future, deadline)
+            return
+        hint.configure(state="normal")
+        hint.delete("1.0", "end")
+        hint.insert(index="1.0", text=format_hint(future.result() if future.done() else None))
+        hint.configure(state="disabled")
+
+
+    def _place_hint(self, hint_text):
         hint = customtkinter.CTkTextbox(
             self,
             width=480,
@@ -164,11 +218,11 @@ class GameFrame(customtkinter.CTkFrame):
         hint.insert(index="1.0", text=hint_text)
         hint.place(relx=0.39, rely=0.7, anchor=customtkinter.CENTER)
         hint.configure(state="disabled")
-        self.hint_button.configure(state="disabled")
+        return hint
 
 
     def _fold(self):
-        mixer.Sound("./button.mp3").play()
+        assets.play()
         self.game_state.game_status = "Fold"
 
 
@@ -180,17 +234,14 @@ class GameFrame(customtkinter.CTkFrame):
         self.game_state.game_duration = end_time - self.initial_time if self.initial_time else 0
 
         if self.driver:
-            try:
-                self.driver.quit()
-            except:
-                pass
+            self.browser_session.release()
             self.driver = None
+            self.watcher = None
 
         result = {
             "status": self.game_state.game_status,
             "clicks": len(self.game_state.articles_navigated) - 1,
-            "time": self.game_state.game_duration,
-            "articles": self.game_state.articles_navigated
+            "time": self.game_state.game_duration
         }
 
         self.destroy()
@@ -202,27 +253,48 @@ class GameFrame(customtkinter.CTkFrame):
             self._finish_game()
             return
 
-        elapsed = time.time() - self.initial_time
-        self.stop_watch_label.configure(text=display_stop_watch(elapsed))
-
-        current_url = self.driver.current_url
-        if current_url != self.game_state.last_url:
-            self.game_state.last_url = current_url
-            if self.driver.title.replace(" - Wikipedia", "") != self.end_article:
-                self.game_state.articles_navigated.append(self.driver.title.replace(" - Wikipedia", ""))
+        self.ticks += 1
+        stop_watch = display_stop_watch(time.time() - self.initial_time)
+        if self.stop_watch_label.cget("text") != stop_watch:
+            self.stop_watch_label.configure(text=stop_watch)
+
+        # Pushed events cost no driver calls, snapshots and window checks are one call each
+        if self.watcher.hooked:
+            snapshot = self.ticks % SNAPSHOT_EVERY == 0
+            check_windows = self.ticks % WINDOW_CHECK_EVERY == 0
+            delay = TICK_MS
+        else:
+            snapshot = check_windows = True
+            delay = POLL_MS
+
+        for url, title in self.watcher.poll(snapshot):
+            self._on_page(url, title)
+            if self.game_state.game_status != "Running":
+                break
 
-        self.driver.wait = WebDriverWait(self.driver, 10)
+        try:
+            if check_windows and self.watcher.window_count() > 1:
+                self.game_state.game_status = "Forfeit"
+        except Exception as e:
+            print(f"Could not check browser windows: {e}")
 
-        if "wikipedia" not in self.driver.title.lower() and self.driver.title != "":
-            self.game_state.game_status = "Forfeit"
+        self.after(delay, self._game_loop)
 
-        if len(self.driver.window_handles) > 1:
-            self.game_state.game_status = "Forfeit"
 
-        if self.driver.title.replace(" - Wikipedia", "") == self.end_article:
-            self.game_state.articles_navigated.append("[ >> ] " + self.driver.title.replace(" - Wikipedia", "") + " [ << ]")
-            self.game_state.game_status = "Win"
+    def _on_page(self, url, title):
+        if url == self.game_state.last_url:
+            return
+        self.game_state.last_url = url
+        article = title.replace(" - Wikipedia", "")
 
-        disable_search_bar(self.driver)
+        # Every click is reported as it happens so the server can check it
+        if self.on_navigate:
+            self.on_navigate(article)
 
-        self.after(1000, self._game_loop)
+        if "wikipedia" not in title.lower() and title != "":
+            self.game_state.game_status = "Forfeit"
+        elif self._is_end_article(article):
+            self.game_state.articles_navigated.append("[ >> ] " + article + " [ << ]")
+            self.game_state.game_status = "Win"
+        else:
+            self.game_state.articles_navigated.append(article)
@@ -1,39 +1,63 @@
+from startup_profile import profile  # First, so every import after it can be timed
+
+import argparse
 import customtkinter
-import json
-from pygame import mixer
+import os
 import socket
 import sys
 import threading
 
+from asset_manager import assets
+from browser_session import WIKIPEDIA_URL, BrowserSession
+from message_codec import MessageDecoder
+from message_writer import MessageWriter
 from client_requests_frame import ArticleRequestFrame
-from client_main import GameFrame
+from summary_cache import SummaryCache
+from ui_queue import UIQueue, configure_text
+
+if profile:
+    profile.mark("imports")
 
 SERVER_ADDRESS = "metro.proxy.rlwy.net"
 TCP_PORT = 30825
 BUFFER_SIZE = 4096
+MAX_REDIRECTS = 3  # Hops between server nodes a single join may take
+
+PAGE_CACHE = os.environ.get("PAGE_CACHE", "0") == "1"  # Opt in to serving articles through a local prefetching cache
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR")  # Optional disk tier for pages pushed out of memory
+PAGE_CACHE_UPSTREAM = os.environ.get("PAGE_CACHE_UPSTREAM", WIKIPEDIA_URL)
 
 
 class WikiRaceClient:
     def __init__(self):
         self.server_socket = None
+        self.writer = None
         self.server_ip = SERVER_ADDRESS
         self.server_port = TCP_PORT
+        self.redirects = 0
 
         self.player_name = None
         self.lobby_code = None
+        self.difficulty = "Any"  # Requested for new lobbies
+        self.lobby_difficulty = None
         self.music_on = "Off"
 
         self.connected = False
         self.running = True
+        self.page_cache_proxy = None  # Started in the background with the window up
+        self.browser_session = BrowserSession()
+        self.summaries = SummaryCache()
 
         self.root = None
+        self.ui = None
         self.current_frame = None
         self.status_label = None
 
         self.player_count_label = None
         self.player_count = 1
         self.player_list_label = None
-        self.player_list = None
+        self.player_list = []
+        self.lobby_version = None
 
 
     # UI helpers
@@ -46,72 +70,131 @@ class WikiRaceClient:
 
     def update_status(self, msg):
         print(msg)
-        if self.status_label and self.root:
-            self.root.after(0, lambda: self.status_label.configure(text=msg))
+        if self.status_label and self.ui:
+            label = self.status_label
+            self.ui.post(configure_text, label, msg, key="status")
 
 
     def update_player_count_label(self):
-        if self.player_count_label and self.root:
+        # Once per frame however many lobby updates arrive in it
+        if self.ui:
+            self.ui.post(self.refresh_player_labels, key="player_labels")
+
+
+    def refresh_player_labels(self):
+        # Lobby updates keep arriving after the waiting screen is gone
+        if self.player_count_label and not self.player_count_label.winfo_exists():
+            self.player_count_label = None
+            self.player_list_label = None
+        if self.player_count_label:
             text = f"{self.player_count} player"
             if self.player_count != 1:
                 text += "s"
             text += " in lobby"
-            self.root.after(0, lambda: self.player_count_label.configure(text=text))
-        if self.player_list_label and self.root:
+            configure_text(self.player_count_label, text)
+        if self.player_list_label:
             player_text = ""
             for player in self.player_list:
-                player_text += f"• {player["name"]}\n"
-            self.root.after(0, lambda: self.player_list_label.configure(text=player_text))
+                player_text += f"• {player["name"]}"
+                if player["ready"]:
+                    player_text += " (ready)"
+                player_text += "\n"
+            configure_text(self.player_list_label, player_text)
 
 
     # Networking
     def send_message(self, message):
-        try:
-            self.server_socket.send(json.dumps(message).encode())
-        except Exception as e:
-            print(f"Error sending message: {e}")
+        # Written by the writer thread, the UI never waits on the socket
+        if self.writer is None or not self.writer.send(message):
+            print(f"Not connected, dropped {message.get("type")} message")
+
+
+    def on_send_failed(self, error):
+        print(f"Error sending message: {error}")
+        self.connected = False
+        if self.ui:
+            self.ui.post(self.connection_lost, "Lost connection to server", key="connection_lost")
+
+
+    def connection_lost(self, message):
+        """Send the player back to the join screen with the reason, runs on the Tk loop"""
+        if not self.running or self.connected:
+            return
+        if hasattr(self.current_frame, "game_state"):
+            # The round can't be reported any more, park the browser for the next one
+            self.browser_session.release()
+        self.root.geometry("400x400")
+        self.root.title("Wikipedia Race - Client")
+        self.root.resizable(True, True)
+        self.show_join_screen(rejoin=False)
+        self.update_status(message)
 
 
     def connect_to_server(self, lobby):
         self.lobby_code = lobby
         try:
             self.update_status("Connecting to server...")
+            if self.writer:
+                self.writer.close()
+            if self.server_socket:
+                # A previous connection, its listener stops once the socket is closed
+                try:
+                    self.server_socket.close()
+                except:
+                    pass
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.connect((self.server_ip, self.server_port))
+            self.writer = MessageWriter(self.server_socket, self.on_send_failed).start()
 
-            self.send_message({
+            join_message = {
                 "type": "join",
                 "name": self.player_name,
                 "lobby_code": lobby
-            })
+            }
+            if lobby == "NG" and self.difficulty != "Any":
+                join_message["difficulty"] = self.difficulty.lower()
+            self.send_message(join_message)
         except Exception as e:
             self.update_status(f"Connection failed: {e}")
             return False
         else:
             self.connected = True
-            threading.Thread(target=self.listen_to_server, daemon=True).start()
+            threading.Thread(target=self.listen_to_server, args=(self.server_socket,), daemon=True).start()
             return True
 
 
-    def listen_to_server(self):
-        buffer = ""
+    def listen_to_server(self, server_socket):
+        decoder = MessageDecoder()
 
-        while self.running and self.connected:
+        while self.running and self.connected and server_socket is self.server_socket:
             try:
-                chunk = self.server_socket.recv(BUFFER_SIZE).decode()
-
-                buffer += chunk
+                chunk = server_socket.recv(BUFFER_SIZE)
+                if not chunk:
+                    raise ConnectionError("Server closed the connection")
 
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if line.strip():
-                        message = json.loads(line)
-                        self.root.after(0, lambda m=message: self.handle_server_message(m))
+                for message in decoder.feed(chunk):
+                    self.ui.post(self.handle_server_message, message, key=self.coalesce_key(message))
             except Exception as e:
-                self.update_status("Error in server communication")
+                if server_socket is not self.server_socket:
+                    # Replaced after a redirect
+                    return
                 print(f"Error receiving message: {e}")
                 break
-        self.connected = False
+        if server_socket is self.server_socket:
+            self.connected = False
+            self.ui.post(self.connection_lost, "Lost connection to server", key="connection_lost")
+
+
+    @staticmethod
+    def coalesce_key(message):
+        """Queue key for messages a newer one makes redundant, None for the rest"""
+        msg_type = message.get("type")
+        if msg_type == "lobby_snapshot":
+            # A snapshot also replaces the deltas still waiting before it
+            return "lobby"
+        if msg_type == "lobby_delta":
+            return ("lobby", message.get("version"))
+        return None
 
 
     def handle_server_message(self, message):
@@ -119,32 +202,102 @@ class WikiRaceClient:
 
         if msg_type == "join_success":
             print("Connected to lobby")
+            self.redirects = 0
             updated_lobby_code = message.get("lobby_code")
             if updated_lobby_code:
                 self.lobby_code = updated_lobby_code
+            self.lobby_difficulty = message.get("difficulty")
             self.show_article_request()
 
         elif msg_type == "join_rejected":
             self.update_status(f"Failed to connect to {self.lobby_code}")
 
+        elif msg_type == "redirect":
+            # The lobby lives on another server node, join it there
+            self.redirects += 1
+            if self.redirects > MAX_REDIRECTS:
+                self.update_status(f"Failed to connect to {self.lobby_code}")
+                return
+            self.server_ip = message.get("host")
+            self.server_port = int(message.get("port"))
+            print(f"Lobby {message.get("lobby_code")} is on {self.server_ip}:{self.server_port}")
+            self.connect_to_server(message.get("lobby_code"))
+
         elif msg_type == "game_start":
             start_article = message.get("start_article")
             end_article = message.get("end_article")
+            if "hint" not in message:
+                # Older servers don't send hints, fetch it before the button is pressed
+                self.summaries.submit(end_article)
+            elif message["hint"] is None:
+                self.summaries.expect(end_article)
+            else:
+                self.summaries.store(end_article, message["hint"])
             self.start_game(start_article, end_article)
 
-        elif msg_type == "receive_player_count":
-            self.player_count = int(message.get("player_count"))
-            self.player_list = message.get("players")
+        elif msg_type == "hint":
+            self.summaries.store(message.get("article"), message.get("summary"))
+
+        elif msg_type == "lobby_snapshot":
+            self.lobby_version = message.get("version")
+            self.player_list = message.get("players", [])
+            self.player_count = len(self.player_list)
             # Update waiting screen
             self.update_player_count_label()
 
+        elif msg_type == "lobby_delta":
+            self.apply_lobby_delta(message)
+
+        elif msg_type == "random_article":
+            # Submit the server's random pick if the player is still choosing
+            if isinstance(self.current_frame, ArticleRequestFrame):
+                self.current_frame.on_submit(message.get("title") or "")
+
+        elif msg_type == "navigate_rejected":
+            # The server found no link for that click, the game is forfeit
+            print(f"Server rejected the jump from {message.get("from")} to {message.get("to")}")
+            if hasattr(self.current_frame, "game_state"):
+                self.current_frame.game_state.game_status = "Forfeit"
+
+        elif msg_type == "game_start_failed":
+            # Everyone is back to not ready, pick again
+            print(message.get("message"))
+            self.show_article_request()
+
         elif msg_type == "game_results":
             results = message.get("results")
-            self.show_results(results)
+            self.show_results(results, message.get("par"))
+
+
+    def apply_lobby_delta(self, message):
+        version = message.get("version")
+        if self.lobby_version is None or version <= self.lobby_version:
+            # Already covered by the snapshot we have
+            return
+        if version != self.lobby_version + 1:
+            # Missed an update, start again from a full snapshot
+            self.send_message({"type": "lobby_snapshot_request"})
+            return
+
+        event = message.get("event")
+        player = message.get("player")
+        if event == "joined":
+            self.player_list.append(player)
+        elif event == "left":
+            self.player_list = [p for p in self.player_list if p["id"] != player["id"]]
+        elif event == "ready":
+            for p in self.player_list:
+                if p["id"] == player["id"]:
+                    p["ready"] = player["ready"]
+
+        self.lobby_version = version
+        self.player_count = len(self.player_list)
+        # Update waiting screen
+        self.update_player_count_label()
 
 
     # Screen management
-    def show_join_screen(self):
+    def show_join_screen(self, rejoin=True):
         frame = customtkinter.CTkFrame(self.root)
         frame.place(relwidth=1, relheight=1)
 
@@ -189,15 +342,27 @@ class WikiRaceClient:
                 self.update_status("Please enter lobby code")
                 return
 
+            self.redirects = 0
             self.connect_to_server(lobby)
 
 
-        customtkinter.CTkButton(frame, text="Join Game", command=lambda: [mixer.Sound("./button.mp3").play(), join_game()], font=("Arial", 16)).pack(pady=10)
-        customtkinter.CTkButton(frame, text="New Game", command=lambda: [mixer.Sound("./button.mp3").play(), join_game("NG")], font=("Arial", 16)).pack(pady=10)
+        customtkinter.CTkButton(frame, text="Join Game", command=lambda: [assets.play(), join_game()], font=("Arial", 16)).pack(pady=10)
+        customtkinter.CTkButton(frame, text="New Game", command=lambda: [assets.play(), join_game("NG")], font=("Arial", 16)).pack(pady=10)
+
+        def set_difficulty(value):
+            self.difficulty = value
+
+        difficulty_selector = customtkinter.CTkSegmentedButton(
+            frame,
+            values=["Any", "Easy", "Medium", "Hard"],
+            command=set_difficulty
+        )
+        difficulty_selector.set(self.difficulty)
+        difficulty_selector.pack(pady=5)
 
         self.show_frame(frame)
 
-        if self.player_name and self.lobby_code:
+        if rejoin and self.player_name and self.lobby_code:
             self.root.after(20, lambda: join_game(self.lobby_code))
 
 
@@ -207,7 +372,14 @@ class WikiRaceClient:
             self.show_waiting_screen()
 
 
-        frame = ArticleRequestFrame(self.root, self.lobby_code, on_submit)
+        def on_random():
+            self.send_message({"type": "random_article_request"})
+
+
+        # Get the browser going while the player picks, so game_start can use it straight away
+        self.browser_session.warm_up()
+
+        frame = ArticleRequestFrame(self.root, self.lobby_code, on_submit, on_random)
         self.show_frame(frame)
 
 
@@ -217,6 +389,8 @@ class WikiRaceClient:
         customtkinter.CTkLabel(frame, text="Waiting for game", font=("Arial", 20)).pack()
         customtkinter.CTkLabel(frame, text=self.lobby_code, font=("Arial", 30, "bold")).pack()
         customtkinter.CTkLabel(frame, text="to start...", font=("Arial", 20)).pack()
+        if self.lobby_difficulty:
+            customtkinter.CTkLabel(frame, text=f"Difficulty: {self.lobby_difficulty.title()}", font=("Arial", 14)).pack()
         self.player_count_label = customtkinter.CTkLabel(frame, text=f"Please wait...", font=("Arial", 20))
         self.player_count_label.pack(pady=10)
 
@@ -229,11 +403,12 @@ class WikiRaceClient:
             justify="left"
         )
         self.player_list_label.pack()
+        self.update_player_count_label()
 
         customtkinter.CTkButton(
             frame,
             text="Disconnect",
-            command=lambda: [mixer.Sound("./button.mp3").play(), self.disconnect()],
+            command=lambda: [assets.play(), self.disconnect()],
             fg_color="red"
         ).place(relx=0.5, rely=0.9, anchor="center")
 
@@ -248,7 +423,7 @@ class WikiRaceClient:
         customtkinter.CTkButton(
             frame,
             text="Disconnect",
-            command=lambda: [mixer.Sound("./button.mp3").play(), self.disconnect()],
+            command=lambda: [assets.play(), self.disconnect()],
             fg_color="red"
         ).pack(pady=20)
 
@@ -263,20 +438,35 @@ class WikiRaceClient:
                     "type": "game_result",
                     "status": game_result["status"],
                     "clicks": game_result["clicks"],
-                    "time": game_result["time"],
-                    "articles": game_result["articles"]
+                    "time": game_result["time"]
                 })
             # Return to waiting
             self.show_early_completion_screen()
 
 
-        frame = GameFrame(self.root, start_article, end_article, self.player_name, on_finish)
+        def on_navigate(article):
+            if self.connected:
+                self.send_message({"type": "navigate", "article": article})
+
+
+        # Imported on the first game so the join screen doesn't wait for it
+        from client_main import GameFrame
+
+        frame = GameFrame(self.root, start_article, end_article, self.player_name, self.browser_session, self.summaries,
+                          self.ui, on_finish, on_navigate)
         self.show_frame(frame)
 
-    def show_results(self, results):
+    def show_results(self, results, par=None):
         frame = customtkinter.CTkFrame(self.root)
 
         customtkinter.CTkLabel(frame, text="Final Results", font=("Arial", 24, "bold")).pack(pady=20)
+        if par:
+            customtkinter.CTkLabel(
+                frame,
+                text=f"Par: {par["clicks"]} clicks ({" > ".join(par["path"])})",
+                font=("Arial", 14),
+                wraplength=600
+            ).pack()
         results_frame = customtkinter.CTkFrame(frame)
         results_frame.pack(pady=20, padx=20, fill="both", expand=True)
 
@@ -301,14 +491,14 @@ class WikiRaceClient:
         customtkinter.CTkButton(
             button_frame,
             text="Play Again",
-            command=lambda: [mixer.Sound("./button.mp3").play(), play_again()],
+            command=lambda: [assets.play(), play_again()],
             font=("Arial", 16)
         ).pack(side="left", padx=10)
 
         customtkinter.CTkButton(
             button_frame,
             text="Quit",
-            command=lambda: [mixer.Sound("./button.mp3").play(), self.disconnect()],
+            command=lambda: [assets.play(), self.disconnect()],
             fg_color="red",
             font=("Arial", 16)
         ).pack(side="left", padx=10)
@@ -320,18 +510,37 @@ class WikiRaceClient:
         self.music_on = check_var.get()
         if self.music_on == "On":
             try:
-                music = mixer.Sound("music.mp3")
-                music.play(-1)
+                assets.play_music()
             except Exception as e:
                 print(e)
                 self.music_on = "Off"
         else:
-            mixer.stop()
+            assets.stop_music()
+
+
+    def start_page_cache(self):
+        """Start the local page cache, or None to let the browser talk to Wikipedia directly"""
+        if not PAGE_CACHE:
+            return None
+        try:
+            from page_cache import PageCache, PageCacheProxy
+            cache = PageCache(disk_dir=PAGE_CACHE_DIR)
+            return PageCacheProxy(PAGE_CACHE_UPSTREAM, cache).start()
+        except Exception as e:
+            print(f"Page cache unavailable: {e}")
+            return None
 
 
     def disconnect(self):
         self.running = False
         self.connected = False
+        self.browser_session.shutdown()
+        self.summaries.shutdown()
+        if self.page_cache_proxy:
+            print(f"Page cache: {self.page_cache_proxy.cache.stats()}")
+            self.page_cache_proxy.stop()
+        if self.writer:
+            self.writer.close()
         if self.server_socket:
             try:
                 self.server_socket.close()
@@ -343,20 +552,55 @@ class WikiRaceClient:
             sys.exit()
 
 
+    def warm_up(self):
+        """Load sound and the heavy libraries in the background once the join screen is up"""
+        if profile:
+            self.root.update_idletasks()
+            profile.mark("join screen drawn")
+            profile.report()
+        assets.start()
+        threading.Thread(target=self.warm_up_network, daemon=True).start()
+
+
+    def warm_up_network(self):
+        # Well before the first round, which is when the browser needs its base URL
+        self.page_cache_proxy = self.start_page_cache()
+        if self.page_cache_proxy:
+            self.browser_session.base_url = self.page_cache_proxy.base_url
+        try:
+            import client_main
+            import mediawikiapi
+            import selenium.webdriver
+        except Exception as e:
+            print(f"Background import failed: {e}")
+
+
     def start(self):
         customtkinter.set_appearance_mode("System")
         customtkinter.set_default_color_theme("blue")
-        mixer.init()
 
         self.root = customtkinter.CTk()
         self.root.title("Wikipedia Race - Client")
         self.root.geometry("400x400")
         self.root.protocol("WM_DELETE_WINDOW", self.disconnect)
+        self.ui = UIQueue(self.root)
+        if profile:
+            profile.mark("window")
 
         self.show_join_screen()
+        if profile:
+            profile.mark("join screen built")
+        self.root.after(0, self.warm_up)
         self.root.mainloop()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wikipedia Race Client")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print how long imports and each startup step took")
+    parser.parse_args()
+
     client = WikiRaceClient()
+    if profile:
+        profile.mark("client")
     client.start()
@@ -1,9 +1,10 @@
 import customtkinter
 from mediawikiapi import MediaWikiAPI
-from pygame import mixer
+
+from asset_manager import assets
 
 def main(lobby_code):
-    mixer.init()
+    assets.start()
 
     customtkinter.set_appearance_mode("System")  # Modes: system (default), light, dark
     customtkinter.set_default_color_theme("blue")  # Themes: blue (default), dark-blue, green
@@ -42,14 +43,14 @@ def main(lobby_code):
     info_text.place(relx=0.5, rely=0.5, anchor=customtkinter.CENTER)
     text_box = customtkinter.CTkEntry(master=req_root, placeholder_text="Enter article title")
     text_box.place(relx=0.5, rely=0.5, anchor=customtkinter.CENTER)
-    submit_button = customtkinter.CTkButton(master=req_root, text="Submit", command=lambda: [mixer.Sound("./button.mp3").play(),
+    submit_button = customtkinter.CTkButton(master=req_root, text="Submit", command=lambda: [assets.play(),
                                                                                              button_function()])
     submit_button.place(relx=0.5, rely=0.65, anchor=customtkinter.CENTER)
     random_button = customtkinter.CTkButton(
         master=req_root,
         text="Random (Hard, click Submit to skip!)",
         fg_color="red",
-        command=lambda: [mixer.Sound("./button.mp3").play(),
+        command=lambda: [assets.play(),
                          random_button_function()]
     )
     random_button.place(relx=0.5, rely=0.8, anchor=customtkinter.CENTER)
@@ -1,15 +1,14 @@
 import customtkinter
-from mediawikiapi import MediaWikiAPI
-from pygame import mixer
+
+from asset_manager import assets
 
 
 class ArticleRequestFrame(customtkinter.CTkFrame):
-    def __init__(self, master, lobby_code, on_submit):
+    def __init__(self, master, lobby_code, on_submit, on_random):
         super().__init__(master)
         self.lobby_code = lobby_code
         self.on_submit = on_submit
-
-        self.mediawiki = MediaWikiAPI()
+        self.on_random = on_random
 
         self.grid_rowconfigure((0, 1, 2, 3), weight=1)
         self.grid_columnconfigure(0, weight=1)
@@ -38,22 +37,23 @@ class ArticleRequestFrame(customtkinter.CTkFrame):
         )
         submit_button.grid(row=3, column=0, pady=(10, 6))
 
-        random_button = customtkinter.CTkButton(
+        self.random_button = customtkinter.CTkButton(
             self,
             text="Random (Hard, click Submit to skip!)",
             fg_color="red",
             command=self._random
         )
-        random_button.grid(row=4, column=0, pady=(0, 20))
+        self.random_button.grid(row=4, column=0, pady=(0, 20))
 
 
     def _submit(self):
-        mixer.Sound("./button.mp3").play()
+        assets.play()
         suggestion = self.text_box.get().strip()
         self.on_submit(suggestion)
 
 
     def _random(self):
-        mixer.Sound("./button.mp3").play()
-        suggestion = self.mediawiki.random(1)
-        self.on_submit(suggestion)
+        assets.play()
+        # The server answers with a title from its random article pool
+        self.random_button.configure(state="disabled")
+        self.on_random()
@@ -0,0 +1,509 @@
+"""Build a link graph and title table from Wikipedia SQL dumps
+
+    python dump_importer.py DUMP_DIR OUTPUT_DIR [--workers 16]
+
+DUMP_DIR holds page.sql.gz, redirect.sql.gz and pagelinks.sql.gz (the
+enwiki-YYYYMMDD- prefix is fine), plus linktarget.sql.gz for dumps
+where pagelinks refers to link targets by id. The dumps are streamed
+and never loaded whole. Parsing of INSERT statements is spread across
+worker processes, and the parent only keeps fixed-size id arrays in
+memory. Links are spilled to bucket files on disk before being sorted
+into CSR form one bucket at a time.
+
+OUTPUT_DIR receives:
+    link_graph.bin        the link graph, see link_graph.py
+    titles.txt            one article title per line, line i is node i
+    redirects.tsv         redirect title and the node it points to
+    title_dictionary.bin  titles and redirects to nodes, see title_dictionary.py
+
+Progress is checkpointed under OUTPUT_DIR/work, and running the same
+command again resumes after the last finished step. A tiny dump for
+trying this offline lives in fixtures/tiny_wiki.
+"""
+from array import array
+import argparse
+import bisect
+from collections import deque
+import glob
+import gzip
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+
+from link_graph import HEADER, MAGIC, FORMAT_VERSION
+from title_dictionary import build_title_dictionary
+
+
+LINK_BUCKETS = 256  # Links are sorted one bucket at a time, more buckets means less memory
+MAX_IN_FLIGHT = 4  # INSERT statements queued per worker
+CHECKPOINT_EVERY = 64  # INSERT statements between pagelinks checkpoints
+
+ARTICLE_NAMESPACE = 0
+
+TUPLE_PATTERN = re.compile(rb"\(((?:'(?:[^'\\]|\\.)*'|[^'()])*)\)")
+VALUE_PATTERN = re.compile(rb"'((?:[^'\\]|\\.)*)'|(NULL)|([^,]+)")
+ESCAPE_PATTERN = re.compile(rb"\\(.)", re.DOTALL)
+ESCAPES = {b"0": b"\0", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"Z": b"\x1a"}
+
+
+# Parsing, runs in the worker processes
+
+def unescape(value):
+    return ESCAPE_PATTERN.sub(lambda m: ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def parse_values(line):
+    """Yield the rows of one INSERT statement as lists of bytes, int or None"""
+    values_at = line.find(b" VALUES ")
+    if values_at == -1:
+        return
+    for row in TUPLE_PATTERN.finditer(line, values_at):
+        fields = []
+        for match in VALUE_PATTERN.finditer(row.group(1)):
+            text, null, number = match.groups()
+            if text is not None:
+                fields.append(unescape(text))
+            elif null is not None:
+                fields.append(None)
+            else:
+                number = number.strip()
+                fields.append(int(number) if number.lstrip(b"-").isdigit() else number)
+        yield fields
+
+
+def title_hash(title):
+    """Stable 64-bit hash of a title, the same in every process"""
+    return int.from_bytes(hashlib.blake2b(title, digest_size=8).digest(), "little", signed=True)
+
+
+# Sorted int -> int32 maps written by earlier steps, shared by the workers through mmap
+MAP_FILES = {
+    "pages": ("page_ids.bin", "page_nodes.bin", "i"),  # page_id -> node
+    "articles": ("article_hashes.bin", "article_nodes.bin", "q"),  # article title hash -> node
+    "redirects": ("redirect_ids.bin", "redirect_indexes.bin", "i"),  # redirect page_id -> redirect index
+    "titles": ("title_hashes.bin", "title_nodes.bin", "q"),  # article or redirect title hash -> node
+    "targets": ("target_ids.bin", "target_nodes.bin", "i")  # lt_id -> node
+}
+
+
+class SortedIntMap:
+    """Read-only int -> int32 map stored as a sorted key file and a value file"""
+    def __init__(self, key_path, value_path, key_type):
+        self.keys = self.map_file(key_path, key_type)
+        self.values = self.map_file(value_path, "i")
+
+
+    @staticmethod
+    def map_file(path, item_type):
+        if os.path.getsize(path) == 0:
+            return ()
+        with open(path, "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(item_type)
+
+
+    def get(self, key, default=-1):
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.values[i]
+        return default
+
+
+worker_state = {}
+
+
+def init_worker(work_dir, map_names, bucket_width=None, buckets=None):
+    for name in map_names:
+        key_file, value_file, key_type = MAP_FILES[name]
+        worker_state[name] = SortedIntMap(
+            os.path.join(work_dir, key_file), os.path.join(work_dir, value_file), key_type)
+    if "redirects" in map_names:
+        worker_state["redirect_offsets"] = SortedIntMap.map_file(
+            os.path.join(work_dir, "redirect_offsets.bin"), "q")
+        worker_state["redirect_titles"] = SortedIntMap.map_file(
+            os.path.join(work_dir, "redirect_titles.bin"), "B")
+    worker_state["bucket_width"] = bucket_width
+    worker_state["buckets"] = buckets
+
+
+def parse_pages(line):
+    # page_id, page_namespace, page_title, page_is_redirect, ...
+    return [
+        (row[0], row[2], row[3])
+        for row in parse_values(line)
+        if row[1] == ARTICLE_NAMESPACE
+    ]
+
+
+def parse_redirects(line):
+    """Resolve one redirect INSERT to (redirect title, target node) pairs"""
+    # rd_from, rd_namespace, rd_title, rd_interwiki, rd_fragment
+    articles = worker_state["articles"]
+    redirects = worker_state["redirects"]
+    offsets = worker_state["redirect_offsets"]
+    titles = worker_state["redirect_titles"]
+    resolved = []
+
+    for row in parse_values(line):
+        if row[1] != ARTICLE_NAMESPACE or row[3]:
+            continue
+        node = articles.get(title_hash(row[2]))
+        i = redirects.get(row[0])
+        if node >= 0 and i >= 0:
+            resolved.append((titles[offsets[i]:offsets[i + 1]].tobytes(), node))
+    return resolved
+
+
+def parse_link_targets(line):
+    """Resolve one linktarget INSERT to (lt_id, node) pairs"""
+    # lt_id, lt_namespace, lt_title
+    titles = worker_state["titles"]
+    resolved = []
+
+    for row in parse_values(line):
+        if row[1] != ARTICLE_NAMESPACE:
+            continue
+        node = titles.get(title_hash(row[2]))
+        if node >= 0:
+            resolved.append((row[0], node))
+    return resolved
+
+
+def parse_links(line):
+    """Resolve one pagelinks INSERT to link pairs, packed as int32 and grouped by spill file"""
+    pages = worker_state["pages"]
+    titles = worker_state["titles"]
+    targets = worker_state.get("targets")
+    bucket_width = worker_state["bucket_width"]
+    buckets = worker_state["buckets"]
+    out_chunks = [array("i") for _ in range(buckets)]
+    in_chunks = [array("i") for _ in range(buckets)]
+
+    for row in parse_values(line):
+        if len(row) == 3:
+            # pl_from, pl_from_namespace, pl_target_id
+            if row[1] != ARTICLE_NAMESPACE or targets is None:
+                continue
+            target = targets.get(row[2])
+        else:
+            # pl_from, pl_namespace, pl_title, pl_from_namespace
+            if row[1] != ARTICLE_NAMESPACE or row[3] != ARTICLE_NAMESPACE:
+                continue
+            target = titles.get(title_hash(row[2]))
+
+        source = pages.get(row[0])
+        if source >= 0 and target >= 0 and source != target:
+            out_chunks[source // bucket_width].extend((source, target))
+            in_chunks[target // bucket_width].extend((target, source))
+
+    return [chunk.tobytes() for chunk in out_chunks + in_chunks]
+
+
+# Orchestration, runs in the parent process
+
+def find_dump(dump_dir, table, required=True):
+    matches = sorted(
+        glob.glob(os.path.join(dump_dir, f"{table}.sql.gz"))
+        + glob.glob(os.path.join(dump_dir, f"*-{table}.sql.gz"))
+    )
+    if not matches:
+        if required:
+            raise FileNotFoundError(f"No {table}.sql.gz dump in {dump_dir}")
+        return None
+    return matches[-1]
+
+
+def insert_statements(path, skip=0):
+    """Stream the INSERT lines of a gzipped SQL dump, skipping the first skip of them"""
+    seen = 0
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"INSERT INTO"):
+                seen += 1
+                if seen > skip:
+                    yield line
+
+
+def parallel_map(pool, func, items, workers):
+    """Like pool.imap, but only keeps a bounded number of items in flight"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= workers * MAX_IN_FLIGHT:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class DumpImporter:
+    def __init__(self, dump_dir, output_dir, workers=None, buckets=LINK_BUCKETS):
+        self.dump_dir = dump_dir
+        self.output_dir = output_dir
+        self.work_dir = os.path.join(output_dir, "work")
+        self.workers = workers or os.cpu_count() or 1
+        self.buckets = buckets
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        self.link_target_dump = find_dump(dump_dir, "linktarget", required=False)
+
+
+    def work_path(self, name):
+        return os.path.join(self.work_dir, name)
+
+
+    def step_done(self, step):
+        return os.path.exists(self.work_path(f"{step}.done"))
+
+
+    def mark_done(self, step, info=None):
+        with open(self.work_path(f"{step}.done"), "w", encoding="utf-8") as f:
+            json.dump(info or {}, f)
+
+
+    def write_map(self, name, keys, values):
+        """Write one of the MAP_FILES, sorted by key"""
+        key_file, value_file, key_type = MAP_FILES[name]
+        # Sorted in place on the array buffers, a stable sort keeps the first of equal keys first
+        keys = np.asarray(memoryview(keys))
+        order = np.argsort(keys, kind="stable")
+        keys[order].tofile(self.work_path(key_file))
+        np.asarray(memoryview(values))[order].tofile(self.work_path(value_file))
+
+
+    def read_done(self, step):
+        with open(self.work_path(f"{step}.done"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+    def run(self):
+        steps = [
+            ("pages", self.import_pages),
+            ("redirects", self.import_redirects),
+            ("link_targets", self.import_link_targets),
+            ("links", self.import_links),
+            ("graph", self.build_graph),
+            ("dictionary", self.build_dictionary)
+        ]
+        for step, func in steps:
+            if self.step_done(step):
+                print(f"Skipping {step}, already done")
+                continue
+            print(f"Importing {step}...")
+            func()
+
+        shutil.rmtree(self.work_dir)
+        print(f"Done, output written to {self.output_dir}")
+
+
+    def import_pages(self):
+        """Number every article, write the title table and remember redirect pages"""
+        page_ids = array("i")
+        article_hashes = array("q")
+        redirect_ids = array("i")
+        redirect_offsets = array("q", [0])
+
+        titles_path = os.path.join(self.output_dir, "titles.txt")
+        with (
+            multiprocessing.Pool(self.workers) as pool,
+            open(titles_path, "wb") as titles,
+            open(self.work_path("redirect_titles.bin"), "wb") as redirect_titles
+        ):
+            statements = insert_statements(find_dump(self.dump_dir, "page"))
+            for rows in parallel_map(pool, parse_pages, statements, self.workers):
+                for page_id, title, is_redirect in rows:
+                    if is_redirect:
+                        redirect_ids.append(page_id)
+                        redirect_titles.write(title)
+                        redirect_offsets.append(redirect_offsets[-1] + len(title))
+                    else:
+                        page_ids.append(page_id)
+                        article_hashes.append(title_hash(title))
+                        titles.write(title.replace(b"_", b" ") + b"\n")
+
+        article_count = len(page_ids)
+        nodes = array("i", range(article_count))
+        self.write_map("pages", page_ids, nodes)
+        self.write_map("articles", article_hashes, nodes)
+        self.write_map("redirects", redirect_ids, array("i", range(len(redirect_ids))))
+        with open(self.work_path("redirect_offsets.bin"), "wb") as f:
+            redirect_offsets.tofile(f)
+
+        self.mark_done("pages", {"articles": article_count, "redirects": len(redirect_ids)})
+        print(f"{article_count} articles, {len(redirect_ids)} redirect pages")
+
+
+    def import_redirects(self):
+        """Point redirect titles at the article they lead to"""
+        title_hashes = array("q")
+        title_nodes = array("i")
+        with open(self.work_path("article_hashes.bin"), "rb") as f:
+            title_hashes.frombytes(f.read())
+        with open(self.work_path("article_nodes.bin"), "rb") as f:
+            title_nodes.frombytes(f.read())
+
+        redirects_path = os.path.join(self.output_dir, "redirects.tsv")
+        with (
+            multiprocessing.Pool(self.workers, init_worker, (self.work_dir, ["articles", "redirects"])) as pool,
+            open(redirects_path, "wb") as redirects
+        ):
+            statements = insert_statements(find_dump(self.dump_dir, "redirect"))
+            for rows in parallel_map(pool, parse_redirects, statements, self.workers):
+                for title, node in rows:
+                    title_hashes.append(title_hash(title))
+                    title_nodes.append(node)
+                    redirects.write(title.replace(b"_", b" ") + b"\t" + str(node).encode() + b"\n")
+
+        redirect_count = len(title_hashes) - self.read_done("pages")["articles"]
+        self.write_map("titles", title_hashes, title_nodes)
+        self.mark_done("redirects", {"redirects": redirect_count})
+        print(f"{redirect_count} redirects resolved")
+
+
+    def import_link_targets(self):
+        """Resolve linktarget ids for dumps whose pagelinks refer to targets by id"""
+        target_ids = array("i")
+        target_nodes = array("i")
+
+        if self.link_target_dump is not None:
+            with multiprocessing.Pool(self.workers, init_worker, (self.work_dir, ["titles"])) as pool:
+                statements = insert_statements(self.link_target_dump)
+                for rows in parallel_map(pool, parse_link_targets, statements, self.workers):
+                    for target_id, node in rows:
+                        target_ids.append(target_id)
+                        target_nodes.append(node)
+
+        self.write_map("targets", target_ids, target_nodes)
+        self.mark_done("link_targets", {"targets": len(target_ids)})
+
+
+    def import_links(self):
+        """Spill resolved links into bucket files by source and by target"""
+        node_count = self.read_done("pages")["articles"]
+        checkpoint_path = self.work_path("links.checkpoint")
+        spill_paths = (
+            [self.work_path(f"out_{i}.bin") for i in range(self.buckets)]
+            + [self.work_path(f"in_{i}.bin") for i in range(self.buckets)]
+        )
+
+        # Resume from the last checkpoint, dropping anything written after it
+        checkpoint = {"statements": 0, "sizes": [0] * len(spill_paths)}
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            print(f"Resuming after {checkpoint["statements"]} statements")
+
+        spill_files = []
+        for path, size in zip(spill_paths, checkpoint["sizes"]):
+            f = open(path, "ab")
+            f.truncate(size)
+            # tell() still reports the old end after truncating, and checkpoints record it
+            f.seek(0, os.SEEK_END)
+            spill_files.append(f)
+
+        statements_done = checkpoint["statements"]
+        bucket_width = -(-max(node_count, 1) // self.buckets)
+        map_names = ["pages", "titles"] + (["targets"] if self.link_target_dump is not None else [])
+
+        try:
+            with multiprocessing.Pool(
+                self.workers, init_worker, (self.work_dir, map_names, bucket_width, self.buckets)
+            ) as pool:
+                statements = insert_statements(find_dump(self.dump_dir, "pagelinks"), skip=statements_done)
+                for chunks in parallel_map(pool, parse_links, statements, self.workers):
+                    for f, chunk in zip(spill_files, chunks):
+                        if chunk:
+                            f.write(chunk)
+
+                    statements_done += 1
+                    if statements_done % CHECKPOINT_EVERY == 0:
+                        self.write_link_checkpoint(checkpoint_path, statements_done, spill_files)
+        finally:
+            for f in spill_files:
+                f.close()
+
+        self.mark_done("links", {"statements": statements_done})
+
+
+    def write_link_checkpoint(self, checkpoint_path, statements_done, spill_files):
+        for f in spill_files:
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"statements": statements_done, "sizes": [f.tell() for f in spill_files]}, f)
+        os.replace(tmp_path, checkpoint_path)
+
+
+    def build_graph(self):
+        """Sort each bucket and assemble the CSR link graph file"""
+        node_count = self.read_done("pages")["articles"]
+        out_offsets, out_count = self.build_direction("out", node_count)
+        in_offsets, in_count = self.build_direction("in", node_count)
+        assert out_count == in_count
+
+        graph_path = os.path.join(self.output_dir, "link_graph.bin")
+        with open(graph_path + ".tmp", "wb") as graph:
+            graph.write(HEADER.pack(MAGIC, FORMAT_VERSION, node_count, out_count))
+            out_offsets.tofile(graph)
+            self.append_file(graph, self.work_path("out_targets.bin"))
+            in_offsets.tofile(graph)
+            self.append_file(graph, self.work_path("in_targets.bin"))
+        os.replace(graph_path + ".tmp", graph_path)
+
+        self.mark_done("graph", {"links": out_count})
+        print(f"{node_count} articles, {out_count} links")
+
+
+    def build_dictionary(self):
+        """Write the perfect-hash title dictionary from titles.txt and redirects.tsv"""
+        key_count = build_title_dictionary(self.output_dir)
+        self.mark_done("dictionary", {"titles": key_count})
+        print(f"{key_count} titles in the dictionary")
+
+
+    def build_direction(self, direction, node_count):
+        """Turn one direction's buckets into CSR offsets plus a file of sorted, unique targets"""
+        counts = np.zeros(node_count + 1, dtype=np.int64)
+        total = 0
+
+        with open(self.work_path(f"{direction}_targets.bin"), "wb") as targets_file:
+            for i in range(self.buckets):
+                pairs = np.fromfile(self.work_path(f"{direction}_{i}.bin"), dtype=np.int32)
+                # Node ids are never negative, so (node, link) packs into one sortable int64
+                keys = (pairs[0::2].astype(np.int64) << 32) | pairs[1::2]
+                del pairs
+                keys.sort()
+                if len(keys):
+                    keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+
+                nodes, node_links = np.unique(keys >> 32, return_counts=True)
+                counts[nodes + 1] += node_links
+                (keys & 0xFFFFFFFF).astype(np.int32).tofile(targets_file)
+                total += len(keys)
+
+        return np.cumsum(counts).astype(np.int32), total
+
+
+    @staticmethod
+    def append_file(destination, path):
+        with open(path, "rb") as source:
+            shutil.copyfileobj(source, destination, 16 * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a Wikipedia Race link graph from SQL dumps")
+    parser.add_argument("dump_dir", help="Directory with page, redirect and pagelinks .sql.gz dumps")
+    parser.add_argument("output_dir", help="Directory for link_graph.bin, titles.txt and redirects.tsv")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--buckets", type=int, default=LINK_BUCKETS, help="Link spill buckets")
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        sys.exit("--workers must be at least 1")
+    DumpImporter(args.dump_dir, args.output_dir, args.workers, args.buckets).run()
@@ -0,0 +1,189 @@
+"""Precompute landmark distances for a link graph
+
+Usage: python landmark_oracle.py GRAPH_DIR [--landmarks 16]
+
+GRAPH_DIR is a directory written by dump_importer.py, the landmark files
+are written next to link_graph.bin.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from link_graph import LinkGraph
+
+
+UNREACHABLE = 255  # Stored for nodes a landmark never reaches
+MAX_DISTANCE = UNREACHABLE - 1
+LANDMARK_COUNT = 16
+MIN_CANDIDATE_LINKS = 5  # Race articles need at least this many links in and out
+SAMPLE_SIZE = 48  # Sources and targets tried per attempt, SAMPLE_SIZE ** 2 pairs
+DRAW_ATTEMPTS = 4
+
+LANDMARKS_FILE = "landmarks.npy"
+# Stored node-major so one article's distances to every landmark are contiguous
+FROM_LANDMARK_FILE = "landmark_from.npy"  # [node, landmark] = clicks from the landmark to node
+TO_LANDMARK_FILE = "landmark_to.npy"  # [node, landmark] = clicks from node to the landmark
+CANDIDATES_FILE = "landmark_candidates.npy"
+
+
+class LandmarkOracle:
+    """Distance bounds between any two articles from BFS distances to a few hubs
+
+    For a landmark L, d(L, t) <= d(L, s) + d(s, t) and d(s, L) <= d(s, t) + d(t, L)
+    give lower bounds, and going s -> L -> t gives an upper bound. Both are
+    a handful of uint8 lookups per landmark, so thousands of pairs can be
+    bounded at once with a few numpy operations.
+    """
+    def __init__(self, directory):
+        self.landmarks = np.load(os.path.join(directory, LANDMARKS_FILE))
+        self.from_landmark = np.load(os.path.join(directory, FROM_LANDMARK_FILE), mmap_mode="r")
+        self.to_landmark = np.load(os.path.join(directory, TO_LANDMARK_FILE), mmap_mode="r")
+        self.candidates = np.load(os.path.join(directory, CANDIDATES_FILE))
+        self.rng = np.random.default_rng()
+
+
+    @staticmethod
+    def exists(directory):
+        return all(
+            os.path.exists(os.path.join(directory, name))
+            for name in (LANDMARKS_FILE, FROM_LANDMARK_FILE, TO_LANDMARK_FILE, CANDIDATES_FILE)
+        )
+
+
+    def bounds(self, sources, targets):
+        """Lower and upper bounds on d(source, target), broadcast over node arrays
+
+        An upper bound of UNREACHABLE or more means no landmark connects the pair.
+        """
+        sources = np.asarray(sources)
+        targets = np.asarray(targets)
+        from_source = self.from_landmark[sources].astype(np.int16)
+        from_target = self.from_landmark[targets].astype(np.int16)
+        to_source = self.to_landmark[sources].astype(np.int16)
+        to_target = self.to_landmark[targets].astype(np.int16)
+
+        upper = (to_source + from_target).min(axis=-1)
+
+        # A bound only holds when the landmark actually reaches the subtracted node
+        from_source[from_source == UNREACHABLE] = UNREACHABLE * 2
+        to_target[to_target == UNREACHABLE] = UNREACHABLE * 2
+        lower = np.maximum(from_target - from_source, to_source - to_target).max(axis=-1)
+        return np.maximum(lower, 0), upper
+
+
+    def draw(self, min_distance, max_distance, source=None, target=None):
+        """Random (source, target) with a distance in the range, or None if none was found
+
+        Either end can be fixed to a node, the other is drawn from the candidates.
+        Pairs whose bounds both fall in the range are preferred, otherwise the
+        upper bound is trusted as the estimate.
+        """
+        if len(self.candidates) == 0:
+            return None
+
+        fallback = None
+        for _ in range(DRAW_ATTEMPTS):
+            sources = self.sample() if source is None else np.array([source])
+            targets = self.sample() if target is None else np.array([target])
+
+            lower, upper = self.bounds(sources[:, None], targets[None, :])
+            distinct = sources[:, None] != targets[None, :]
+            probable = distinct & (upper >= min_distance) & (upper <= max_distance)
+
+            matches = np.flatnonzero(probable & (lower >= min_distance))
+            if len(matches):
+                return self.pick(matches, sources, targets)
+            if fallback is None:
+                matches = np.flatnonzero(probable)
+                if len(matches):
+                    fallback = self.pick(matches, sources, targets)
+
+        return fallback
+
+
+    def pick(self, matches, sources, targets):
+        i, j = np.unravel_index(self.rng.choice(matches), (len(sources), len(targets)))
+        return int(sources[i]), int(targets[j])
+
+
+    def sample(self):
+        return self.candidates[self.rng.integers(len(self.candidates), size=SAMPLE_SIZE)]
+
+
+def bfs_distances(offsets, neighbours, source, node_count):
+    """uint8 BFS levels from source over one direction of a CSR graph"""
+    distances = np.full(node_count, UNREACHABLE, dtype=np.uint8)
+    distances[source] = 0
+    frontier = np.array([source], dtype=np.int64)
+    level = 0
+
+    while len(frontier):
+        level = min(level + 1, MAX_DISTANCE)
+
+        # Gather every link of the whole frontier in one go
+        starts = offsets[frontier]
+        counts = offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            break
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        reached = neighbours[positions]
+
+        frontier = np.unique(reached[distances[reached] == UNREACHABLE])
+        distances[frontier] = level
+
+    return distances
+
+
+def build_landmarks(graph, count=LANDMARK_COUNT):
+    """Pick the best-linked articles as landmarks and BFS both ways from each"""
+    out_offsets = np.frombuffer(graph.out_offsets, dtype=np.int32).astype(np.int64)
+    out_targets = np.frombuffer(graph.out_targets, dtype=np.int32)
+    in_offsets = np.frombuffer(graph.in_offsets, dtype=np.int32).astype(np.int64)
+    in_sources = np.frombuffer(graph.in_sources, dtype=np.int32)
+
+    out_degree = np.diff(out_offsets)
+    in_degree = np.diff(in_offsets)
+    count = min(count, graph.node_count)
+    landmarks = np.argsort(-(out_degree + in_degree), kind="stable")[:count]
+
+    n = graph.node_count
+    from_landmark = np.empty((count, n), dtype=np.uint8)
+    to_landmark = np.empty((count, n), dtype=np.uint8)
+    for i, landmark in enumerate(landmarks):
+        started = time.time()
+        from_landmark[i] = bfs_distances(out_offsets, out_targets, landmark, n)
+        to_landmark[i] = bfs_distances(in_offsets, in_sources, landmark, n)
+        print(f"Landmark {i + 1}/{count} (node {landmark}) done in {time.time() - started:.1f}s")
+
+    # Only articles with a way in and out are worth racing between
+    candidates = np.flatnonzero(
+        (out_degree >= MIN_CANDIDATE_LINKS)
+        & (in_degree >= MIN_CANDIDATE_LINKS)
+        & (from_landmark != UNREACHABLE).any(axis=0)
+        & (to_landmark != UNREACHABLE).any(axis=0)
+    ).astype(np.int32)
+
+    return landmarks.astype(np.int32), from_landmark, to_landmark, candidates
+
+
+def write_landmarks(directory, landmarks, from_landmark, to_landmark, candidates):
+    np.save(os.path.join(directory, LANDMARKS_FILE), landmarks)
+    np.save(os.path.join(directory, FROM_LANDMARK_FILE), np.ascontiguousarray(from_landmark.T))
+    np.save(os.path.join(directory, TO_LANDMARK_FILE), np.ascontiguousarray(to_landmark.T))
+    np.save(os.path.join(directory, CANDIDATES_FILE), candidates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute landmark distances for a link graph")
+    parser.add_argument("graph_dir", help="Directory written by dump_importer.py")
+    parser.add_argument("--landmarks", type=int, default=LANDMARK_COUNT, help="Number of hub articles to use")
+    args = parser.parse_args()
+
+    with LinkGraph(os.path.join(args.graph_dir, "link_graph.bin")) as graph:
+        landmarks, from_landmark, to_landmark, candidates = build_landmarks(graph, args.landmarks)
+        write_landmarks(args.graph_dir, landmarks, from_landmark, to_landmark, candidates)
+
+    print(f"Wrote {len(landmarks)} landmarks and {len(candidates)} candidate articles to {args.graph_dir}")
@@ -0,0 +1,163 @@
+from array import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+
+# File layout, all little-endian:
+#   header       magic, format version, node count, edge count
+#   out_offsets  int32[node_count + 1]  outgoing links of node i are out_targets[out_offsets[i]:out_offsets[i + 1]]
+#   out_targets  int32[edge_count]      sorted within each node
+#   in_offsets   int32[node_count + 1]  same again for incoming links
+#   in_sources   int32[edge_count]
+MAGIC = b"WRLG"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIII")
+INT32_SIZE = 4
+
+
+class LinkGraph:
+    """Read-only article link graph in CSR form, memory-mapped from disk
+
+    Every process that opens the same file shares one copy of it through
+    the page cache. Link lists are returned as memoryview slices of the
+    mapping, so lookups never copy or allocate per link.
+    """
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Link graph files can only be mapped on little-endian machines")
+
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.node_count, self.edge_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} link graph")
+
+        ints = memoryview(self.map)[HEADER.size:].cast("i")
+        n = self.node_count + 1
+        m = self.edge_count
+        self.out_offsets = ints[0:n]
+        self.out_targets = ints[n:n + m]
+        self.in_offsets = ints[n + m:2 * n + m]
+        self.in_sources = ints[2 * n + m:2 * n + 2 * m]
+
+
+    def out_links(self, node):
+        """Articles that node links to, sorted by id"""
+        return self.out_targets[self.out_offsets[node]:self.out_offsets[node + 1]]
+
+
+    def in_links(self, node):
+        """Articles that link to node, sorted by id"""
+        return self.in_sources[self.in_offsets[node]:self.in_offsets[node + 1]]
+
+
+    def out_degree(self, node):
+        return self.out_offsets[node + 1] - self.out_offsets[node]
+
+
+    def in_degree(self, node):
+        return self.in_offsets[node + 1] - self.in_offsets[node]
+
+
+    def has_link(self, source, target):
+        """Whether source links directly to target"""
+        start = self.out_offsets[source]
+        end = self.out_offsets[source + 1]
+        i = bisect.bisect_left(self.out_targets, target, start, end)
+        return i < end and self.out_targets[i] == target
+
+
+    def close(self):
+        # Views into the mapping have to be released before it can close
+        for name in ("out_offsets", "out_targets", "in_offsets", "in_sources"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_csr(node_count, sources, targets):
+    """Counting-sort parallel source/target arrays into CSR offsets and targets"""
+    offsets = array("i", bytes(INT32_SIZE * (node_count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+
+    position = array("i", offsets[:-1])
+    csr_targets = array("i", bytes(INT32_SIZE * len(targets)))
+    # The sort is stable, so targets stay in input order within each source
+    for source, target in zip(sources, targets):
+        csr_targets[position[source]] = target
+        position[source] += 1
+
+    return offsets, csr_targets
+
+
+def write_link_graph(path, node_count, links):
+    """Write (source, target) link pairs as a link graph file, duplicates and self-links are dropped"""
+    unique = sorted({(source, target) for source, target in links if source != target})
+    sources = array("i", (source for source, _ in unique))
+    targets = array("i", (target for _, target in unique))
+
+    out_offsets, out_targets = build_csr(node_count, sources, targets)
+    in_offsets, in_sources = build_csr(node_count, targets, sources)
+    write_csr(path, node_count, out_offsets, out_targets, in_offsets, in_sources)
+
+
+def write_csr(path, node_count, out_offsets, out_targets, in_offsets, in_sources):
+    """Write prebuilt CSR arrays (array("i") or anything with tobytes) to a link graph file"""
+    if sys.byteorder != "little":
+        raise RuntimeError("Link graph files can only be written on little-endian machines")
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, node_count, len(out_targets)))
+        for section in (out_offsets, out_targets, in_offsets, in_sources):
+            f.write(section.tobytes())
+
+
+def normalize_title(title):
+    """Canonical form of an article title, with spaces and a capital first letter"""
+    title = " ".join(title.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+class TitleIndex:
+    """Title and node lookups for the titles.txt and redirects.tsv written by dump_importer.py"""
+    def __init__(self, directory):
+        with open(os.path.join(directory, "titles.txt"), "r", encoding="utf-8") as f:
+            self.titles = f.read().split("\n")[:-1]
+        self.nodes = {title: node for node, title in enumerate(self.titles)}
+
+        redirects_path = os.path.join(directory, "redirects.tsv")
+        if os.path.exists(redirects_path):
+            with open(redirects_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    title, node = line.rstrip("\n").split("\t")
+                    self.nodes.setdefault(title, int(node))
+
+
+    def node(self, title):
+        """Node of an article or redirect title, or None if it is not in the graph"""
+        return self.nodes.get(normalize_title(title))
+
+
+    def title(self, node):
+        return self.titles[node]
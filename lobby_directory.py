@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+import time
+
+
+class MemoryLobbyDirectory:
+    """Lobby owners kept in this process, for a single node or for tests"""
+    def __init__(self):
+        self.owners = {}  # {lobby_code: node}
+        self.lock = threading.Lock()
+
+
+    def reserve(self, lobby_code, node):
+        """Claim a code for a node, False if another lobby already has it"""
+        with self.lock:
+            if lobby_code in self.owners:
+                return False
+            self.owners[lobby_code] = node
+            return True
+
+
+    def owner(self, lobby_code):
+        """Node that owns a lobby code, or None"""
+        with self.lock:
+            return self.owners.get(lobby_code)
+
+
+    def release(self, lobby_code, node):
+        """Give a code back, only if the node still owns it"""
+        with self.lock:
+            if self.owners.get(lobby_code) == node:
+                del self.owners[lobby_code]
+
+
+    def release_node(self, node):
+        """Forget every code of a node, used when it starts after a crash"""
+        with self.lock:
+            for lobby_code in [code for code, owner in self.owners.items() if owner == node]:
+                del self.owners[lobby_code]
+
+
+    def close(self):
+        pass
+
+
+class SqliteLobbyDirectory:
+    """Lobby owners in a SQLite database that every node opens
+
+    Stands in for a shared store: nodes on one host, or on hosts sharing
+    the file, see each other's lobbies. Reserving a code is a single
+    INSERT, so two nodes can never both get it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS lobby_owners (
+                lobby TEXT PRIMARY KEY,
+                node TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self.connection.commit()
+
+
+    def reserve(self, lobby_code, node):
+        """Claim a code for a node, False if another lobby already has it"""
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO lobby_owners (lobby, node, created) VALUES (?, ?, ?)",
+                (lobby_code, node, time.time())
+            )
+            return cursor.rowcount == 1
+
+
+    def owner(self, lobby_code):
+        """Node that owns a lobby code, or None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT node FROM lobby_owners WHERE lobby = ?", (lobby_code,)
+            ).fetchone()
+        return row[0] if row else None
+
+
+    def release(self, lobby_code, node):
+        """Give a code back, only if the node still owns it"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM lobby_owners WHERE lobby = ? AND node = ?", (lobby_code, node))
+
+
+    def release_node(self, node):
+        """Forget every code of a node, used when it starts after a crash"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM lobby_owners WHERE node = ?", (node,))
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def open_lobby_directory(spec):
+    """Directory for the --lobby-directory option: "memory" or "sqlite:PATH" """
+    if spec is None or spec == "memory":
+        return MemoryLobbyDirectory()
+    if spec.startswith("sqlite:"):
+        return SqliteLobbyDirectory(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown lobby directory {spec!r}, expected memory or sqlite:PATH")
+
+
+def parse_node_address(node):
+    """(host, port) of a node address written as HOST:PORT"""
+    host, _, port = node.rpartition(":")
+    return host, int(port)
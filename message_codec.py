@@ -0,0 +1,56 @@
+import json
+
+
+# Every message on the wire is one JSON object followed by a newline
+FRAME_DELIMITER = b"\n"
+MAX_FRAME_SIZE = 64 * 1024
+
+
+class FrameTooLargeError(ValueError):
+    """Raised when a peer sends a frame larger than the decoder allows"""
+
+
+def encode_message(message):
+    """Encode a message as a single newline-delimited JSON frame"""
+    # json.dumps escapes newlines inside strings, so the delimiter is unambiguous
+    return json.dumps(message, separators=(",", ":")).encode() + FRAME_DELIMITER
+
+
+class MessageDecoder:
+    """Incrementally splits a byte stream into JSON messages"""
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        self.scan_pos = 0  # Bytes of the buffer already searched for a delimiter
+
+
+    def feed(self, data):
+        """Add received bytes and return every message they complete"""
+        self.buffer += data
+        messages = []
+        start = 0
+
+        while True:
+            end = self.buffer.find(FRAME_DELIMITER, self.scan_pos)
+            if end == -1:
+                break
+
+            if end - start > self.max_frame_size:
+                raise FrameTooLargeError(f"Frame of {end - start} bytes exceeds {self.max_frame_size}")
+
+            frame = bytes(self.buffer[start:end])
+            if frame.strip():
+                messages.append(json.loads(frame))
+
+            start = end + 1
+            self.scan_pos = start
+
+        # Drop consumed frames once per read instead of once per message
+        if start:
+            del self.buffer[:start]
+        self.scan_pos = len(self.buffer)
+
+        if len(self.buffer) > self.max_frame_size:
+            raise FrameTooLargeError(f"Partial frame exceeds {self.max_frame_size} bytes")
+
+        return messages
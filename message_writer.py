@@ -0,0 +1,74 @@
+import queue
+import threading
+
+from message_codec import encode_message
+
+
+MAX_BATCH = 64  # Messages joined into one write when they queue up together
+
+
+class MessageWriter:
+    """Sends framed messages on a socket from its own thread
+
+    send() only queues, so callers on the UI thread never block on a full
+    socket buffer. The writer frames each message, joins whatever has
+    queued up into one sendall() and reports the first failure through
+    on_error, after which nothing more is sent.
+    """
+    def __init__(self, sock, on_error=None, max_batch=MAX_BATCH):
+        self.sock = sock
+        self.on_error = on_error
+        self.max_batch = max_batch
+        self.outbox = queue.Queue()
+        self.closed = threading.Event()
+        self.thread = None
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self.thread.start()
+        return self
+
+
+    def send(self, message):
+        """Queue a message, returns False if the writer has already stopped"""
+        if self.closed.is_set():
+            return False
+        self.outbox.put(message)
+        return True
+
+
+    def close(self):
+        """Stop after the messages already queued have been written"""
+        self.closed.set()
+        self.outbox.put(None)
+
+
+    def _run(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                return
+
+            # Whatever else is already waiting goes out in the same write
+            batch = [message]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    message = self.outbox.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    stop = True
+                    break
+                batch.append(message)
+
+            try:
+                self.sock.sendall(b"".join(encode_message(m) for m in batch))
+            except Exception as e:
+                self.closed.set()
+                if self.on_error:
+                    self.on_error(e)
+                return
+            if stop:
+                return
@@ -0,0 +1,130 @@
+import json
+import queue
+
+
+EVENT_PREFIX = "wikirace:navigate "
+
+# Greys out Wikipedia's search, safe to run more than once per document
+DISABLE_SEARCH_SCRIPT = """
+if (!window.__wikiRaceSearchDisabled) {
+    window.__wikiRaceSearchDisabled = true;
+    document.querySelectorAll('input[name="search"]').forEach(function(input) {
+        input.disabled = true;
+        input.style.opacity = '0.5';
+        input.placeholder = 'Search disabled during game';
+    });
+    var searchSuggestions = document.querySelector('.suggestions');
+    if (searchSuggestions) {
+        searchSuggestions.style.display = 'none';
+    }
+    document.querySelectorAll('button[type="submit"]').forEach(function(button) {
+        if (button.closest('form')?.querySelector('input[name="search"]')) {
+            button.disabled = true;
+        }
+    });
+}
+"""
+
+# Runs in every new document before the page's own scripts
+PAGE_HOOK = """() => {
+    function report() {
+        %s
+        console.debug("%s" + JSON.stringify({url: location.href, title: document.title}));
+    }
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", report);
+    } else {
+        report();
+    }
+    window.addEventListener("hashchange", report);
+}""" % (DISABLE_SEARCH_SCRIPT, EVENT_PREFIX)
+
+# One round trip for the fallback: disable search and read where the page is
+SNAPSHOT_SCRIPT = DISABLE_SEARCH_SCRIPT + "return [location.href, document.title];"
+
+
+class NavigationWatcher:
+    """Reports page changes in a WebDriver session
+
+    Where the driver speaks WebDriver BiDi, a preload script hooks every
+    document and pushes its URL and title through the console as soon as
+    it is parsed, so nothing has to be polled. Otherwise, or as a safety
+    net, snapshot() reads both with a single script call.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.events = queue.Queue()  # Filled from the BiDi connection's thread
+        self.hooked = False
+        self.preload_script = None
+        self.console_handler = None
+
+
+    def start(self):
+        """Install the page hook, returns whether navigation events will be pushed"""
+        try:
+            self.console_handler = self.driver.script.add_console_message_handler(self._on_console)
+            self.preload_script = self.driver.script.pin(PAGE_HOOK)
+            self.hooked = True
+        except Exception as e:
+            print(f"Navigation hook unavailable, polling instead: {e}")
+            self.stop()
+        return self.hooked
+
+
+    def stop(self):
+        try:
+            if self.preload_script is not None:
+                self.driver.script.unpin(self.preload_script)
+            if self.console_handler is not None:
+                self.driver.script.remove_console_message_handler(self.console_handler)
+        except:
+            pass
+        self.preload_script = None
+        self.console_handler = None
+        self.hooked = False
+
+
+    def poll(self, snapshot=True):
+        """(url, title) of every page change pushed since the last poll, oldest first
+
+        With snapshot, the page's current state is appended as well.
+        """
+        changes = []
+        while True:
+            try:
+                changes.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        if snapshot:
+            try:
+                url, title = self.driver.execute_script(SNAPSHOT_SCRIPT)
+                changes.append((url, title))
+            except Exception as e:
+                print(f"Could not read page: {e}")
+        return changes
+
+
+    def clear(self):
+        """Forget events still queued from earlier pages"""
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+    def window_count(self):
+        return len(self.driver.window_handles)
+
+
+    def _on_console(self, entry):
+        text = getattr(entry, "text", None)
+        if not isinstance(text, str) or not text.startswith(EVENT_PREFIX):
+            return
+        try:
+            page = json.loads(text[len(EVENT_PREFIX):])
+            # Blank pages between rounds are not part of any game
+            if page["url"].startswith("http"):
+                self.events.put((page["url"], page["title"]))
+        except Exception:
+            pass
@@ -0,0 +1,396 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import queue
+import re
+import threading
+import urllib.parse
+
+
+WIKIPEDIA_URL = "https://en.wikipedia.org"
+MEMORY_LIMIT = 64 * 1024 * 1024  # Bytes of pages kept in memory
+DISK_LIMIT = 512 * 1024 * 1024  # Bytes of pages kept in the optional disk tier
+PREFETCH_WORKERS = 4
+PREFETCH_LINKS = 8  # Links fetched ahead from every article that is opened
+UPSTREAM_CONNECTIONS = 8  # Idle keep-alive connections to upstream kept for reuse
+FETCH_TIMEOUT = 10.0
+USER_AGENT = "WikipediaRace/1.0 (page prefetch)"
+FORWARDED_REQUEST_HEADERS = (  # Let the browser revalidate what it cached and send forms and API calls
+    "If-None-Match", "If-Modified-Since", "Content-Type", "Accept", "Origin", "Referer"
+)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")  # Safe to retry on a fresh connection
+FORWARDED_RESPONSE_HEADERS = ("Content-Type", "Cache-Control", "ETag", "Expires", "Last-Modified", "Location")
+
+CONTENT_START = b'id="mw-content-text"'
+ARTICLE_LINK = re.compile(rb'href="(/wiki/[^"#?:]+)"')  # Links with a colon are other namespaces
+
+
+def is_article_path(path):
+    """Whether a path is an article page, the only pages that are cached"""
+    if not path.startswith("/wiki/") or "?" in path:
+        return False
+    # Special:Random and the other namespaces have a colon, the few articles with one just aren't cached
+    return ":" not in urllib.parse.unquote(path[len("/wiki/"):])
+
+
+class PageCache:
+    """Size-capped LRU of fetched pages, with an optional disk tier underneath
+
+    Pages pushed out of memory are written to disk_dir if one is given and
+    promoted back into memory when they are used again.
+    """
+    def __init__(self, memory_limit=MEMORY_LIMIT, disk_dir=None, disk_limit=DISK_LIMIT):
+        self.memory_limit = memory_limit
+        self.disk_dir = disk_dir
+        self.disk_limit = disk_limit
+
+        self.memory = OrderedDict()  # {key: (content_type, body)}
+        self.memory_size = 0
+        self.disk = OrderedDict()  # {key: size}
+        self.disk_size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+
+    def get(self, key):
+        """Return (content_type, body) for a cached page, or None"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry
+            on_disk = key in self.disk
+
+        entry = self._read_disk(key) if on_disk else None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self.put(key, *entry)
+        return entry
+
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.memory or key in self.disk
+
+
+    def put(self, key, content_type, body):
+        """Store a page, spilling the least recently used ones to disk when memory is full"""
+        spilled = []
+        with self.lock:
+            previous = self.memory.pop(key, None)
+            if previous is not None:
+                self.memory_size -= len(previous[1])
+            self.memory[key] = (content_type, body)
+            self.memory_size += len(body)
+            while self.memory_size > self.memory_limit and len(self.memory) > 1:
+                old_key, old_entry = self.memory.popitem(last=False)
+                self.memory_size -= len(old_entry[1])
+                spilled.append((old_key, old_entry))
+
+        if self.disk_dir:
+            for old_key, old_entry in spilled:
+                self._write_disk(old_key, old_entry)
+
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_pages": len(self.memory),
+                "memory_bytes": self.memory_size,
+                "disk_pages": len(self.disk),
+                "disk_bytes": self.disk_size
+            }
+
+
+    def disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+
+    def _write_disk(self, key, entry):
+        content_type, body = entry
+        try:
+            with open(self.disk_path(key), "wb") as f:
+                f.write(content_type.encode("utf-8") + b"\n" + body)
+        except Exception as e:
+            print(f"Failed to write cached page: {e}")
+            return
+
+        removed = []
+        with self.lock:
+            self.disk_size -= self.disk.pop(key, 0)
+            self.disk[key] = len(body)
+            self.disk_size += len(body)
+            while self.disk_size > self.disk_limit and len(self.disk) > 1:
+                old_key, size = self.disk.popitem(last=False)
+                self.disk_size -= size
+                removed.append(old_key)
+        for old_key in removed:
+            try:
+                os.remove(self.disk_path(old_key))
+            except:
+                pass
+
+
+    def _read_disk(self, key):
+        try:
+            with open(self.disk_path(key), "rb") as f:
+                content_type, body = f.read().split(b"\n", 1)
+        except Exception:
+            with self.lock:
+                self.disk_size -= self.disk.pop(key, 0)
+            return None
+        with self.lock:
+            self.disk_size -= self.disk.pop(key, 0)
+        try:
+            os.remove(self.disk_path(key))
+        except:
+            pass
+        return content_type.decode("utf-8"), body
+
+
+class PageCacheProxy:
+    """Local HTTP front for Wikipedia that serves articles from a PageCache
+
+    The browser is pointed at base_url instead of Wikipedia. Every article
+    it opens is fetched (or served from cache) and its first links are
+    fetched ahead in the background, so the next click is usually a hit.
+    Anything that isn't an article is passed straight through with its
+    cache headers, so the browser keeps its own copy of styles and scripts.
+    Upstream requests reuse a small pool of keep-alive connections.
+    """
+    def __init__(self, upstream=WIKIPEDIA_URL, cache=None, workers=PREFETCH_WORKERS,
+                 prefetch_links=PREFETCH_LINKS, port=0):
+        self.upstream = upstream.rstrip("/")
+        parts = urllib.parse.urlsplit(self.upstream)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.upstream_host = parts.netloc
+        self.upstream_path = parts.path
+        self.connections = queue.LifoQueue(maxsize=UPSTREAM_CONNECTIONS)
+        self.cache = cache if cache is not None else PageCache()
+        self.prefetch_links = prefetch_links
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.prefetched = 0
+
+        proxy = self
+        class Handler(ProxyRequestHandler):
+            pass
+        Handler.proxy = proxy
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+    def fetch(self, path, request_headers=None, method="GET", body=None):
+        """Send a request upstream, returns (status, headers, body)
+
+        headers only holds FORWARDED_RESPONSE_HEADERS, with redirects to
+        upstream rewritten to stay on the proxy.
+        """
+        headers = {"User-Agent": USER_AGENT, **(request_headers or {})}
+        idempotent = method in IDEMPOTENT_METHODS
+        for attempt in range(2):
+            # Anything else must not be sent twice, so it never goes over an idle connection
+            connection = self._connection(fresh=attempt > 0 or not idempotent)
+            try:
+                connection.request(method, self.upstream_path + path, body=body, headers=headers)
+                response = connection.getresponse()
+                response_body = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                # Upstream may have closed an idle connection, retry once on a new one
+                if attempt or not idempotent:
+                    raise
+                continue
+            self._release(connection, response)
+            break
+
+        forwarded = {}
+        for name in FORWARDED_RESPONSE_HEADERS:
+            value = response.getheader(name)
+            if value is not None:
+                forwarded[name] = value
+        location = forwarded.get("Location", "")
+        if location.startswith(self.upstream + "/"):
+            forwarded["Location"] = location[len(self.upstream):]
+        if method == "HEAD" and response.getheader("Content-Length") is not None:
+            forwarded["Content-Length"] = response.getheader("Content-Length")
+        forwarded.setdefault("Content-Type", "text/html")
+        return response.status, forwarded, response_body
+
+
+    def _connection(self, fresh=False):
+        if not fresh:
+            try:
+                return self.connections.get_nowait()
+            except queue.Empty:
+                pass
+        return self.connection_class(self.upstream_host, timeout=FETCH_TIMEOUT)
+
+
+    def _release(self, connection, response):
+        if response.will_close:
+            connection.close()
+            return
+        try:
+            self.connections.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+    def article(self, path):
+        """(status, headers, body) of an article, from cache when possible"""
+        entry = self.cache.get(path)
+        if entry is not None:
+            content_type, body = entry
+            status = 200
+            headers = {"Content-Type": content_type}
+        else:
+            status, headers, body = self.fetch(path)
+            if status == 200:
+                self.cache.put(path, headers["Content-Type"], body)
+
+        if status == 200:
+            self.prefetch_from(path, body)
+        return status, headers, body
+
+
+    def prefetch_from(self, path, body):
+        """Queue the first few article links of a page that aren't cached yet"""
+        content = body[body.find(CONTENT_START):] if CONTENT_START in body else body
+        queued = 0
+        seen = {path}
+        for match in ARTICLE_LINK.finditer(content):
+            if queued >= self.prefetch_links:
+                break
+            link = match.group(1).decode("utf-8", "replace")
+            if link in seen:
+                continue
+            seen.add(link)
+            queued += 1
+            if link in self.cache:
+                continue
+            with self.in_flight_lock:
+                if link in self.in_flight:
+                    continue
+                self.in_flight.add(link)
+            self.pool.submit(self._prefetch, link)
+
+
+    def _prefetch(self, path):
+        try:
+            status, headers, body = self.fetch(path)
+            if status == 200:
+                self.cache.put(path, headers["Content-Type"], body)
+                with self.in_flight_lock:
+                    self.prefetched += 1
+        except Exception as e:
+            print(f"Prefetch of {path} failed: {e}")
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.discard(path)
+
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    proxy = None
+    protocol_version = "HTTP/1.1"
+
+
+    def do_GET(self):
+        self.proxy_request("GET")
+
+
+    def do_HEAD(self):
+        self.proxy_request("HEAD")
+
+
+    def do_POST(self):
+        self.proxy_request("POST")
+
+
+    def do_PUT(self):
+        self.proxy_request("PUT")
+
+
+    def do_DELETE(self):
+        self.proxy_request("DELETE")
+
+
+    def do_PATCH(self):
+        self.proxy_request("PATCH")
+
+
+    def do_OPTIONS(self):
+        self.proxy_request("OPTIONS")
+
+
+    def proxy_request(self, method):
+        """Serve articles from the cache, pass every other request through to upstream"""
+        path = self.path.split("#", 1)[0]
+        try:
+            if method == "GET" and is_article_path(path):
+                status, headers, body = self.proxy.article(path)
+            else:
+                request_headers = {
+                    name: self.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in self.headers
+                }
+                length = int(self.headers.get("Content-Length") or 0)
+                request_body = self.rfile.read(length) if length else None
+                status, headers, body = self.proxy.fetch(path, request_headers, method, request_body)
+        except Exception as e:
+            print(f"Proxy {method} request for {path} failed: {e}")
+            status, headers, body = 502, {"Content-Type": "text/plain"}, b"Upstream request failed"
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304 and "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304 and method != "HEAD":
+            self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,117 @@
+from array import array
+
+
+class ShortestPathSolver:
+    """Bidirectional BFS over a LinkGraph
+
+    All per-node state lives in arrays allocated once per solver. Each
+    query stamps nodes with a new generation number instead of clearing
+    the arrays, so a query allocates nothing proportional to the graph.
+    A solver is not thread-safe, give each thread its own.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        n = graph.node_count
+        self.forward_seen = array("i", bytes(4 * n))
+        self.backward_seen = array("i", bytes(4 * n))
+        self.forward_parent = array("i", bytes(4 * n))
+        self.backward_parent = array("i", bytes(4 * n))
+        self.forward_queue = array("i", bytes(4 * n))
+        self.backward_queue = array("i", bytes(4 * n))
+        self.generation = 0
+
+
+    def next_generation(self):
+        self.generation += 1
+        if self.generation >= 2 ** 31 - 1:
+            # Stamps would wrap around, start over from clean arrays
+            for seen in (self.forward_seen, self.backward_seen):
+                seen[:] = array("i", bytes(4 * len(seen)))
+            self.generation = 1
+        return self.generation
+
+
+    def distance(self, source, target, max_distance=None):
+        """Number of clicks on the shortest path, or None if target is unreachable"""
+        distance, _ = self.shortest_path(source, target, max_distance)
+        return distance
+
+
+    def shortest_path(self, source, target, max_distance=None):
+        """Return (distance, [source, ..., target]) or (None, None) if there is no path"""
+        if source == target:
+            return 0, [source]
+
+        generation = self.next_generation()
+        forward_seen = self.forward_seen
+        backward_seen = self.backward_seen
+        forward_parent = self.forward_parent
+        backward_parent = self.backward_parent
+        forward_queue = self.forward_queue
+        backward_queue = self.backward_queue
+
+        forward_seen[source] = generation
+        forward_parent[source] = -1
+        forward_queue[0] = source
+        forward_start, forward_end, forward_depth = 0, 1, 0
+
+        backward_seen[target] = generation
+        backward_parent[target] = -1
+        backward_queue[0] = target
+        backward_start, backward_end, backward_depth = 0, 1, 0
+
+        while forward_start < forward_end and backward_start < backward_end:
+            if max_distance is not None and forward_depth + backward_depth >= max_distance:
+                return None, None
+
+            # Grow whichever side has the smaller frontier by one whole level.
+            # The first node both sides have seen is on a shortest path.
+            if forward_end - forward_start <= backward_end - backward_start:
+                out_links = self.graph.out_links
+                end = forward_end
+                for i in range(forward_start, forward_end):
+                    node = forward_queue[i]
+                    for link in out_links(node):
+                        if forward_seen[link] == generation:
+                            continue
+                        forward_seen[link] = generation
+                        forward_parent[link] = node
+                        if backward_seen[link] == generation:
+                            return forward_depth + 1 + backward_depth, self.build_path(link)
+                        forward_queue[end] = link
+                        end += 1
+                forward_start, forward_end = forward_end, end
+                forward_depth += 1
+            else:
+                in_links = self.graph.in_links
+                end = backward_end
+                for i in range(backward_start, backward_end):
+                    node = backward_queue[i]
+                    for link in in_links(node):
+                        if backward_seen[link] == generation:
+                            continue
+                        backward_seen[link] = generation
+                        backward_parent[link] = node
+                        if forward_seen[link] == generation:
+                            return forward_depth + backward_depth + 1, self.build_path(link)
+                        backward_queue[end] = link
+                        end += 1
+                backward_start, backward_end = backward_end, end
+                backward_depth += 1
+
+        return None, None
+
+
+    def build_path(self, meeting):
+        path = []
+        node = meeting
+        while node != -1:
+            path.append(node)
+            node = self.forward_parent[node]
+        path.reverse()
+
+        node = self.backward_parent[meeting]
+        while node != -1:
+            path.append(node)
+            node = self.backward_parent[node]
+        return path
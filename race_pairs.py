@@ -0,0 +1,228 @@
+"""Generate a pool of vetted race pairs for a link graph
+
+Usage: python race_pairs.py GRAPH_DIR [--pairs 200000] [--workers N]
+
+GRAPH_DIR is a directory written by dump_importer.py. Random pairs of
+well-linked articles are solved exactly and only winnable, non-trivial
+ones are kept, grouped by shortest path length and by how popular the
+destination is. The pool is written to GRAPH_DIR/race_pairs.bin.
+"""
+import argparse
+import bisect
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+
+import numpy as np
+
+from link_graph import LinkGraph
+from path_solver import ShortestPathSolver
+
+
+# File layout, all little-endian:
+#   header   magic, format version, max distance, popularity tiers, pair count
+#   offsets  uint32[(max_distance + 1) * tiers + 1]  pairs of key d * tiers + tier are
+#            pairs[offsets[key]:offsets[key + 1]]
+#   pairs    int32[pair_count * 2]                   source, target
+MAGIC = b"WRRP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIIII")
+
+PAIR_COUNT = 200000
+MIN_DISTANCE = 2  # Anything closer is a single click
+MAX_DISTANCE = 8  # Pairs further apart than this are dropped as unwinnable
+POPULARITY_TIERS = 3  # Destinations split into obscure, known and popular by incoming links
+MIN_LINKS = 5  # Articles need at least this many links in and out to be raced between
+ATTEMPTS_PER_TASK = 500
+TASKS_PER_WORKER = 4
+
+worker_state = {}
+
+
+class RacePairPool:
+    """Memory-mapped race pair file, draws are O(1) for any range of distances"""
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Race pair files can only be mapped on little-endian machines")
+
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.max_distance, self.tiers, self.pair_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} race pair file")
+
+        key_count = (self.max_distance + 1) * self.tiers
+        offsets_size = 4 * (key_count + 1)
+        self.offsets = memoryview(self.map)[HEADER.size:HEADER.size + offsets_size].cast("I")
+        self.pairs = memoryview(self.map)[HEADER.size + offsets_size:].cast("i")
+
+
+    def __len__(self):
+        return self.pair_count
+
+
+    def count(self, distance, tier=None):
+        """Number of pairs at a distance, optionally only for one popularity tier"""
+        if distance > self.max_distance:
+            return 0
+        if tier is None:
+            return self.offsets[(distance + 1) * self.tiers] - self.offsets[distance * self.tiers]
+        key = distance * self.tiers + tier
+        return self.offsets[key + 1] - self.offsets[key]
+
+
+    def draw(self, min_distance=0, max_distance=None, tier=None):
+        """Random (source, target, distance) with the distance in range, or None if there is none"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if min_distance > max_distance:
+            return None
+
+        if tier is None:
+            # Keys are ordered by distance first, so the whole range is one slice
+            start = self.offsets[min_distance * self.tiers]
+            end = self.offsets[(max_distance + 1) * self.tiers]
+        else:
+            # One slice per distance, picked in proportion to its size
+            counts = [self.count(distance, tier) for distance in range(min_distance, max_distance + 1)]
+            if not sum(counts):
+                return None
+            distance = random.choices(range(min_distance, max_distance + 1), weights=counts)[0]
+            key = distance * self.tiers + tier
+            start = self.offsets[key]
+            end = self.offsets[key + 1]
+
+        if start == end:
+            return None
+        i = random.randrange(start, end)
+        key = bisect.bisect_right(self.offsets, i) - 1
+        return self.pairs[2 * i], self.pairs[2 * i + 1], key // self.tiers
+
+
+    def close(self):
+        for name in ("offsets", "pairs"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+def candidate_nodes(graph):
+    """Articles with enough links in and out, and their incoming link counts"""
+    out_degree = np.diff(np.frombuffer(graph.out_offsets, dtype=np.int32))
+    in_degree = np.diff(np.frombuffer(graph.in_offsets, dtype=np.int32))
+    candidates = np.flatnonzero((out_degree >= MIN_LINKS) & (in_degree >= MIN_LINKS)).astype(np.int32)
+    return candidates, in_degree[candidates]
+
+
+def init_worker(graph_path, tier_thresholds, min_distance, max_distance):
+    graph = LinkGraph(graph_path)
+    worker_state["graph"] = graph
+    worker_state["solver"] = ShortestPathSolver(graph)
+    worker_state["candidates"], _ = candidate_nodes(graph)
+    worker_state["tier_thresholds"] = tier_thresholds
+    worker_state["min_distance"] = min_distance
+    worker_state["max_distance"] = max_distance
+
+
+def solve_batch(seed):
+    """Solve ATTEMPTS_PER_TASK random pairs and return the vetted ones as (key, source, target) bytes"""
+    graph = worker_state["graph"]
+    solver = worker_state["solver"]
+    candidates = worker_state["candidates"]
+    thresholds = worker_state["tier_thresholds"]
+    min_distance = worker_state["min_distance"]
+    max_distance = worker_state["max_distance"]
+    tiers = len(thresholds) + 1
+
+    rng = np.random.default_rng(seed)
+    picks = candidates[rng.integers(len(candidates), size=(ATTEMPTS_PER_TASK, 2))].tolist()
+
+    found = []
+    for source, target in picks:
+        if source == target:
+            continue
+        distance = solver.distance(source, target, max_distance)
+        if distance is None or distance < min_distance:
+            continue
+        tier = bisect.bisect_right(thresholds, graph.in_degree(target))
+        found.extend((distance * tiers + tier, source, target))
+    return np.array(found, dtype=np.int32).tobytes()
+
+
+def generate_race_pairs(graph_dir, pair_count=PAIR_COUNT, workers=None,
+                        min_distance=MIN_DISTANCE, max_distance=MAX_DISTANCE, tiers=POPULARITY_TIERS):
+    """Solve random pairs on a process pool until pair_count distinct vetted ones are found"""
+    graph_path = os.path.join(graph_dir, "link_graph.bin")
+    workers = workers or os.cpu_count() or 1
+
+    with LinkGraph(graph_path) as graph:
+        candidates, in_degree = candidate_nodes(graph)
+    if len(candidates) < 2:
+        raise ValueError(f"Only {len(candidates)} articles have {MIN_LINKS} links in and out")
+    # Equal-sized popularity tiers by the destination's incoming links
+    tier_thresholds = [int(np.quantile(in_degree, i / tiers)) for i in range(1, tiers)]
+
+    records = np.empty((0, 3), dtype=np.int32)
+    seed = random.randrange(2 ** 32)
+    stale_rounds = 0
+    with multiprocessing.Pool(workers, init_worker, (graph_path, tier_thresholds, min_distance, max_distance)) as pool:
+        while len(records) < pair_count and stale_rounds < 3:
+            seeds = [(seed, n) for n in range(workers * TASKS_PER_WORKER)]
+            seed += 1
+            batches = [np.frombuffer(batch, dtype=np.int32) for batch in pool.map(solve_batch, seeds)]
+            found = np.concatenate([records.ravel(), *batches]).reshape(-1, 3)
+
+            # Keep the first occurrence of every (source, target)
+            pair_ids = found[:, 1].astype(np.int64) << 32 | found[:, 2].astype(np.int64)
+            _, first = np.unique(pair_ids, return_index=True)
+            unique = found[np.sort(first)]
+            stale_rounds = stale_rounds + 1 if len(unique) == len(records) else 0
+            records = unique
+            print(f"{min(len(records), pair_count)}/{pair_count} pairs")
+
+    records = records[:pair_count]
+    write_race_pairs(os.path.join(graph_dir, "race_pairs.bin"), records, max_distance, tiers)
+    return records
+
+
+def write_race_pairs(path, records, max_distance, tiers):
+    """Write (key, source, target) records as a race pair file"""
+    if sys.byteorder != "little":
+        raise RuntimeError("Race pair files can only be written on little-endian machines")
+
+    records = records[np.argsort(records[:, 0], kind="stable")]
+    counts = np.bincount(records[:, 0], minlength=(max_distance + 1) * tiers)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.uint32)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, max_distance, tiers, len(records)))
+        f.write(offsets.tobytes())
+        f.write(np.ascontiguousarray(records[:, 1:]).tobytes())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate vetted race pairs for a link graph")
+    parser.add_argument("graph_dir", help="Directory written by dump_importer.py")
+    parser.add_argument("--pairs", type=int, default=PAIR_COUNT, help="Number of pairs to keep")
+    parser.add_argument("--workers", type=int, default=None, help="Solver processes (default: CPU count)")
+    parser.add_argument("--min-distance", type=int, default=MIN_DISTANCE)
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE)
+    args = parser.parse_args()
+
+    if args.workers is not None and args.workers < 1:
+        sys.exit("--workers must be at least 1")
+    generate_race_pairs(args.graph_dir, args.pairs, args.workers, args.min_distance, args.max_distance)
+
+    pool = RacePairPool(os.path.join(args.graph_dir, "race_pairs.bin"))
+    for distance in range(args.min_distance, args.max_distance + 1):
+        print(f"Distance {distance}: {pool.count(distance)} pairs")
+    pool.close()
@@ -1,54 +1,171 @@
 import argparse
-import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from mediawikiapi import MediaWikiAPI
 import os
 import random
+import signal
 import socket
 import string
+import sys
 import time
 import threading
 
+from article_pool import RandomArticlePool
+from link_graph import LinkGraph, TitleIndex
+from lobby_directory import MemoryLobbyDirectory, open_lobby_directory, parse_node_address
+from message_codec import MessageDecoder, encode_message
+from path_solver import ShortestPathSolver
+from stats_store import JsonStatsStore, SqliteStatsStore
+from summary_cache import SummaryCache
+from title_dictionary import open_title_dictionary
+from title_resolver import TitleResolver
+from timer_scheduler import TimerScheduler
+
 
 # Server configuration
 TCP_PORT = int(os.environ.get("PORT", 5555))
 BUFFER_SIZE = 4096
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_PATH = os.environ.get("STATS_PATH", os.path.join(SERVER_DIR, "wiki_race_stats.db"))
+ASYNC_BACKLOG = 4096
+MAX_WRITE_BUFFER = 256 * 1024  # Drop clients that stop reading once this much output is queued
+GAME_START_WORKERS = 4
+REQUEST_WORKERS = 4  # Threads for joins and other quick client requests, never shared with game starts
+RESOLVE_TIMEOUT = 10.0  # Seconds start_game waits for article lookups still running
+DIFFICULTY_DISTANCES = {  # Shortest path length range for each lobby difficulty
+    "easy": (2, 3),
+    "medium": (4, 4),
+    "hard": (5, 7)
+}
 
 #PLAYER_STATS_FILE = "wiki_race_player_stats.json"
 
 
+def open_stats_store(backend="sqlite", path=None):
+    """Stats store for the --stats-backend and --stats-path options"""
+    if backend == "json":
+        return JsonStatsStore(path or ".")
+    return SqliteStatsStore(path or STATS_PATH)
+
+
 class WikiRaceServer:
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, stats_store=None, link_graph_dir=None, lobby_directory=None,
+                 node_address=None):
         self.lobbies = {}  # {lobby_code: LobbyData}
         self.server_socket = None
         self.running = True
         self.mediawiki = MediaWikiAPI()
+        self.title_resolver = TitleResolver()
+        self.summaries = SummaryCache()
+        self.article_pool = RandomArticlePool()
         self.headless = headless
         self.player_stats = {}
+        self.stats_store = stats_store if stats_store is not None else SqliteStatsStore(STATS_PATH)
+        self.scheduler = TimerScheduler()
+        self.worker_pool = ThreadPoolExecutor(max_workers=GAME_START_WORKERS)  # Game starts, which wait on MediaWiki
+        self.request_pool = ThreadPoolExecutor(max_workers=REQUEST_WORKERS)
+
+        # Which node owns each lobby code, shared when several servers sit behind one endpoint
+        self.lobby_directory = lobby_directory if lobby_directory is not None else MemoryLobbyDirectory()
+        self.node_address = node_address or self.default_node_address()
+
+        # Optional local link graph, used to compute each race's par
+        self.link_graph = None
+        self.title_index = None
+        self.path_solver = None
+        self.landmark_oracle = None
+        self.race_pairs = None
+        self.par_pool = ThreadPoolExecutor(max_workers=1)  # The solver's arrays are not thread-safe
+        if link_graph_dir:
+            self.load_link_graph(link_graph_dir)
+
+
+    def load_link_graph(self, directory):
+        """Load a link graph built by dump_importer.py"""
+        # These need numpy, which a server without a link graph does not
+        from landmark_oracle import LandmarkOracle
+        from race_pairs import RacePairPool
+
+        print(f"Loading link graph from {directory}...")
+        self.link_graph = LinkGraph(os.path.join(directory, "link_graph.bin"))
+        # The perfect-hash dictionary folds case and redirects without loading every title
+        self.title_index = open_title_dictionary(os.path.join(directory, "title_dictionary.bin"))
+        if self.title_index is None:
+            print("No title dictionary found, loading titles into memory")
+            self.title_index = TitleIndex(directory)
+        self.path_solver = ShortestPathSolver(self.link_graph)
+        print(f"Loaded {self.link_graph.node_count} articles and {self.link_graph.edge_count} links")
+
+        if LandmarkOracle.exists(directory):
+            self.landmark_oracle = LandmarkOracle(directory)
+            print(f"Loaded {len(self.landmark_oracle.landmarks)} landmarks, difficulty lobbies enabled")
+        else:
+            print("No landmarks found, run landmark_oracle.py to enable difficulty lobbies")
 
+        race_pairs_path = os.path.join(directory, "race_pairs.bin")
+        if os.path.exists(race_pairs_path):
+            self.race_pairs = RacePairPool(race_pairs_path)
+            print(f"Loaded {len(self.race_pairs)} race pairs")
+        else:
+            print("No race pairs found, run race_pairs.py to race between vetted articles")
+
+
+    def compute_par(self, start_article, end_article):
+        """Shortest click count and an example path between two articles, or None if unknown"""
+        start = self.title_index.node(start_article)
+        end = self.title_index.node(end_article)
+        if start is None or end is None:
+            return None
+
+        distance, path = self.path_solver.shortest_path(start, end)
+        if distance is None:
+            return None
+        return {
+            "clicks": distance,
+            "path": [self.title_index.title(node) for node in path]
+        }
 
-    def load_player_stats(self, lobby):
-        """Load persistent player stats from disk"""
-        if not os.path.exists(f"{lobby}.json"):
-            return {}
 
-        try:
-            with open(f"{lobby}.json", "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    return data
-        except Exception as e:
-            print(f"Failed to load stats file: {e}")
+    def supports_difficulty(self):
+        return self.race_pairs is not None or self.landmark_oracle is not None
 
-        return {}
 
+    def pick_missing_articles(self, difficulty, requests):
+        """Fill requests up to [end, start] from the race pairs or landmarks, at the difficulty's distance"""
+        min_distance, max_distance = DIFFICULTY_DISTANCES.get(difficulty, (0, None))
+        if not requests and self.race_pairs is not None:
+            pair = self.race_pairs.draw(min_distance, max_distance)
+            if pair is not None:
+                return [self.title_index.title(pair[1]), self.title_index.title(pair[0])]
 
-    def save_player_stats(self, lobby):
-        """Save persistent player stats to disk"""
-        try:
-            with open(f"{lobby}.json", "w", encoding="utf-8") as f:
-                json.dump(self.player_stats[lobby], f, indent=2)
-        except Exception as e:
-            print(f"Failed to save stats file: {e}")
+        if difficulty is None or self.landmark_oracle is None:
+            return requests
+
+        if not requests:
+            pair = self.landmark_oracle.draw(min_distance, max_distance)
+            if pair is None:
+                return requests
+            return [self.title_index.title(pair[1]), self.title_index.title(pair[0])]
+
+        # The one requested article is the destination, draw a start for it
+        end = self.title_index.node(requests[0])
+        if end is None:
+            return requests
+        pair = self.landmark_oracle.draw(min_distance, max_distance, target=end)
+        if pair is None:
+            return requests
+        return [requests[0], self.title_index.title(pair[0])]
+
+
+    def load_player_stats(self, lobby):
+        """Load persistent player stats from the stats store"""
+        return self.stats_store.load(lobby)
+
+
+    def save_player_stats(self, lobby, players=None):
+        """Queue changed player stats (or the whole lobby) for the stats store"""
+        self.stats_store.save(lobby, self.player_stats[lobby], players)
 
 
     def ensure_player_stats(self, player_name, lobby):
@@ -66,27 +183,55 @@ class WikiRaceServer:
             }
 
     def reset_player_stats(self, lobby):
-        """Delete the stats JSON file and clear in-memory stats"""
+        """Clear a lobby's stats in memory and in the stats store"""
         print("Resetting player stats...")
         self.player_stats[lobby] = {}
-
-        try:
-            if os.path.exists(f"{lobby}.json"):
-                os.remove(f"{lobby}.json")
-                print(f"Deleted {f"{lobby}.json"}")
-        except Exception:
-            print(f"Failed to delete stats file: {f"{lobby}.json"}")
+        self.stats_store.reset(lobby)
 
 
     def generate_lobby_code(self):
-        """Generate a unique 4-character lobby code"""
+        """Generate a unique 4-character lobby code, reserved in the lobby directory"""
         while True:
             code = "".join(random.choices(string.ascii_uppercase + string.digits, k=4))
-            if code not in self.lobbies:
+            if code in self.lobbies or not self.owns_code(code):
+                continue
+            if self.lobby_directory.reserve(code, self.node_address):
                 return code
 
 
-    def get_local_ip(self):
+    @staticmethod
+    def default_node_address():
+        return f"{WikiRaceServer.get_local_ip()}:{TCP_PORT}"
+
+
+    def release_stale_lobbies(self):
+        """Drop codes this node still holds in the directory from a run that did not clean up"""
+        self.lobby_directory.release_node(self.node_address)
+
+
+    def owns_code(self, lobby_code):
+        """Whether this server may create a lobby with a code"""
+        return True
+
+
+    def redirect(self, client_socket, lobby_code, node):
+        """Point a client at the node that owns its lobby"""
+        try:
+            host, port = parse_node_address(node)
+        except ValueError:
+            print(f"Lobby {lobby_code} has an invalid owner {node!r}")
+            return
+        print(f"Redirecting join for lobby {lobby_code} to {node}")
+        self.send_message(client_socket, {
+            "type": "redirect",
+            "lobby_code": lobby_code,
+            "host": host,
+            "port": port
+        })
+
+
+    @staticmethod
+    def get_local_ip():
         """Get the local IP address"""
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -98,50 +243,164 @@ class WikiRaceServer:
             return "127.0.0.1"
 
 
-    def create_lobby(self):
-        """Create a new lobby"""
-        lobby_code = self.generate_lobby_code()
+    def create_lobby(self, difficulty=None, lobby_code=None, stats=None):
+        """Create a new lobby, with a code and stats from prepare_join if they were fetched already"""
+        if lobby_code is None:
+            lobby_code = self.generate_lobby_code()
         self.lobbies[lobby_code] = {
             "clients": {},  # {client_socket: {"name": str, "ready": bool}}
             "article_requests": {},
             "game_results": {},
-            "game_active": False
+            "game_active": False,
+            "difficulty": difficulty,  # None, or a key of DIFFICULTY_DISTANCES
+            "version": 0,  # Bumped on every change to the player list
+            "next_player_id": 0
         }
-        self.player_stats[lobby_code] = self.load_player_stats(lobby_code)
+        self.player_stats[lobby_code] = stats if stats is not None else self.load_player_stats(lobby_code)
         print(f"Created lobby: {lobby_code}")
         return lobby_code
 
 
-    def lobby_countdown(self, lobby_code):
+    def countdown_duration(self, lobby):
+        """Seconds between everyone being ready and the game starting"""
+        return int(10 + (10 / (len(lobby["clients"]) if len(lobby["clients"]) > 0 else 1)))
+
+
+    def schedule(self, delay, callback, *args):
+        """Run callback after delay seconds, returns a cancellable handle"""
+        return self.scheduler.call_later(delay, callback, *args)
+
+
+    def call_on_server(self, callback, *args):
+        """Run callback where lobby state is changed, with threads that is any thread"""
+        callback(*args)
+
+
+    def run_blocking(self, callback, *args):
+        """Run a call that may wait on disk or a database, without a result"""
+        callback(*args)
+
+
+    def start_countdown(self, lobby_code):
+        """Schedule the game start for a lobby whose players are all ready"""
         lobby = self.lobbies[lobby_code]
-        start = time.time()
-
-        while time.time() - start < int(10 + (10 / (len(lobby["clients"]) if len(lobby["clients"]) > 0 else 1))):
-            if lobby_code not in self.lobbies:
-                return
-            if not all(c["ready"] for c in lobby["clients"].values()):
-                lobby["countdown_running"] = False
-                return
-            players = [
-                {
-                    "name": c["name"],
-                    "ready": c["ready"]
-                }
-                for c in lobby["clients"].values()
-            ]
-            self.broadcast_to_lobby(lobby_code, {
-                "type": "receive_player_count",
-                "player_count": len(players),
-                "players": players
-            })
-            time.sleep(0.25)
+        # Numbered so a timer that already fired for a cancelled countdown can tell it is stale
+        lobby["countdown_id"] = lobby.get("countdown_id", 0) + 1
+        lobby["countdown_timer"] = self.schedule(
+            self.countdown_duration(lobby), self.finish_countdown, lobby_code, lobby["countdown_id"]
+        )
 
-        if lobby_code in self.lobbies and all(c["ready"] for c in lobby["clients"].values()):
-            self.start_game(lobby_code)
 
+    def cancel_countdown(self, lobby_code):
+        """Stop a lobby's countdown, e.g. when a player is no longer ready"""
+        lobby = self.lobbies.get(lobby_code)
+        if lobby is None:
+            return
+
+        timer = lobby.pop("countdown_timer", None)
+        if timer is not None:
+            timer.cancel()
         lobby["countdown_running"] = False
 
 
+    def lobby_players(self, lobby):
+        """Public view of a lobby's players"""
+        return [
+            {
+                "id": c["id"],
+                "name": c["name"],
+                "ready": c["ready"]
+            }
+            for c in lobby["clients"].values()
+        ]
+
+
+    def send_lobby_snapshot(self, client_socket, lobby_code):
+        """Send the full player list and its version to one client"""
+        lobby = self.lobbies[lobby_code]
+        self.send_message(client_socket, {
+            "type": "lobby_snapshot",
+            "version": lobby["version"],
+            "players": self.lobby_players(lobby)
+        })
+
+
+    def broadcast_lobby_snapshot(self, lobby_code):
+        """Bump the lobby version and send the full player list to everyone"""
+        lobby = self.lobbies[lobby_code]
+        lobby["version"] += 1
+        self.broadcast_to_lobby(lobby_code, {
+            "type": "lobby_snapshot",
+            "version": lobby["version"],
+            "players": self.lobby_players(lobby)
+        })
+
+
+    def broadcast_lobby_delta(self, lobby_code, event, client, exclude=None):
+        """Bump the lobby version and tell clients that one player joined, left or changed readiness"""
+        lobby = self.lobbies[lobby_code]
+        lobby["version"] += 1
+        self.broadcast_to_lobby(lobby_code, {
+            "type": "lobby_delta",
+            "version": lobby["version"],
+            "event": event,
+            "player": {
+                "id": client["id"],
+                "name": client["name"],
+                "ready": client["ready"]
+            }
+        }, exclude=exclude)
+
+
+    def set_player_ready(self, client_socket, lobby_code, ready):
+        """Update a player's readiness, broadcasting only if it changed"""
+        client = self.lobbies[lobby_code]["clients"][client_socket]
+        if client["ready"] != ready:
+            client["ready"] = ready
+            self.broadcast_lobby_delta(lobby_code, "ready", client)
+
+
+    def finish_countdown(self, lobby_code, countdown_id):
+        if lobby_code not in self.lobbies:
+            return
+
+        lobby = self.lobbies[lobby_code]
+        if not lobby.get("countdown_running", False) or lobby.get("countdown_id") != countdown_id:
+            return
+        self.cancel_countdown(lobby_code)
+
+        if all(c["ready"] for c in lobby["clients"].values()):
+            # Article lookups block, keep them off the scheduler thread
+            future = self.worker_pool.submit(self.start_game, lobby_code)
+            future.add_done_callback(lambda f: self.check_game_started(lobby_code, f))
+
+
+    def check_game_started(self, lobby_code, future):
+        """Report a start_game that raised, instead of leaving its lobby waiting forever"""
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Failed to start game in lobby {lobby_code}: {e}")
+            self.call_on_server(self.cancel_game_start, lobby_code)
+
+
+    def cancel_game_start(self, lobby_code):
+        """Send a lobby whose game could not start back to picking articles"""
+        lobby = self.lobbies.get(lobby_code)
+        if lobby is None or lobby["game_active"]:
+            return
+
+        lobby["article_requests"].clear()
+        lobby["all_ready_time"] = None
+        for c in lobby["clients"].values():
+            c["ready"] = False
+        self.broadcast_lobby_snapshot(lobby_code)
+        self.broadcast_to_lobby(lobby_code, {
+            "type": "game_start_failed",
+            "message": "The game could not be started, pick your articles again"
+        })
+
+
     def start_tcp_server(self):
         """Start TCP server to accept client connections"""
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -163,90 +422,24 @@ class WikiRaceServer:
                 break
 
 
-    def handle_client(self, client_socket, address):
-        """Handle individual client connections"""
+    def handle_client(self, client_socket, address, initial=b""):
+        """Handle individual client connections, initial is data already read by a router"""
         print(f"Client connected from {address}")
         client_lobby = None
 
+        decoder = MessageDecoder()
+
         try:
+            for message in decoder.feed(initial):
+                client_lobby = self.handle_message(client_socket, address, client_lobby, message)
+
             while self.running:
-                data = client_socket.recv(BUFFER_SIZE).decode()
+                data = client_socket.recv(BUFFER_SIZE)
                 if not data:
                     break
 
-                message = json.loads(data)
-                msg_type = message.get("type")
-
-                if msg_type == "join":
-                    player_name = message.get("name", f"Player{random.randint(1000, 9999)}")
-                    lobby_code = message.get("lobby_code")
-                    
-                    # Create lobby if it doesn't exist
-                    if lobby_code not in self.lobbies and lobby_code != "NG":
-                        print("Rejected lobby join, no lobby found")
-                    else:
-                        if lobby_code == "NG":
-                            lobby_code = self.create_lobby()
-                        client_lobby = lobby_code
-                        lobby = self.lobbies[lobby_code]
-
-                        lobby["clients"][client_socket] = {
-                            "name": player_name,
-                            "address": address,
-                            "ready": False
-                        }
-
-                        self.ensure_player_stats(player_name, lobby_code)
-                        self.save_player_stats(lobby_code)
-
-                        print(f"{player_name} joined lobby {lobby_code}")
-                        self.send_message(client_socket, {
-                            "type": "join_success",
-                            "lobby_code": lobby_code,
-                            "message": f"Connected to lobby {lobby_code}"
-                        })
-
-                elif msg_type == "article_request":
-                    if client_lobby and client_lobby in self.lobbies:
-                        lobby = self.lobbies[client_lobby]
-                        lobby["article_requests"][client_socket] = message.get("article", "")
-                        lobby["clients"][client_socket]["ready"] = True
-                        print(f"{lobby["clients"][client_socket]["name"]} submitted article request")
-
-                        if all(c["ready"] for c in lobby["clients"].values()):
-                            if "all_ready_time" not in lobby or lobby["all_ready_time"] is None:
-                                lobby["all_ready_time"] = time.time()
-                        else:
-                            lobby["all_ready_time"] = None
-
-                        if all(c["ready"] for c in lobby["clients"].values()):
-                            if not lobby.get("countdown_running", False):
-                                lobby["countdown_running"] = True
-                                threading.Thread(target=self.lobby_countdown, args=(client_lobby,), daemon=True).start()
-
-                elif msg_type == "game_result":
-                    if client_lobby and client_lobby in self.lobbies:
-                        lobby = self.lobbies[client_lobby]
-                        lobby["game_results"][client_socket] = {
-                            "status": message.get("status"),
-                            "clicks": message.get("clicks"),
-                            "time": message.get("time"),
-                            "articles": message.get("articles", [])
-                        }
-                        print(f"{lobby["clients"][client_socket]["name"]} finished")
-
-                        # Check if all players finished
-                        if len(lobby["game_results"]) == len(lobby["clients"]):
-                            print(f"All players finished in lobby {client_lobby}")
-                            self.calculate_and_send_results(client_lobby)
-
-                elif msg_type == "play_again":
-                    if client_lobby and client_lobby in self.lobbies:
-                        lobby = self.lobbies[client_lobby]
-                        lobby["clients"][client_socket]["ready"] = False
-                        lobby["article_requests"].pop(client_socket, None)
-                        lobby["game_results"].pop(client_socket, None)
-                        print(f"{lobby["clients"][client_socket]["name"]} wants to play again")
+                for message in decoder.feed(data):
+                    client_lobby = self.handle_message(client_socket, address, client_lobby, message)
 
         except Exception as e:
             print(f"Error handling client: {e}")
@@ -255,23 +448,228 @@ class WikiRaceServer:
                 self.remove_client(client_socket, client_lobby)
 
 
+    def prepare_join(self, message):
+        """Blocking part of a join: reserve and load a new lobby, or look up who owns an unknown code"""
+        lobby_code = message.get("lobby_code")
+        if lobby_code == "NG":
+            lobby_code = self.generate_lobby_code()
+            return {"lobby_code": lobby_code, "stats": self.load_player_stats(lobby_code)}
+        if lobby_code not in self.lobbies and isinstance(lobby_code, str):
+            return {"owner": self.lobby_directory.owner(lobby_code)}
+        return {}
+
+
+    def handle_message(self, client_socket, address, client_lobby, message, prepared=None):
+        """Apply one protocol message from a client, returns the client's lobby code"""
+        msg_type = message.get("type")
+
+        if msg_type == "join":
+            player_name = message.get("name", f"Player{random.randint(1000, 9999)}")
+            lobby_code = message.get("lobby_code")
+            if prepared is None:
+                prepared = self.prepare_join(message)
+            
+            # Create lobby if it doesn't exist
+            if lobby_code not in self.lobbies and lobby_code != "NG":
+                owner = prepared.get("owner")
+                if owner is not None and owner != self.node_address:
+                    self.redirect(client_socket, lobby_code, owner)
+                else:
+                    print("Rejected lobby join, no lobby found")
+            else:
+                if lobby_code == "NG":
+                    difficulty = message.get("difficulty")
+                    if difficulty not in DIFFICULTY_DISTANCES or not self.supports_difficulty():
+                        difficulty = None
+                    lobby_code = self.create_lobby(difficulty, prepared["lobby_code"], prepared["stats"])
+                client_lobby = lobby_code
+                lobby = self.lobbies[lobby_code]
+
+                client = {
+                    "id": lobby["next_player_id"],
+                    "name": player_name,
+                    "address": address,
+                    "ready": False
+                }
+                lobby["next_player_id"] += 1
+                lobby["clients"][client_socket] = client
+
+                # A new player is not ready, so any running countdown stops
+                self.cancel_countdown(lobby_code)
+
+                self.ensure_player_stats(player_name, lobby_code)
+                self.save_player_stats(lobby_code, [player_name])
+
+                print(f"{player_name} joined lobby {lobby_code}")
+                self.send_message(client_socket, {
+                    "type": "join_success",
+                    "lobby_code": lobby_code,
+                    "difficulty": lobby["difficulty"],
+                    "message": f"Connected to lobby {lobby_code}"
+                })
+                self.broadcast_lobby_delta(lobby_code, "joined", client, exclude=client_socket)
+                self.send_lobby_snapshot(client_socket, lobby_code)
+
+        elif msg_type == "article_request":
+            if client_lobby and client_lobby in self.lobbies:
+                lobby = self.lobbies[client_lobby]
+                # Start the title lookup now so it is done before the countdown ends
+                article = message.get("article", "")
+                if article and article.strip():
+                    lobby["article_requests"][client_socket] = self.title_resolver.submit(article)
+                else:
+                    lobby["article_requests"][client_socket] = None
+                self.set_player_ready(client_socket, client_lobby, True)
+                print(f"{lobby["clients"][client_socket]["name"]} submitted article request")
+
+                if all(c["ready"] for c in lobby["clients"].values()):
+                    if "all_ready_time" not in lobby or lobby["all_ready_time"] is None:
+                        lobby["all_ready_time"] = time.time()
+                else:
+                    lobby["all_ready_time"] = None
+
+                if all(c["ready"] for c in lobby["clients"].values()):
+                    if not lobby.get("countdown_running", False):
+                        lobby["countdown_running"] = True
+                        self.start_countdown(client_lobby)
+
+        elif msg_type == "game_result":
+            if client_lobby and client_lobby in self.lobbies:
+                lobby = self.lobbies[client_lobby]
+                lobby["game_results"][client_socket] = self.checked_result(lobby, client_socket, message)
+                print(f"{lobby["clients"][client_socket]["name"]} finished")
+
+                # Check if all players finished
+                if len(lobby["game_results"]) == len(lobby["clients"]):
+                    print(f"All players finished in lobby {client_lobby}")
+                    self.calculate_and_send_results(client_lobby)
+
+        elif msg_type == "navigate":
+            if client_lobby and client_lobby in self.lobbies:
+                self.record_navigation(client_socket, client_lobby, str(message.get("article", "")))
+
+        elif msg_type == "play_again":
+            if client_lobby and client_lobby in self.lobbies:
+                lobby = self.lobbies[client_lobby]
+                self.set_player_ready(client_socket, client_lobby, False)
+                lobby["article_requests"].pop(client_socket, None)
+                lobby["game_results"].pop(client_socket, None)
+                self.cancel_countdown(client_lobby)
+                print(f"{lobby["clients"][client_socket]["name"]} wants to play again")
+
+        elif msg_type == "random_article_request":
+            # The pool only blocks when it has run dry, but keep that off this thread
+            self.request_pool.submit(self.send_random_article, client_socket)
+
+        elif msg_type == "lobby_snapshot_request":
+            # Sent by clients that missed a delta
+            if client_lobby and client_lobby in self.lobbies:
+                self.send_lobby_snapshot(client_socket, client_lobby)
+
+        return client_lobby
+
+
+
+    def new_player_path(self, start_article):
+        """Running path of one player, extended by their navigate events"""
+        node = self.title_index.node(start_article) if self.title_index else None
+        return {
+            "titles": [start_article],  # Articles reached for the first time, one click each
+            "current": start_article,  # Article the player is on, may be one they went back to
+            "node": node,  # Node of the current article, None when it is not in the link graph
+            "visited": {start_article} if node is None else {node},
+            "checked": node is not None,  # Whether every hop so far was checked against the link graph
+            "invalid_hop": None
+        }
+
+
+    def record_navigation(self, client_socket, lobby_code, article):
+        """Check one click against the link graph and extend the player's path"""
+        lobby = self.lobbies[lobby_code]
+        path = lobby.get("paths", {}).get(client_socket)
+        if path is None or path["invalid_hop"] is not None:
+            return
+
+        node = self.title_index.node(article) if self.title_index else None
+        previous = path["node"]
+
+        # Going back to an earlier article or following an in-page link needs no link
+        if (previous is not None and node is not None and node not in path["visited"]
+                and not self.link_graph.has_link(previous, node)):
+            path["invalid_hop"] = (path["current"], article)
+            print(f"{lobby["clients"][client_socket]["name"]} jumped from {path["current"]} to {article} without a link")
+            self.send_message(client_socket, {
+                "type": "navigate_rejected",
+                "from": path["current"],
+                "to": article
+            })
+            return
+
+        # Articles outside the graph (a stale dump, a new article) can't be checked, only counted
+        if previous is None or node is None:
+            path["checked"] = False
+
+        path["node"] = node
+        path["current"] = article
+        # Reloads and going back are not clicks
+        key = article if node is None else node
+        if key not in path["visited"]:
+            path["visited"].add(key)
+            path["titles"].append(article)
+
+
+    def checked_result(self, lobby, client_socket, message):
+        """A player's game result, with clicks taken from the path the server saw if it checked all of it"""
+        result = {
+            "status": message.get("status"),
+            "clicks": message.get("clicks"),
+            "time": message.get("time")
+        }
+        path = lobby.get("paths", {}).get(client_socket)
+        if path is None:
+            return result
+
+        if path["invalid_hop"] is not None:
+            result["status"] = "Forfeit"
+        elif path["checked"]:
+            result["clicks"] = len(path["titles"]) - 1
+            end = self.title_index.node(lobby["end_article"])
+            if result["status"] == "Win" and end is not None and path["node"] != end:
+                print(f"{lobby["clients"][client_socket]["name"]} claimed a win without reaching {lobby["end_article"]}")
+                result["status"] = "Forfeit"
+        return result
+
+
+    def send_random_article(self, client_socket):
+        """Send one title from the random article pool to a client"""
+        try:
+            title = self.article_pool.get()
+        except Exception as e:
+            print(f"Failed to get random article: {e}")
+            title = None
+        self.send_message(client_socket, {
+            "type": "random_article",
+            "title": title
+        })
+
+
     def send_message(self, client_socket, message):
         """Send JSON message to a client"""
         try:
-            payload = json.dumps(message) + "\n"
-            client_socket.send(payload.encode())
+            client_socket.sendall(encode_message(message))
         except:
             pass
 
 
-    def broadcast_to_lobby(self, lobby_code, message):
+    def broadcast_to_lobby(self, lobby_code, message, exclude=None):
         """Send message to all clients in a lobby"""
         if lobby_code not in self.lobbies:
             return
         
         lobby = self.lobbies[lobby_code]
         for client in list(lobby["clients"].keys()):
-            self.send_message(client, message)
+            if client is not exclude:
+                self.send_message(client, message)
 
 
     def remove_client(self, client_socket, lobby_code):
@@ -282,14 +680,17 @@ class WikiRaceServer:
         lobby = self.lobbies[lobby_code]
         if client_socket in lobby["clients"]:
             print(f"Client {lobby["clients"][client_socket]["name"]} disconnected from lobby {lobby_code}")
-            del lobby["clients"][client_socket]
+            client = lobby["clients"].pop(client_socket)
             lobby["article_requests"].pop(client_socket, None)
             lobby["game_results"].pop(client_socket, None)
+            self.broadcast_lobby_delta(lobby_code, "left", client)
             
             # Delete lobby if empty
             if len(lobby["clients"]) == 0:
                 print(f"Lobby {lobby_code} is empty, deleting...")
+                self.cancel_countdown(lobby_code)
                 del self.lobbies[lobby_code]
+                self.run_blocking(self.lobby_directory.release, lobby_code, self.node_address)
                 self.reset_player_stats(lobby_code)
         
         try:
@@ -299,7 +700,7 @@ class WikiRaceServer:
 
 
     def start_game(self, lobby_code):
-        """Start the game in a specific lobby"""
+        """Pick a lobby's articles, which blocks on lookups, then start its game on the server"""
         if lobby_code not in self.lobbies:
             return
             
@@ -312,19 +713,27 @@ class WikiRaceServer:
 
         # Collect all article requests
         requests = []
-        for client_socket, article in lobby["article_requests"].items():
-            if article and article.strip():
-                search_results = self.mediawiki.search(article)
-                if len(search_results) > 0:
-                    requests.append(search_results[0])
+        for client_socket, title_future in list(lobby["article_requests"].items()):
+            if title_future is None:
+                continue
+            try:
+                title = title_future.result(timeout=RESOLVE_TIMEOUT)
+            except Exception as e:
+                print(f"Article lookup failed: {e}")
+                continue
+            if title:
+                requests.append(title)
+
+        # Missing articles come from the vetted pairs, or suit the lobby's difficulty, where possible
+        if len(requests) < 2 and self.title_index is not None:
+            try:
+                requests = self.pick_missing_articles(lobby["difficulty"], requests)
+            except Exception as e:
+                print(f"Failed to pick articles: {e}")
 
         # Add random articles if needed
         while len(requests) < 2:
-            random_articles = self.mediawiki.random(1)
-            if isinstance(random_articles, str):
-                requests.append(random_articles)
-            else:
-                requests.extend(random_articles)
+            requests.append(self.article_pool.get())
 
         # Pick start and end articles
         if len(requests) == 2:
@@ -335,17 +744,71 @@ class WikiRaceServer:
             start_article = selected[0]
             end_article = selected[1]
 
+        self.call_on_server(self.begin_game, lobby_code, start_article, end_article)
+
+
+    def begin_game(self, lobby_code, start_article, end_article):
+        """Set up a lobby's race, then tell its players it started"""
+        lobby = self.lobbies.get(lobby_code)
+        if lobby is None or len(lobby["clients"]) == 0 or lobby["game_active"]:
+            return
+
         print(f"Lobby {lobby_code} game starting: {start_article} -> {end_article}")
 
+        # The hint is looked up once for the whole lobby
+        hint_future = self.summaries.submit(end_article)
+
+        # Par is only needed for the results, work it out while the game runs
+        if self.path_solver is not None:
+            lobby["par"] = self.par_pool.submit(self.compute_par, start_article, end_article)
+        else:
+            lobby["par"] = None
+
+        # Paths have to exist before anyone can click or finish
+        lobby["end_article"] = end_article
+        lobby["paths"] = {
+            client_socket: self.new_player_path(start_article)
+            for client_socket in list(lobby["clients"])
+        }
+        lobby["game_active"] = True
+        lobby["game_results"].clear()
+
         # Send to all clients in lobby
-        self.broadcast_to_lobby(lobby_code, {
+        game_start = {
             "type": "game_start",
             "start_article": start_article,
             "end_article": end_article
-        })
+        }
+        if not hint_future.done():
+            # None tells clients a separate hint message will follow
+            game_start["hint"] = None
+            hint_future.add_done_callback(lambda f: self.call_on_server(self.hint_ready, lobby_code, end_article, f))
+        elif hint_future.exception() is None and hint_future.result() is not None:
+            # Without a hint from here, clients try to fetch it themselves
+            game_start["hint"] = hint_future.result()
+        self.broadcast_to_lobby(lobby_code, game_start)
+
+
+    def hint_ready(self, lobby_code, end_article, hint_future):
+        """Pass on a hint that finished after game_start went out"""
+        try:
+            summary = hint_future.result()
+        except Exception as e:
+            print(f"Hint lookup failed: {e}")
+            summary = None
+        self.send_hint(lobby_code, end_article, summary)
 
-        lobby["game_active"] = True
-        lobby["game_results"].clear()
+
+    def send_hint(self, lobby_code, end_article, summary):
+        """Send a hint that was not ready when the game started"""
+        lobby = self.lobbies.get(lobby_code)
+        if lobby is None or lobby.get("end_article") != end_article:
+            return
+        self.broadcast_to_lobby(lobby_code, {
+            "type": "hint",
+            "article": end_article,
+            "summary": summary
+        })
 
 
     def calculate_and_send_results(self, lobby_code):
@@ -387,7 +850,7 @@ class WikiRaceServer:
                 "total_points": total_points
             })
 
-        self.save_player_stats(lobby_code)
+        self.save_player_stats(lobby_code, [result["name"] for result in results])
 
         # Sort by score
         results.sort(key=lambda x: x["total_points"])
@@ -398,20 +861,33 @@ class WikiRaceServer:
 
         print(f"Lobby {lobby_code} final results:", results)
 
+        # Results never wait for the solver, a race it hasn't finished has no par
+        par = None
+        if lobby.get("par") is not None and lobby["par"].done():
+            try:
+                par = lobby["par"].result()
+            except Exception as e:
+                print(f"Par unavailable: {e}")
+        elif lobby.get("par") is not None:
+            print(f"Par for lobby {lobby_code} not ready, sending results without it")
+
         # Send results to all clients in lobby
         self.broadcast_to_lobby(lobby_code, {
             "type": "game_results",
-            "results": results
+            "results": results,
+            "par": par
         })
 
         lobby["article_requests"].clear()
         lobby["game_results"].clear()
+        lobby["paths"] = {}
         lobby["all_ready_time"] = None
         lobby["countdown_running"] = False
         lobby["game_active"] = False
 
         for c in lobby["clients"].values():
             c["ready"] = False
+        self.broadcast_lobby_snapshot(lobby_code)
 
 
     def run(self):
@@ -420,7 +896,10 @@ class WikiRaceServer:
         print("Wikipedia Race Server - Internet Mode")
         print("="*50)
         
-        # Start TCP server thread
+        # Start timers, article pool and TCP server thread
+        self.release_stale_lobbies()
+        self.scheduler.start()
+        self.article_pool.start()
         threading.Thread(target=self.start_tcp_server, daemon=True).start()
 
         if self.headless:
@@ -467,14 +946,190 @@ class WikiRaceServer:
                     break
 
         # Cleanup
+        self.scheduler.stop()
+        self.title_resolver.shutdown()
+        self.summaries.shutdown()
+        self.par_pool.shutdown(wait=False)
+        self.article_pool.stop()
+        self.stats_store.close()
+        self.lobby_directory.release_node(self.node_address)
+        self.lobby_directory.close()
         if self.server_socket:
             self.server_socket.close()
 
 
+class AsyncWikiRaceServer(WikiRaceServer):
+    """Serves every client connection from a single asyncio event loop"""
+    def __init__(self, headless=False, stats_store=None, link_graph_dir=None, lobby_directory=None,
+                 node_address=None):
+        super().__init__(headless, stats_store, link_graph_dir, lobby_directory, node_address)
+        self.loop = None
+        self.loop_thread_id = None
+
+
+    def start_tcp_server(self):
+        """Run the event loop that accepts and serves client connections"""
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            print(f"Event loop stopped: {e}")
+
+
+    async def serve(self):
+        """Listen for connections until the server stops running"""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+
+        server = await asyncio.start_server(
+            self.handle_connection,
+            "0.0.0.0",
+            TCP_PORT,
+            reuse_address=True,
+            backlog=ASYNC_BACKLOG
+        )
+
+        print(f"Server listening on {self.get_local_ip()}:{TCP_PORT} (asyncio)")
+        print("Waiting for connections...")
+
+        async with server:
+            while self.running:
+                await asyncio.sleep(1.0)
+
+
+    async def handle_connection(self, reader, writer, initial=b""):
+        """Handle individual client connections, initial is data already read by a router"""
+        address = writer.get_extra_info("peername")
+        print(f"Client connected from {address}")
+        client_lobby = None
+
+        decoder = MessageDecoder()
+
+        try:
+            for message in decoder.feed(initial):
+                client_lobby = await self.dispatch(writer, address, client_lobby, message)
+
+            while self.running:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+
+                for message in decoder.feed(data):
+                    client_lobby = await self.dispatch(writer, address, client_lobby, message)
+
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            if client_lobby and client_lobby in self.lobbies:
+                self.remove_client(writer, client_lobby)
+            else:
+                writer.close()
+
+
+    async def dispatch(self, writer, address, client_lobby, message):
+        """Apply one message, with the blocking part of a join done on the request pool"""
+        prepared = None
+        if message.get("type") == "join":
+            prepared = await self.loop.run_in_executor(self.request_pool, self.prepare_join, message)
+        return self.handle_message(writer, address, client_lobby, message, prepared)
+
+
+    def send_message(self, client_socket, message):
+        """Queue JSON message on a client's stream, from any thread"""
+        try:
+            payload = encode_message(message)
+            if threading.get_ident() == self.loop_thread_id:
+                self.write_payload(client_socket, payload)
+            else:
+                self.loop.call_soon_threadsafe(self.write_payload, client_socket, payload)
+        except:
+            pass
+
+
+    def write_payload(self, writer, payload):
+        """Write to a client's stream, closing clients that stopped reading"""
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            print("Client is not reading, closing connection")
+            writer.close()
+            return
+        writer.write(payload)
+
+
+    def schedule(self, delay, callback, *args):
+        """Run callback after delay seconds on the event loop"""
+        return self.scheduler.call_later(delay, self.loop.call_soon_threadsafe, callback, *args)
+
+
+    def call_on_server(self, callback, *args):
+        """Run callback on the event loop, which owns all lobby state"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+
+    def run_blocking(self, callback, *args):
+        """Run a blocking call on the request pool instead of the event loop"""
+        self.request_pool.submit(callback, *args)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Wikipedia Race Server")
     parser.add_argument("--headless", action="store_true", help="Run in headless mode (no input)")
+    parser.add_argument(
+        "--mode",
+        choices=["threaded", "asyncio"],
+        default="threaded",
+        help="Connection handling: a thread per client, or one asyncio event loop"
+    )
+    parser.add_argument(
+        "--stats-backend",
+        choices=["sqlite", "json"],
+        default="sqlite",
+        help="Player stats storage: write-behind SQLite database, or one JSON file per lobby"
+    )
+    parser.add_argument(
+        "--stats-path",
+        default=None,
+        help=f"SQLite database file (default {STATS_PATH}) or JSON directory (default .)"
+    )
+    parser.add_argument(
+        "--link-graph",
+        default=None,
+        help="Directory written by dump_importer.py, enables par for each race"
+    )
+    parser.add_argument(
+        "--lobby-directory",
+        default="memory",
+        help="Where lobby owners are kept: memory (this server only) or sqlite:PATH shared by every node"
+    )
+    parser.add_argument(
+        "--node-address",
+        default=None,
+        help="HOST:PORT clients are redirected to for lobbies on this node (default local IP and PORT)"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Worker processes, each owning a share of the lobbies behind one router (Unix only)"
+    )
     args = parser.parse_args()
-    
-    server = WikiRaceServer(headless=args.headless)
+
+    # Treat SIGTERM like Ctrl+C so pending stats are written before exit
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    if args.shards > 1:
+        from sharded_server import run_sharded
+        run_sharded(args.shards, args.mode, args.stats_backend, args.stats_path, args.link_graph,
+                    args.lobby_directory, args.node_address)
+        sys.exit()
+
+    stats_store = open_stats_store(args.stats_backend, args.stats_path)
+    lobby_directory = open_lobby_directory(args.lobby_directory)
+
+    if args.mode == "asyncio":
+        server = AsyncWikiRaceServer(headless=args.headless, stats_store=stats_store, link_graph_dir=args.link_graph,
+                                     lobby_directory=lobby_directory, node_address=args.node_address)
+    else:
+        server = WikiRaceServer(headless=args.headless, stats_store=stats_store, link_graph_dir=args.link_graph,
+                                lobby_directory=lobby_directory, node_address=args.node_address)
     server.run()
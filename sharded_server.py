@@ -0,0 +1,332 @@
+"""Run the server as several worker processes behind one lobby-code router
+
+Usage: python server_network.py --shards N [--mode asyncio] [other server options]
+
+Every lobby code belongs to the worker it hashes to. The router accepts
+each connection, reads the client's join message and passes the socket
+itself to the owning worker, which serves the client directly from then
+on. New games ("NG") go to the worker with the fewest lobbies. Sockets
+are passed with SCM_RIGHTS, so this mode needs a Unix host.
+"""
+import asyncio
+from collections import deque
+import json
+import multiprocessing
+import selectors
+import signal
+import socket
+import threading
+import time
+import zlib
+
+from message_codec import MAX_FRAME_SIZE, FrameTooLargeError, MessageDecoder
+from lobby_directory import open_lobby_directory
+from server_network import (BUFFER_SIZE, TCP_PORT, ASYNC_BACKLOG, AsyncWikiRaceServer, WikiRaceServer,
+                            open_stats_store)
+
+
+HANDOFF_TIMEOUT = 10.0  # Seconds a new connection gets to send its join message
+HANDOFF_SIZE = MAX_FRAME_SIZE + BUFFER_SIZE + 1024  # Largest handoff datagram: header plus data already read
+RECENT_WINDOW = 1.0  # Seconds a new game counts towards a worker's load before the worker reports it
+SHUTDOWN_TIMEOUT = 5.0
+
+
+def shard_for(lobby_code, shard_count):
+    """Worker that owns a lobby code, stable across processes and restarts"""
+    return zlib.crc32(lobby_code.encode("utf-8")) % shard_count
+
+
+def send_handoff(channel, client_socket, address, data):
+    """Pass a client socket and whatever was already read from it to a worker"""
+    header = json.dumps({"address": list(address)}).encode() + b"\n"
+    socket.send_fds(channel, [header + data], [client_socket.fileno()])
+
+
+def receive_handoff(channel):
+    """(client_socket, address, data) of the next handoff, None once the router is gone"""
+    message, fds, _, _ = socket.recv_fds(channel, HANDOFF_SIZE, 1)
+    if not fds:
+        return None
+    header, data = message.split(b"\n", 1)
+    address = tuple(json.loads(header)["address"])
+    return socket.socket(fileno=fds[0]), address, data
+
+
+class ShardMixin:
+    """Makes a server one worker of a sharded server
+
+    The worker only creates codes that hash to it, publishes its lobby
+    count for the router and takes its clients from the router instead of
+    listening itself.
+    """
+    def setup_shard(self, index, count, channel, loads):
+        self.shard_index = index
+        self.shard_count = count
+        self.channel = channel
+        self.loads = loads  # Shared with the router, one lobby count per worker
+
+
+    def owns_code(self, lobby_code):
+        return shard_for(lobby_code, self.shard_count) == self.shard_index
+
+
+    def release_stale_lobbies(self):
+        # Done once by the router, a worker would drop codes its siblings just reserved
+        pass
+
+
+    def create_lobby(self, difficulty=None, lobby_code=None, stats=None):
+        lobby_code = super().create_lobby(difficulty, lobby_code, stats)
+        self.report_load()
+        return lobby_code
+
+
+    def remove_client(self, client_socket, lobby_code):
+        super().remove_client(client_socket, lobby_code)
+        self.report_load()
+
+
+    def report_load(self):
+        self.loads[self.shard_index] = len(self.lobbies)
+
+
+class ThreadedShardServer(ShardMixin, WikiRaceServer):
+    """Worker that serves each handed-off client on its own thread"""
+    def start_tcp_server(self):
+        print(f"Shard {self.shard_index} waiting for clients from the router")
+        while self.running:
+            try:
+                handoff = receive_handoff(self.channel)
+            except OSError as e:
+                print(f"Shard {self.shard_index} lost the router: {e}")
+                break
+            if handoff is None:
+                break
+            client_socket, address, data = handoff
+            threading.Thread(target=self.handle_client, args=(client_socket, address, data), daemon=True).start()
+        self.running = False
+
+
+class AsyncShardServer(ShardMixin, AsyncWikiRaceServer):
+    """Worker that serves every handed-off client from its event loop"""
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+
+        self.channel.setblocking(False)
+        self.loop.add_reader(self.channel.fileno(), self.accept_handoff)
+        print(f"Shard {self.shard_index} waiting for clients from the router (asyncio)")
+
+        while self.running:
+            await asyncio.sleep(1.0)
+        self.loop.remove_reader(self.channel.fileno())
+
+
+    def accept_handoff(self):
+        try:
+            handoff = receive_handoff(self.channel)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Shard {self.shard_index} lost the router: {e}")
+            handoff = None
+        if handoff is None:
+            self.loop.remove_reader(self.channel.fileno())
+            self.running = False
+            return
+        client_socket, address, data = handoff
+        self.loop.create_task(self.serve_handoff(client_socket, data))
+
+
+    async def serve_handoff(self, client_socket, data):
+        try:
+            reader, writer = await asyncio.open_connection(sock=client_socket)
+        except Exception as e:
+            print(f"Failed to take over client: {e}")
+            client_socket.close()
+            return
+        await self.handle_connection(reader, writer, data)
+
+
+def run_shard(index, count, channel, loads, mode, stats_backend, stats_path, link_graph_dir,
+              lobby_directory_spec, node_address):
+    """Entry point of a worker process"""
+    # Only the router reacts to Ctrl+C, workers are stopped with SIGTERM so they shut down once
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server_class = AsyncShardServer if mode == "asyncio" else ThreadedShardServer
+    server = server_class(headless=True, stats_store=open_stats_store(stats_backend, stats_path),
+                          link_graph_dir=link_graph_dir, lobby_directory=open_lobby_directory(lobby_directory_spec),
+                          node_address=node_address)
+    server.setup_shard(index, count, channel, loads)
+    server.run()
+
+
+class PendingClient:
+    """A connection the router has accepted but not yet handed off"""
+    __slots__ = ("sock", "address", "decoder", "data", "deadline")
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.decoder = MessageDecoder()
+        self.data = bytearray()
+        self.deadline = time.monotonic() + HANDOFF_TIMEOUT
+
+
+class LobbyRouter:
+    """Accepts every connection and hands it to the worker that owns its lobby"""
+    def __init__(self, channels, loads, workers):
+        self.channels = channels
+        self.loads = loads
+        self.workers = workers
+        self.recent = [deque() for _ in channels]  # Times of new games sent to each worker
+        self.selector = selectors.DefaultSelector()
+        self.running = True
+
+
+    def serve(self, port=TCP_PORT):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("0.0.0.0", port))
+        listener.listen(ASYNC_BACKLOG)
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ)
+        print(f"Router listening on port {port} for {len(self.channels)} shards")
+
+        while self.running:
+            for key, _ in self.selector.select(timeout=1.0):
+                if key.data is None:
+                    self.accept(listener)
+                else:
+                    self.read(key.data)
+            self.expire()
+
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+
+
+    def accept(self, listener):
+        try:
+            while True:
+                sock, address = listener.accept()
+                sock.setblocking(False)
+                self.selector.register(sock, selectors.EVENT_READ, PendingClient(sock, address))
+        except BlockingIOError:
+            pass
+
+
+    def read(self, client):
+        try:
+            chunk = client.sock.recv(BUFFER_SIZE)
+            if not chunk:
+                raise ConnectionError("Client closed the connection")
+            client.data += chunk
+            messages = client.decoder.feed(chunk)
+        except BlockingIOError:
+            return
+        except (OSError, ValueError, FrameTooLargeError) as e:
+            print(f"Dropped client {client.address} before routing: {e}")
+            self.drop(client)
+            return
+        if messages:
+            self.hand_off(client, self.route(messages[0]))
+
+
+    def route(self, message):
+        """Worker for a client's first message"""
+        lobby_code = message.get("lobby_code") if message.get("type") == "join" else None
+        if isinstance(lobby_code, str) and lobby_code != "NG":
+            return shard_for(lobby_code, len(self.channels))
+        return self.least_loaded()
+
+
+    def least_loaded(self):
+        now = time.monotonic()
+
+        def load(index):
+            # Games sent moments ago may not be in the worker's count yet
+            recent = self.recent[index]
+            while recent and recent[0] < now - RECENT_WINDOW:
+                recent.popleft()
+            return self.loads[index] + len(recent)
+
+        alive = [i for i, worker in enumerate(self.workers) if worker.is_alive()] or list(range(len(self.workers)))
+        index = min(alive, key=load)
+        self.recent[index].append(now)
+        return index
+
+
+    def hand_off(self, client, index):
+        self.selector.unregister(client.sock)
+        try:
+            # The worker owns blocking mode from here, the threaded server expects it
+            client.sock.setblocking(True)
+            send_handoff(self.channels[index], client.sock, client.address, bytes(client.data))
+        except OSError as e:
+            print(f"Shard {index} unavailable, dropped client {client.address}: {e}")
+        client.sock.close()
+
+
+    def drop(self, client):
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+
+    def expire(self):
+        now = time.monotonic()
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None and key.data.deadline < now:
+                print(f"Client {key.data.address} never joined, closing")
+                self.drop(key.data)
+
+
+def run_sharded(shard_count, mode="threaded", stats_backend="sqlite", stats_path=None, link_graph_dir=None,
+                lobby_directory_spec="memory", node_address=None):
+    """Start shard_count workers and route clients to them until interrupted"""
+    print("=" * 50)
+    print(f"Wikipedia Race Server - {shard_count} shards")
+    print("=" * 50)
+
+    # Every worker is the same node as far as other nodes are concerned
+    node_address = node_address or WikiRaceServer.default_node_address()
+    lobby_directory = open_lobby_directory(lobby_directory_spec)
+    lobby_directory.release_node(node_address)
+    lobby_directory.close()
+
+    loads = multiprocessing.Array("i", shard_count, lock=False)
+    channels = []
+    workers = []
+    for index in range(shard_count):
+        router_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        worker = multiprocessing.Process(
+            target=run_shard,
+            args=(index, shard_count, worker_end, loads, mode, stats_backend, stats_path, link_graph_dir,
+                  lobby_directory_spec, node_address),
+            name=f"shard-{index}",
+            daemon=True
+        )
+        worker.start()
+        worker_end.close()
+        channels.append(router_end)
+        workers.append(worker)
+
+    router = LobbyRouter(channels, loads, workers)
+    try:
+        router.serve()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        # Workers write their pending stats on SIGTERM before exiting
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for channel in channels:
+            channel.close()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
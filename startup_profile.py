@@ -0,0 +1,76 @@
+import builtins
+import sys
+import threading
+import time
+
+
+JOIN_SCREEN_BUDGET = 1.5  # Seconds from launch until the join screen is drawn
+SLOWEST_IMPORTS = 15  # Imports listed in the report
+
+
+class StartupProfile:
+    """Times client startup, enabled with --profile-startup
+
+    Top-level imports made on the main thread are timed by wrapping
+    __import__, the time of each import including everything it pulls in.
+    mark() records the end of each initialisation step.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = []  # [(label, seconds since start)]
+        self.imports = {}  # {module: seconds}
+        self.depth = 0
+        self.original_import = None
+
+
+    def watch_imports(self):
+        self.original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+
+    def stop_watching(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - self.started))
+
+
+    def report(self, budget=JOIN_SCREEN_BUDGET):
+        """Print the timing breakdown, returns whether startup was within budget"""
+        self.stop_watching()
+        print("Startup profile")
+        previous = 0.0
+        for label, at in self.marks:
+            print(f"  {label:<28} {(at - previous) * 1000:8.1f} ms  (at {at * 1000:.1f} ms)")
+            previous = at
+
+        print("Slowest imports")
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        for name, seconds in slowest[:SLOWEST_IMPORTS]:
+            print(f"  {name:<28} {seconds * 1000:8.1f} ms")
+
+        total = self.marks[-1][1] if self.marks else time.perf_counter() - self.started
+        within = total <= budget
+        print(f"Join screen after {total:.3f} s, budget {budget:.3f} s: {"OK" if within else "OVER BUDGET"}")
+        return within
+
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if self.depth or level or name in sys.modules or threading.current_thread() is not threading.main_thread():
+            return self.original_import(name, globals, locals, fromlist, level)
+        self.depth += 1
+        started = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.depth -= 1
+            self.imports[name] = self.imports.get(name, 0.0) + time.perf_counter() - started
+
+
+profile = None
+if "--profile-startup" in sys.argv:
+    profile = StartupProfile()
+    profile.watch_imports()
@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+STATS_FIELDS = ("points", "wins", "clicks", "games_played", "time_played")
+
+
+class JsonStatsStore:
+    """Original storage, one {lobby}.json file rewritten on every save"""
+    def __init__(self, directory="."):
+        self.directory = directory
+
+
+    def path(self, lobby):
+        return os.path.join(self.directory, f"{lobby}.json")
+
+
+    def load(self, lobby):
+        """Load persistent player stats from disk"""
+        if not os.path.exists(self.path(lobby)):
+            return {}
+
+        try:
+            with open(self.path(lobby), "r", encoding="utf-8") as f:
+                data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+        except Exception as e:
+            print(f"Failed to load stats file: {e}")
+
+        return {}
+
+
+    def save(self, lobby, stats, players=None):
+        """Save persistent player stats to disk, the whole lobby is always rewritten"""
+        try:
+            with open(self.path(lobby), "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save stats file: {e}")
+
+
+    def reset(self, lobby):
+        """Delete the stats JSON file"""
+        try:
+            if os.path.exists(self.path(lobby)):
+                os.remove(self.path(lobby))
+                print(f"Deleted {self.path(lobby)}")
+        except Exception:
+            print(f"Failed to delete stats file: {self.path(lobby)}")
+
+
+    def close(self):
+        pass
+
+
+class SqliteStatsStore:
+    """Write-behind stats in a WAL-mode SQLite database
+
+    save() only records the changed rows in memory. A background writer
+    commits everything pending in one transaction every flush_interval
+    seconds, so repeated updates to a player between flushes cost a
+    single row write.
+    """
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self.pending_rows = {}  # {(lobby, player_name): row}
+        self.pending_resets = set()
+        self.pending_lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS player_stats (
+                lobby TEXT NOT NULL,
+                name TEXT NOT NULL,
+                points INTEGER NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0,
+                clicks INTEGER NOT NULL DEFAULT 0,
+                games_played INTEGER NOT NULL DEFAULT 0,
+                time_played REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (lobby, name)
+            )
+        """)
+        self.connection.commit()
+
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+
+    def load(self, lobby):
+        """Load a lobby's player stats, with writes that are still pending laid over the database"""
+        # Holding db_lock means no flush is half done, so pending and committed rows don't overlap
+        with self.db_lock:
+            rows = self.connection.execute(
+                f"SELECT name, {", ".join(STATS_FIELDS)} FROM player_stats WHERE lobby = ?",
+                (lobby,)
+            ).fetchall()
+            with self.pending_lock:
+                reset = lobby in self.pending_resets
+                pending = {name: dict(row) for (row_lobby, name), row in self.pending_rows.items() if row_lobby == lobby}
+
+        stats = {} if reset else {row[0]: dict(zip(STATS_FIELDS, row[1:])) for row in rows}
+        stats.update(pending)
+        return stats
+
+
+    def save(self, lobby, stats, players=None):
+        """Queue the given players' stats (or the whole lobby) for the next flush"""
+        names = stats.keys() if players is None else players
+        with self.pending_lock:
+            for name in names:
+                if name in stats:
+                    self.pending_rows[(lobby, name)] = dict(stats[name])
+
+
+    def reset(self, lobby):
+        """Queue deletion of a lobby's stats"""
+        with self.pending_lock:
+            for key in [key for key in self.pending_rows if key[0] == lobby]:
+                del self.pending_rows[key]
+            self.pending_resets.add(lobby)
+
+
+    def flush(self):
+        """Commit everything pending in a single transaction"""
+        # Holding db_lock across the swap keeps concurrent flushes in order
+        with self.db_lock:
+            with self.pending_lock:
+                rows = self.pending_rows
+                resets = self.pending_resets
+                self.pending_rows = {}
+                self.pending_resets = set()
+
+            if not rows and not resets:
+                return
+
+            try:
+                with self.connection:
+                    # Resets were queued before any row still pending for that lobby
+                    self.connection.executemany(
+                        "DELETE FROM player_stats WHERE lobby = ?",
+                        [(lobby,) for lobby in resets]
+                    )
+                    self.connection.executemany(
+                        f"""INSERT OR REPLACE INTO player_stats (lobby, name, {", ".join(STATS_FIELDS)})
+                            VALUES (?, ?, {", ".join("?" for _ in STATS_FIELDS)})""",
+                        [
+                            (lobby, name, *(row.get(field, 0) for field in STATS_FIELDS))
+                            for (lobby, name), row in rows.items()
+                        ]
+                    )
+            except Exception as e:
+                print(f"Failed to write stats: {e}")
+
+
+    def close(self):
+        """Stop the writer and commit anything left"""
+        self.stop_event.set()
+        self.writer.join()
+        self.flush()
+        with self.db_lock:
+            self.connection.close()
+
+
+    def _write_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,97 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+
+from ttl_cache import TTLCache
+
+
+SUMMARY_WORKERS = 2
+SUMMARY_CACHE_SIZE = 1000
+SUMMARY_CACHE_TTL = 6 * 60 * 60  # Seconds before a summary is fetched again
+
+
+def default_mediawiki():
+    # Imported on first use, the client shouldn't load it before its window is up
+    from mediawikiapi import MediaWikiAPI
+    return MediaWikiAPI()
+
+
+class SummaryCache:
+    """Fetches article summaries in the background and keeps them
+
+    Like TitleResolver, concurrent requests for one article share a single
+    lookup. Summaries that arrive from elsewhere (the server sends one with
+    each game) can be stored directly, and expect() lets callers wait for
+    one that is on its way instead of fetching it again.
+    """
+    def __init__(self, max_workers=SUMMARY_WORKERS, cache_size=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL,
+                 mediawiki_factory=default_mediawiki):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary")
+        self.cache = TTLCache(cache_size, ttl)
+        self.mediawiki_factory = mediawiki_factory
+        self.local = threading.local()  # One MediaWiki session per worker thread
+        self.in_flight = {}  # {title: Future}
+        self.expected = {}  # {title: Future} resolved by store() rather than a fetch
+        self.lock = threading.RLock()  # Done callbacks can run inside submit()
+
+
+    def submit(self, title):
+        """Start fetching a summary, returns a Future of its text (None if unavailable)"""
+        if title in self.cache:
+            future = Future()
+            future.set_result(self.cache.get(title))
+            return future
+
+        with self.lock:
+            future = self.in_flight.get(title)
+            if future is None:
+                future = self.executor.submit(self._fetch, title)
+                self.in_flight[title] = future
+                future.add_done_callback(lambda f, t=title: self._finished(t, f))
+        return future
+
+
+    def expect(self, title):
+        """Mark a summary as on its way, submit() waits for store() instead of fetching it"""
+        with self.lock:
+            if title in self.cache or title in self.in_flight:
+                return
+            future = Future()
+            self.in_flight[title] = future
+            self.expected[title] = future
+            future.add_done_callback(lambda f, t=title: self._finished(t, f))
+
+
+    def store(self, title, summary):
+        """Keep a summary fetched elsewhere, None means it is unavailable"""
+        if summary is not None:
+            self.cache.set(title, summary)
+        with self.lock:
+            future = self.expected.pop(title, None)
+        if future is not None:
+            future.set_result(summary)
+
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def mediawiki(self):
+        if not hasattr(self.local, "mediawiki"):
+            self.local.mediawiki = self.mediawiki_factory()
+        return self.local.mediawiki
+
+
+    def _fetch(self, title):
+        try:
+            summary = self.mediawiki().summary(title)
+        except Exception as e:
+            print(f"Failed to fetch summary of {title}: {e}")
+            return None
+        self.cache.set(title, summary)
+        return summary
+
+
+    def _finished(self, title, future):
+        with self.lock:
+            if self.in_flight.get(title) is future:
+                del self.in_flight[title]
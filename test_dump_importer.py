@@ -0,0 +1,80 @@
+"""Tests for dump_importer.py on the dump in fixtures/tiny_wiki
+
+Run with: python -m unittest test_dump_importer (or python -m pytest)
+"""
+from contextlib import redirect_stdout
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from dump_importer import DumpImporter
+from link_graph import LinkGraph
+from title_dictionary import TitleDictionary
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "tiny_wiki")
+
+ARTICLES = 16
+REDIRECTS = 6
+LINKS = 51
+
+
+class DumpImporterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.output_dir = tempfile.mkdtemp()
+        with redirect_stdout(io.StringIO()):
+            DumpImporter(FIXTURE_DIR, cls.output_dir, workers=2).run()
+
+        cls.graph = LinkGraph(os.path.join(cls.output_dir, "link_graph.bin"))
+        cls.dictionary = TitleDictionary(os.path.join(cls.output_dir, "title_dictionary.bin"))
+        with open(os.path.join(cls.output_dir, "titles.txt"), "r", encoding="utf-8") as f:
+            cls.titles = f.read().splitlines()
+        with open(os.path.join(cls.output_dir, "redirects.tsv"), "r", encoding="utf-8") as f:
+            cls.redirects = dict(line.split("\t") for line in f.read().splitlines())
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.graph.close()
+        cls.dictionary.close()
+        shutil.rmtree(cls.output_dir)
+
+
+    def test_counts(self):
+        self.assertEqual(self.graph.node_count, ARTICLES)
+        self.assertEqual(len(self.titles), ARTICLES)
+        self.assertEqual(len(self.redirects), REDIRECTS)
+        self.assertEqual(self.graph.edge_count, LINKS)
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "work")))
+
+
+    def test_links_are_sorted_unique_and_mirrored(self):
+        incoming = set()
+        for node in range(self.graph.node_count):
+            links = list(self.graph.out_links(node))
+            self.assertEqual(links, sorted(set(links)))
+            self.assertNotIn(node, links)
+            incoming.update((target, node) for target in links)
+        mirrored = {(node, source) for node in range(self.graph.node_count) for source in self.graph.in_links(node)}
+        self.assertEqual(incoming, mirrored)
+
+        cat = self.titles.index("Cat")
+        dog = self.titles.index("Dog")
+        self.assertTrue(self.graph.has_link(cat, dog))
+        self.assertTrue(self.graph.has_link(dog, cat))
+
+
+    def test_redirects_and_dictionary(self):
+        cat = self.titles.index("Cat")
+        self.assertEqual(self.redirects["Felis catus"], str(cat))
+        self.assertEqual(self.dictionary.node("Felis catus"), cat)
+        self.assertEqual(self.dictionary.node("Cat"), cat)
+        self.assertEqual(self.dictionary.title(cat), "Cat")
+        self.assertIsNone(self.dictionary.node("Not an article"))
+
+
+if __name__ == "__main__":
+    unittest.main()
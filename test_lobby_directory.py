@@ -0,0 +1,128 @@
+"""Tests for lobby_directory.py, both backends
+
+Run with: python -m unittest test_lobby_directory (or python -m pytest)
+"""
+import os
+import tempfile
+import threading
+import unittest
+
+from lobby_directory import (MemoryLobbyDirectory, SqliteLobbyDirectory, open_lobby_directory,
+                             parse_node_address)
+
+
+NODE_A = "10.0.0.1:5555"
+NODE_B = "10.0.0.2:5555"
+
+
+class LobbyDirectoryChecks:
+    """Behaviour every backend shares, mixed into a TestCase that sets self.directory"""
+    def test_reserve_and_lookup(self):
+        self.assertIsNone(self.directory.owner("ABCD"))
+        self.assertTrue(self.directory.reserve("ABCD", NODE_A))
+        self.assertEqual(self.directory.owner("ABCD"), NODE_A)
+
+
+    def test_taken_code_cannot_be_claimed_again(self):
+        self.assertTrue(self.directory.reserve("ABCD", NODE_A))
+        self.assertFalse(self.directory.reserve("ABCD", NODE_B))
+        self.assertFalse(self.directory.reserve("ABCD", NODE_A))
+        self.assertEqual(self.directory.owner("ABCD"), NODE_A)
+
+
+    def test_only_the_owner_releases(self):
+        self.directory.reserve("ABCD", NODE_A)
+        self.directory.release("ABCD", NODE_B)
+        self.assertEqual(self.directory.owner("ABCD"), NODE_A)
+
+        self.directory.release("ABCD", NODE_A)
+        self.assertIsNone(self.directory.owner("ABCD"))
+        self.assertTrue(self.directory.reserve("ABCD", NODE_B))
+
+
+    def test_stale_codes_of_a_restarted_node_are_dropped(self):
+        self.directory.reserve("AAAA", NODE_A)
+        self.directory.reserve("BBBB", NODE_A)
+        self.directory.reserve("CCCC", NODE_B)
+
+        self.directory.release_node(NODE_A)
+        self.assertIsNone(self.directory.owner("AAAA"))
+        self.assertIsNone(self.directory.owner("BBBB"))
+        self.assertEqual(self.directory.owner("CCCC"), NODE_B)
+
+
+    def test_concurrent_reserves_have_one_winner(self):
+        results = []
+        barrier = threading.Barrier(8)
+        def reserve(node):
+            barrier.wait()
+            results.append(self.directory.reserve("RACE", node))
+
+        threads = [threading.Thread(target=reserve, args=(f"10.0.0.{i}:5555",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+
+class MemoryLobbyDirectoryTest(LobbyDirectoryChecks, unittest.TestCase):
+    def setUp(self):
+        self.directory = MemoryLobbyDirectory()
+
+
+class SqliteLobbyDirectoryTest(LobbyDirectoryChecks, unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "lobbies.db")
+        self.directory = SqliteLobbyDirectory(self.path)
+
+
+    def tearDown(self):
+        self.directory.close()
+        self.temp_dir.cleanup()
+
+
+    def test_owners_survive_reopening(self):
+        self.directory.reserve("ABCD", NODE_A)
+        self.directory.close()
+
+        self.directory = SqliteLobbyDirectory(self.path)
+        self.assertEqual(self.directory.owner("ABCD"), NODE_A)
+        self.assertFalse(self.directory.reserve("ABCD", NODE_B))
+
+
+    def test_nodes_sharing_a_file_see_each_other(self):
+        other = SqliteLobbyDirectory(self.path)
+        try:
+            self.assertTrue(self.directory.reserve("ABCD", NODE_A))
+            self.assertEqual(other.owner("ABCD"), NODE_A)
+            self.assertFalse(other.reserve("ABCD", NODE_B))
+
+            other.release_node(NODE_A)
+            self.assertIsNone(self.directory.owner("ABCD"))
+        finally:
+            other.close()
+
+
+class OpenLobbyDirectoryTest(unittest.TestCase):
+    def test_specs(self):
+        self.assertIsInstance(open_lobby_directory(None), MemoryLobbyDirectory)
+        self.assertIsInstance(open_lobby_directory("memory"), MemoryLobbyDirectory)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            directory = open_lobby_directory("sqlite:" + os.path.join(temp_dir, "lobbies.db"))
+            self.assertIsInstance(directory, SqliteLobbyDirectory)
+            directory.close()
+        with self.assertRaises(ValueError):
+            open_lobby_directory("redis://localhost")
+
+
+    def test_parse_node_address(self):
+        self.assertEqual(parse_node_address("10.0.0.1:5555"), ("10.0.0.1", 5555))
+        self.assertEqual(parse_node_address("[::1]:5555"), ("[::1]", 5555))
+        with self.assertRaises(ValueError):
+            parse_node_address("10.0.0.1")
+
+
+if __name__ == "__main__":
+    unittest.main()
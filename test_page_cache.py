@@ -0,0 +1,199 @@
+"""Tests for page_cache.py against a local stand-in for Wikipedia
+
+Run with: python -m unittest test_page_cache (or python -m pytest)
+"""
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from page_cache import PageCache, PageCacheProxy, is_article_path
+
+
+STYLE_ETAG = '"style-v1"'
+
+
+def article_html(links):
+    anchors = "".join(f'<a href="/wiki/{link}">{link}</a>' for link in links)
+    return f'<html><body><div id="mw-content-text">{anchors}</div></body></html>'.encode()
+
+
+ARTICLES = {
+    "/wiki/Start": article_html(["Alpha", "Beta", "Special:Random", "Start"]),
+    "/wiki/Alpha": article_html(["Beta"]),
+    "/wiki/Beta": article_html(["Alpha"])
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves a few articles, a stylesheet and Special:Random like Wikipedia does"""
+    protocol_version = "HTTP/1.1"
+    requests = Counter()  # {path: times requested}
+    connections = set()  # Client ports seen, one per upstream connection
+
+
+    def do_GET(self):
+        type(self).requests[self.path] += 1
+        type(self).connections.add(self.client_address[1])
+
+        if self.path in ARTICLES:
+            self.reply(200, ARTICLES[self.path], {"Content-Type": "text/html; charset=UTF-8"})
+        elif self.path == "/w/load.php?modules=site.styles":
+            if self.headers.get("If-None-Match") == STYLE_ETAG:
+                self.reply(304, b"", {"ETag": STYLE_ETAG})
+            else:
+                self.reply(200, b"body{}", {
+                    "Content-Type": "text/css",
+                    "Cache-Control": "public, max-age=300",
+                    "ETag": STYLE_ETAG
+                })
+        elif self.path == "/wiki/Special:Random":
+            host, port = self.server.server_address[:2]
+            self.reply(302, b"", {"Location": f"http://{host}:{port}/wiki/Alpha"})
+        else:
+            self.reply(404, b"Not found", {"Content-Type": "text/plain"})
+
+
+    def do_POST(self):
+        type(self).requests[self.path] += 1
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.reply(200, b"posted " + body, {"Content-Type": "application/json"})
+
+
+    def do_HEAD(self):
+        type(self).requests[self.path] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", "1234")
+        self.end_headers()
+
+
+    def reply(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class PageCacheTest(unittest.TestCase):
+    def test_memory_overflow_goes_to_disk_and_comes_back(self):
+        with tempfile.TemporaryDirectory() as disk_dir:
+            cache = PageCache(memory_limit=10, disk_dir=disk_dir)
+            cache.put("/wiki/A", "text/html", b"a" * 8)
+            cache.put("/wiki/B", "text/html", b"b" * 8)
+
+            self.assertEqual(cache.stats()["disk_pages"], 1)
+            self.assertEqual(cache.get("/wiki/A"), ("text/html", b"a" * 8))
+            self.assertIsNone(cache.get("/wiki/C"))
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["disk_hits"], stats["misses"]), (0, 1, 1))
+
+
+    def test_article_paths(self):
+        self.assertTrue(is_article_path("/wiki/Physics"))
+        self.assertFalse(is_article_path("/wiki/Special:Random"))
+        self.assertFalse(is_article_path("/wiki/Special%3ARandom"))
+        self.assertFalse(is_article_path("/w/index.php?title=Physics"))
+
+
+class PageCacheProxyTest(unittest.TestCase):
+    def setUp(self):
+        StandInHandler.requests = Counter()
+        StandInHandler.connections = set()
+        self.upstream = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.upstream.daemon_threads = True
+        threading.Thread(target=self.upstream.serve_forever, daemon=True).start()
+        host, port = self.upstream.server_address[:2]
+
+        self.proxy = PageCacheProxy(f"http://{host}:{port}", PageCache()).start()
+        self.opener = urllib.request.build_opener(NoRedirect)
+
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.upstream.shutdown()
+        self.upstream.server_close()
+
+
+    def get(self, path, headers=None, method="GET", data=None):
+        request = urllib.request.Request(self.proxy.base_url + path, data, headers or {}, method=method)
+        try:
+            with self.opener.open(request, timeout=5) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+    def wait_for_prefetch(self, *paths):
+        deadline = time.monotonic() + 5
+        while not all(path in self.proxy.cache for path in paths):
+            self.assertLess(time.monotonic(), deadline, "prefetch did not finish")
+            time.sleep(0.01)
+
+
+    def test_linked_articles_are_prefetched_and_served_from_cache(self):
+        status, _, body = self.get("/wiki/Start")
+        self.assertEqual((status, body), (200, ARTICLES["/wiki/Start"]))
+        self.wait_for_prefetch("/wiki/Alpha", "/wiki/Beta")
+
+        status, _, body = self.get("/wiki/Alpha")
+        self.assertEqual((status, body), (200, ARTICLES["/wiki/Alpha"]))
+        self.assertEqual(StandInHandler.requests["/wiki/Alpha"], 1)
+        self.assertEqual(StandInHandler.requests["/wiki/Special:Random"], 0)
+        self.assertGreaterEqual(self.proxy.cache.stats()["hits"], 1)
+
+
+    def test_special_pages_are_not_cached(self):
+        for _ in range(2):
+            status, headers, _ = self.get("/wiki/Special:Random")
+            self.assertEqual(status, 302)
+            self.assertEqual(headers["Location"], "/wiki/Alpha")
+        self.assertEqual(StandInHandler.requests["/wiki/Special:Random"], 2)
+        self.assertNotIn("/wiki/Special:Random", self.proxy.cache)
+
+
+    def test_passthrough_keeps_cache_headers(self):
+        status, headers, body = self.get("/w/load.php?modules=site.styles")
+        self.assertEqual((status, body), (200, b"body{}"))
+        self.assertEqual(headers["Cache-Control"], "public, max-age=300")
+        self.assertEqual(headers["ETag"], STYLE_ETAG)
+
+        status, _, body = self.get("/w/load.php?modules=site.styles", {"If-None-Match": STYLE_ETAG})
+        self.assertEqual((status, body), (304, b""))
+
+
+    def test_other_methods_are_passed_through(self):
+        status, _, body = self.get("/w/api.php", {"Content-Type": "application/json"}, "POST", b"{}")
+        self.assertEqual((status, body), (200, b"posted {}"))
+
+        status, headers, body = self.get("/wiki/Start", method="HEAD")
+        self.assertEqual((status, body), (200, b""))
+        self.assertEqual(headers["Content-Length"], "1234")
+        self.assertNotIn("/wiki/Start", self.proxy.cache)
+
+
+    def test_upstream_connections_are_reused(self):
+        for _ in range(5):
+            self.get("/w/load.php?modules=site.styles")
+        self.assertEqual(len(StandInHandler.connections), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests that the client's join screen stays within JOIN_SCREEN_BUDGET
+
+Each check runs in a fresh interpreter, so nothing imported by other
+tests hides a slow import.
+
+Run with: python -m unittest test_startup (or python -m pytest)
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from startup_profile import JOIN_SCREEN_BUDGET
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFERRED_MODULES = ("client_main", "title_dictionary", "mediawikiapi", "selenium", "numpy", "pygame")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import client_network
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))
+"""
+
+# Runs the real start() and quits once warm_up has printed the profile report
+JOIN_SCREEN_SCRIPT = """
+import sys
+sys.argv.append("--profile-startup")
+import client_network
+
+client_network.WikiRaceClient.warm_up_network = lambda self: None
+client = client_network.WikiRaceClient()
+warm_up = client.warm_up
+def warm_up_and_quit():
+    warm_up()
+    client.root.quit()
+client.warm_up = warm_up_and_quit
+client.start()
+"""
+
+
+def run_client_script(script):
+    return subprocess.run([sys.executable, "-c", script], cwd=PACKAGE_DIR, capture_output=True, text=True,
+                          timeout=60)
+
+
+@unittest.skipIf(importlib.util.find_spec("customtkinter") is None, "customtkinter is not installed")
+class StartupTest(unittest.TestCase):
+    def test_client_import_defers_game_modules(self):
+        result = run_client_script(IMPORT_SCRIPT)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout.splitlines()[-1])
+
+        self.assertEqual(report["loaded"], [])
+        self.assertLess(report["seconds"], JOIN_SCREEN_BUDGET)
+
+
+    @unittest.skipIf(sys.platform.startswith("linux") and not os.environ.get("DISPLAY"), "no display")
+    def test_join_screen_within_budget(self):
+        result = run_client_script(JOIN_SCREEN_SCRIPT)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("Join screen after", result.stdout)
+        self.assertNotIn("OVER BUDGET", result.stdout, result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class TimerHandle:
+    """A scheduled callback, cancelling it is O(1)"""
+    __slots__ = ("deadline", "interval", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+    def cancel(self):
+        # The heap entry is skipped when it comes due instead of being searched for
+        self.cancelled = True
+        self.callback = None
+        self.args = None
+
+
+class TimerScheduler:
+    """Runs every timed server callback from one thread using a heap of deadlines"""
+    def __init__(self):
+        self.heap = []  # [(deadline, sequence, TimerHandle)]
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+
+    def start(self):
+        """Start the scheduler thread"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        """Stop the scheduler thread, pending callbacks are dropped"""
+        with self.condition:
+            self.running = False
+            self.heap.clear()
+            self.condition.notify()
+
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) once after delay seconds"""
+        return self._push(TimerHandle(time.monotonic() + delay, None, callback, args))
+
+
+    def call_every(self, interval, callback, *args):
+        """Run callback(*args) every interval seconds until cancelled"""
+        return self._push(TimerHandle(time.monotonic() + interval, interval, callback, args))
+
+
+    def _push(self, handle):
+        with self.condition:
+            heapq.heappush(self.heap, (handle.deadline, next(self.sequence), handle))
+            # Only wake the thread if this timer is now the earliest one
+            if self.heap[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    # Discard cancelled timers as they reach the top of the heap
+                    while self.heap and self.heap[0][2].cancelled:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.condition.wait(delay)
+
+                if not self.running:
+                    return
+
+                _, _, handle = heapq.heappop(self.heap)
+                callback = handle.callback
+                args = handle.args
+                if handle.interval is not None:
+                    handle.deadline += handle.interval
+                    heapq.heappush(self.heap, (handle.deadline, next(self.sequence), handle))
+
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Scheduled callback failed: {e}")
@@ -0,0 +1,298 @@
+"""Build a compact title dictionary for a link graph
+
+Usage: python title_dictionary.py GRAPH_DIR
+
+Reads the titles.txt and redirects.tsv written by dump_importer.py and
+writes GRAPH_DIR/title_dictionary.bin. The same file can be handed to
+clients, which only need this module to read it.
+"""
+from array import array
+import argparse
+import hashlib
+import itertools
+import mmap
+import os
+import struct
+import sys
+
+from link_graph import normalize_title
+
+
+# File layout, all little-endian:
+#   header        magic, format version, key count, bucket count, node count, reserved
+#   title_offsets uint64[node_count + 1]  node i is titles[title_offsets[i]:title_offsets[i + 1]]
+#   pilots        uint32[bucket_count]    displacement for each hash bucket, or SINGLETON | slot
+#   slot_nodes    int32[key_count]        node each key resolves to, redirects point at their target
+#                                         every title has an exact key and a case-folded fallback key
+#   fingerprints  uint32[key_count]       rejects titles that are not in the dictionary
+#   titles        utf-8 canonical titles of every node, back to back
+MAGIC = b"WRTD"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sIIIII")
+HASH = struct.Struct("<QQ")
+
+BUCKET_LOAD = 2  # Keys per hash bucket, lower builds faster but needs more pilots
+SINGLETON = 0x80000000  # Pilot flag, the rest of the pilot is the bucket's slot
+FOLDED_PREFIX = b"\x00"  # Keeps folded keys apart from exact ones, titles never contain NUL
+
+
+def fold_title(title):
+    """Title with case and underscores ignored"""
+    return normalize_title(title).casefold()
+
+
+def exact_key(title):
+    return normalize_title(title).encode("utf-8")
+
+
+def folded_key(title):
+    return FOLDED_PREFIX + fold_title(title).encode("utf-8")
+
+
+def key_hash(key):
+    return HASH.unpack(hashlib.blake2b(key, digest_size=16).digest())
+
+
+class TitleDictionary:
+    """Minimal perfect hash from any article or redirect title to a node, memory-mapped
+
+    A lookup is one hash of the title and three array reads, and nothing
+    is loaded into Python objects up front, so opening the file is instant
+    however many titles it holds. Titles are matched exactly first, so
+    articles that differ only by case stay apart, and by their case-folded
+    form only when there is no exact match.
+    """
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Title dictionaries can only be mapped on little-endian machines")
+
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.key_count, self.bucket_count, self.node_count, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} title dictionary")
+
+        view = memoryview(self.map)
+        position = HEADER.size
+        sections = []
+        for type_code, count in (("Q", self.node_count + 1), ("I", self.bucket_count),
+                                 ("i", self.key_count), ("I", self.key_count)):
+            size = struct.calcsize(type_code) * count
+            sections.append(view[position:position + size].cast(type_code))
+            position += size
+        self.title_offsets, self.pilots, self.slot_nodes, self.fingerprints = sections
+        self.titles = view[position:]
+        view.release()
+
+
+    def __len__(self):
+        return self.node_count
+
+
+    def node(self, title):
+        """Node of an article or redirect title, or None if it is not in the dictionary"""
+        if not self.key_count:
+            return None
+        node = self.lookup(exact_key(title))
+        return node if node is not None else self.lookup(folded_key(title))
+
+
+    def lookup(self, key):
+        a, b = key_hash(key)
+        slot = slot_for(self.pilots[a % self.bucket_count], b, self.key_count)
+        if self.fingerprints[slot] != a >> 32:
+            return None
+        return self.slot_nodes[slot]
+
+
+    def title(self, node):
+        """Canonical title of a node"""
+        return str(self.titles[self.title_offsets[node]:self.title_offsets[node + 1]], "utf-8")
+
+
+    def same_article(self, first, second):
+        """Whether two titles lead to the same article, following redirects"""
+        node = self.node(first)
+        return node is not None and node == self.node(second)
+
+
+    def close(self):
+        for name in ("title_offsets", "pilots", "slot_nodes", "fingerprints", "titles"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+def slot_for(pilot, b, key_count):
+    if pilot & SINGLETON:
+        return pilot & ~SINGLETON
+    # Every pilot gives every key an independent-looking slot
+    mixed = ((b ^ (pilot * 0x9E3779B97F4A7C15)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    return (mixed ^ (mixed >> 31)) % key_count
+
+
+def read_titles(directory):
+    """Every article then every redirect title, with the node each resolves to"""
+    titles_path = os.path.join(directory, "titles.txt")
+    with open(titles_path, "r", encoding="utf-8") as f:
+        for node, line in enumerate(f):
+            yield line.rstrip("\n"), node
+
+    redirects_path = os.path.join(directory, "redirects.tsv")
+    if os.path.exists(redirects_path):
+        with open(redirects_path, "r", encoding="utf-8") as f:
+            for line in f:
+                title, node = line.rstrip("\n").split("\t")
+                yield title, int(node)
+
+
+def read_keys(directory):
+    """Exact keys of every title then folded keys, with the node each resolves to"""
+    for title, node in read_titles(directory):
+        yield exact_key(title), node
+    for title, node in read_titles(directory):
+        yield folded_key(title), node
+
+
+def drop_repeated_keys(hashes_a, hashes_b, nodes):
+    """Keep only the first of keys with the same hash, in their original order
+
+    Titles that fold together share a fallback key, and the first one seen
+    keeps it so articles win over redirects.
+    """
+    # Only building needs numpy, clients that read the dictionary do not
+    import numpy as np
+
+    a = np.asarray(memoryview(hashes_a))
+    # A stable sort puts the first of equal hashes first, so comparing neighbours finds the repeats
+    order = np.argsort(a, kind="stable")
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = a[order[1:]] != a[order[:-1]]
+    keep = np.sort(order[first])
+    del order, first
+
+    kept = []
+    for source in (hashes_a, hashes_b, nodes):
+        values = array(source.typecode)
+        values.frombytes(np.asarray(memoryview(source))[keep].tobytes())
+        kept.append(values)
+    return kept
+
+
+def build_title_dictionary(directory, bucket_load=BUCKET_LOAD):
+    """Write title_dictionary.bin for the titles and redirects in a graph directory"""
+    hashes_a = array("Q")
+    hashes_b = array("Q")
+    nodes = array("i")
+    for key, node in read_keys(directory):
+        a, b = key_hash(key)
+        hashes_a.append(a)
+        hashes_b.append(b)
+        nodes.append(node)
+    hashes_a, hashes_b, nodes = drop_repeated_keys(hashes_a, hashes_b, nodes)
+
+    key_count = len(nodes)
+    if key_count >= SINGLETON:
+        raise ValueError(f"Too many titles for one dictionary: {key_count}")
+    bucket_count = max(1, key_count // bucket_load)
+
+    # Group keys by bucket with a counting sort, bucket k owns members[starts[k]:starts[k + 1]]
+    bucket_of = array("I", (a % bucket_count for a in hashes_a))
+    starts = array("I", bytes(4 * (bucket_count + 1)))
+    for bucket in bucket_of:
+        starts[bucket + 1] += 1
+    for bucket in range(bucket_count):
+        starts[bucket + 1] += starts[bucket]
+    members = array("I", bytes(4 * key_count))
+    position = array("I", starts[:-1])
+    for i, bucket in enumerate(bucket_of):
+        members[position[bucket]] = i
+        position[bucket] += 1
+    del bucket_of, position
+
+    pilots = array("I", bytes(4 * bucket_count))
+    slot_nodes = array("i", bytes(4 * key_count))
+    fingerprints = array("I", bytes(4 * key_count))
+    taken = bytearray(key_count)
+
+    def place(bucket, pilot, slots):
+        pilots[bucket] = pilot
+        for i, slot in zip(members[starts[bucket]:starts[bucket + 1]], slots):
+            taken[slot] = 1
+            slot_nodes[slot] = nodes[i]
+            fingerprints[slot] = hashes_a[i] >> 32
+
+    buckets_by_size = []
+    for bucket in range(bucket_count):
+        size = starts[bucket + 1] - starts[bucket]
+        while len(buckets_by_size) <= size:
+            buckets_by_size.append(array("I"))
+        buckets_by_size[size].append(bucket)
+
+    # Biggest buckets first while the table is still empty. Single-key buckets
+    # go last, straight into whatever slots are left, so the table ends up full.
+    for size in range(len(buckets_by_size) - 1, 1, -1):
+        for bucket in buckets_by_size[size]:
+            keys = members[starts[bucket]:starts[bucket + 1]]
+            for pilot in itertools.count():
+                slots = [slot_for(pilot, hashes_b[i], key_count) for i in keys]
+                if len(set(slots)) == size and not any(taken[slot] for slot in slots):
+                    break
+            place(bucket, pilot, slots)
+
+    if len(buckets_by_size) > 1:
+        free_slots = (slot for slot in range(key_count) if not taken[slot])
+        for bucket in buckets_by_size[1]:
+            slot = next(free_slots)
+            place(bucket, SINGLETON | slot, [slot])
+
+    write_title_dictionary(os.path.join(directory, "title_dictionary.bin"), directory,
+                           bucket_count, pilots, slot_nodes, fingerprints)
+    return key_count
+
+
+def write_title_dictionary(path, directory, bucket_count, pilots, slot_nodes, fingerprints):
+    if sys.byteorder != "little":
+        raise RuntimeError("Title dictionaries can only be written on little-endian machines")
+
+    title_offsets = array("Q", [0])
+    with open(os.path.join(directory, "titles.txt"), "rb") as f:
+        for line in f:
+            title_offsets.append(title_offsets[-1] + len(line) - 1)
+    node_count = len(title_offsets) - 1
+
+    with open(path + ".tmp", "wb") as out:
+        out.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(slot_nodes), bucket_count, node_count, 0))
+        for section in (title_offsets, pilots, slot_nodes, fingerprints):
+            section.tofile(out)
+        with open(os.path.join(directory, "titles.txt"), "rb") as f:
+            for line in f:
+                out.write(line[:-1])
+    os.replace(path + ".tmp", path)
+
+
+def open_title_dictionary(path):
+    """Open a title dictionary if the file exists, otherwise None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return TitleDictionary(path)
+    except Exception as e:
+        print(f"Failed to open title dictionary: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a title dictionary for a link graph")
+    parser.add_argument("graph_dir", help="Directory written by dump_importer.py")
+    args = parser.parse_args()
+
+    key_count = build_title_dictionary(args.graph_dir)
+    print(f"Wrote {key_count} titles to {os.path.join(args.graph_dir, "title_dictionary.bin")}")
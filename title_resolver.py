@@ -0,0 +1,77 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from mediawikiapi import MediaWikiAPI
+import threading
+
+from ttl_cache import TTLCache
+
+
+RESOLVER_WORKERS = 8
+TITLE_CACHE_SIZE = 10000
+TITLE_CACHE_TTL = 6 * 60 * 60  # Seconds before a search is repeated
+
+
+class TitleResolver:
+    """Resolves requested article names to canonical titles on a thread pool
+
+    Results are cached by normalized query, and concurrent requests for
+    the same query share one lookup, so a popular article only costs one
+    MediaWiki search until its cache entry expires.
+    """
+    def __init__(self, max_workers=RESOLVER_WORKERS, cache_size=TITLE_CACHE_SIZE, ttl=TITLE_CACHE_TTL,
+                 mediawiki_factory=MediaWikiAPI):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="title-resolver")
+        self.cache = TTLCache(cache_size, ttl)
+        self.mediawiki_factory = mediawiki_factory
+        self.local = threading.local()  # One MediaWiki session per worker thread
+        self.in_flight = {}  # {query key: Future}
+        self.lock = threading.RLock()  # Done callbacks can run inside submit()
+
+
+    @staticmethod
+    def query_key(query):
+        return " ".join(query.split()).casefold()
+
+
+    def submit(self, query):
+        """Start resolving a query, returns a Future of its title (None if nothing matched)"""
+        key = self.query_key(query)
+        if key in self.cache:
+            future = Future()
+            future.set_result(self.cache.get(key))
+            return future
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.executor.submit(self._resolve, key, query)
+                self.in_flight[key] = future
+                future.add_done_callback(lambda f, k=key: self._finished(k, f))
+        return future
+
+
+    def resolve(self, query, timeout=None):
+        """Resolve a query, blocking until its title is known"""
+        return self.submit(query).result(timeout)
+
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def mediawiki(self):
+        if not hasattr(self.local, "mediawiki"):
+            self.local.mediawiki = self.mediawiki_factory()
+        return self.local.mediawiki
+
+
+    def _resolve(self, key, query):
+        search_results = self.mediawiki().search(query)
+        title = search_results[0] if len(search_results) > 0 else None
+        self.cache.set(key, title)
+        return title
+
+
+    def _finished(self, key, future):
+        with self.lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
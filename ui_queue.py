@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import itertools
+import threading
+
+
+FRAME_MS = 16  # Work posted within one frame is applied in a single pass
+
+
+class UIQueue:
+    """Hands work from other threads to the Tk loop in batches
+
+    Callbacks are queued under a lock and the Tk loop drains everything
+    pending in one scheduled pass, so a burst of messages costs a single
+    after() call. Callbacks posted with a key replace the one still pending
+    under the same key, and a string key also drops pending entries keyed
+    (key, ...), so only the latest state is applied.
+    """
+    def __init__(self, root, frame_ms=FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.pending = OrderedDict()  # {key: (callback, args)}
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.scheduled = False
+
+
+    def post(self, callback, *args, key=None):
+        """Run callback(*args) on the Tk loop, safe to call from any thread"""
+        with self.lock:
+            if key is None:
+                key = (None, next(self.sequence))
+            else:
+                self.pending.pop(key, None)
+                if isinstance(key, str):
+                    for stale in [k for k in self.pending if isinstance(k, tuple) and k[0] == key]:
+                        del self.pending[stale]
+            self.pending[key] = (callback, args)
+            if self.scheduled:
+                return
+            self.scheduled = True
+
+        try:
+            self.root.after(self.frame_ms, self.drain)
+        except Exception as e:
+            # The window is gone, nothing will run these
+            print(f"UI update dropped: {e}")
+            with self.lock:
+                self.pending.clear()
+                self.scheduled = False
+
+
+    def drain(self):
+        """Apply everything posted so far, runs on the Tk loop"""
+        with self.lock:
+            batch = list(self.pending.values())
+            self.pending.clear()
+            self.scheduled = False
+
+        for callback, args in batch:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"UI update failed: {e}")
+
+
+def configure_text(widget, text):
+    """Set a widget's text, skipping the redraw when it is already showing it"""
+    if widget is None or not widget.winfo_exists():
+        return False
+    if widget.cget("text") == text:
+        return False
+    widget.configure(text=text)
+    return True